@@ -1,180 +1,349 @@
 import os
-import json
+import time
 import asyncio
+import contextlib
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from recommendation_rules import ESCALATION_REASONS, load_rule_engine
+from llm_stub import StubGenAIClient
+from prompt_builder import SYSTEM_INSTRUCTION, PromptBuilder
+from recommendation_schema import IncrementalJSONScanner, RecommendationResponse, parse_item, parse_response
 
 # Load environment variables
 load_dotenv()
 
 class AIRecommendationService:
-    def __init__(self):
-        self.gemini_api_key = os.getenv('GEMINI_API_KEY')
-        if not self.gemini_api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is required")
-        self.client = genai.Client(api_key=self.gemini_api_key)
-            
+    def __init__(self, client=None):
+        # An injected client (or GEMINI_STUB=true) replaces the real Gemini client
+        if client is None and os.getenv('GEMINI_STUB', 'false').lower() in ('1', 'true', 'yes'):
+            client = StubGenAIClient(latency=float(os.getenv('GEMINI_STUB_LATENCY_SECONDS', '0.05')))
+        if client is None:
+            self.gemini_api_key = os.getenv('GEMINI_API_KEY')
+            if not self.gemini_api_key:
+                raise ValueError("GEMINI_API_KEY environment variable is required")
+            client = genai.Client(api_key=self.gemini_api_key)
+        self.client = client
+        self.model = os.getenv('GEMINI_MODEL', 'gemini-2.5-pro')
+
+        # Concurrency limiting so LLM traffic can't starve the rest of the API
+        self.max_concurrency = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+        self.request_timeout = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '30'))
+        self.queue_timeout = float(os.getenv('GEMINI_QUEUE_TIMEOUT_SECONDS', '10'))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._metrics = {
+            "in_flight": 0,
+            "queued": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "queue_timeouts": 0,
+            "total_queue_wait_seconds": 0.0,
+            "max_queue_wait_seconds": 0.0,
+            "total_call_seconds": 0.0,
+            "parsed": 0,
+            "repaired": 0,
+            "invalid_responses": 0,
+        }
+
+        # Rule tier ahead of the LLM (llm | tiered | rules)
+        self.rule_engine = load_rule_engine()
+        self.tier_mode = os.getenv('RECOMMENDATION_TIER_MODE', 'tiered').lower()
+        self._tier_metrics = {
+            "requests": 0,
+            "served_by_rules": 0,
+            "escalated": 0,
+            "escalation_reasons": {reason: 0 for reason in ESCALATION_REASONS},
+        }
+
+        # Prompt size: static instructions go in the system instruction (or a
+        # context cache), the per-patient message is held to a token budget
+        self.prompt_builder = PromptBuilder(token_budget=int(os.getenv('GEMINI_PROMPT_TOKEN_BUDGET', '400')))
+        self.context_cache_enabled = os.getenv('GEMINI_CONTEXT_CACHE', 'false').lower() in ('1', 'true', 'yes')
+        self.context_cache_ttl = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL_SECONDS', '3600'))
+        self._cached_content: Optional[str] = None
+        self._cached_content_expires = 0.0
+        self._cache_lock = asyncio.Lock()
+        self._token_metrics = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "estimated_prompt_tokens": 0,
+            "sections_dropped": 0,
+            "over_budget": 0,
+        }
+
+    async def _generation_config(self) -> types.GenerateContentConfig:
+        """Reference the cached system instruction when context caching is on, else send it inline"""
+        if self.context_cache_enabled:
+            async with self._cache_lock:
+                if self._cached_content is None or time.monotonic() >= self._cached_content_expires:
+                    try:
+                        cache = await self.client.aio.caches.create(
+                            model=self.model,
+                            config=types.CreateCachedContentConfig(
+                                system_instruction=SYSTEM_INSTRUCTION,
+                                ttl=f"{self.context_cache_ttl}s"
+                            )
+                        )
+                        self._cached_content = cache.name
+                        # Refresh a minute early so requests never reference an expired cache
+                        self._cached_content_expires = time.monotonic() + self.context_cache_ttl - 60
+                    except Exception as e:
+                        # e.g. the instruction is below the model's minimum cacheable size
+                        print(f"Context cache unavailable, sending system instruction inline: {str(e)}")
+                        self.context_cache_enabled = False
+                        self._cached_content = None
+            if self._cached_content is not None:
+                return types.GenerateContentConfig(cached_content=self._cached_content, **self._output_config())
+        return types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, **self._output_config())
+
+    @staticmethod
+    def _output_config() -> Dict:
+        """Constrain decoding to JSON matching the recommendations schema"""
+        return {"response_mime_type": "application/json", "response_schema": RecommendationResponse}
+
+    def _record_usage(self, prompt, response) -> Dict:
+        """Token counts for one request, accumulated into the token metrics"""
+        usage_metadata = getattr(response, "usage_metadata", None)
+        usage = {
+            "estimated_prompt_tokens": prompt.estimated_tokens,
+            "prompt_tokens": getattr(usage_metadata, "prompt_token_count", None),
+            "cached_tokens": getattr(usage_metadata, "cached_content_token_count", None),
+            "output_tokens": getattr(usage_metadata, "candidates_token_count", None),
+        }
+        metrics = self._token_metrics
+        metrics["requests"] += 1
+        for field, value in usage.items():
+            metrics[field] += value or 0
+        metrics["sections_dropped"] += len(prompt.dropped_sections)
+        metrics["over_budget"] += prompt.over_budget
+        return usage
+
+    def get_token_metrics(self) -> Dict:
+        """Prompt/output token totals and per-request averages"""
+        metrics = dict(self._token_metrics)
+        requests = metrics["requests"]
+        for field in ("prompt_tokens", "cached_tokens", "output_tokens", "estimated_prompt_tokens"):
+            metrics[f"avg_{field}"] = metrics[field] / requests if requests else 0.0
+        metrics["token_budget"] = self.prompt_builder.token_budget
+        metrics["context_cache"] = self._cached_content is not None
+        return metrics
+
+    @contextlib.asynccontextmanager
+    async def _llm_slot(self):
+        """
+        Hold one of the concurrency slots for the duration of an LLM call,
+        recording queueing and call metrics
+        """
+        metrics = self._metrics
+        metrics["queued"] += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics["queue_timeouts"] += 1
+            raise
+        finally:
+            metrics["queued"] -= 1
+            waited = time.perf_counter() - queued_at
+            metrics["total_queue_wait_seconds"] += waited
+            metrics["max_queue_wait_seconds"] = max(metrics["max_queue_wait_seconds"], waited)
+
+        metrics["in_flight"] += 1
+        started_at = time.perf_counter()
+        try:
+            yield
+            metrics["completed"] += 1
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            raise
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        finally:
+            metrics["in_flight"] -= 1
+            metrics["total_call_seconds"] += time.perf_counter() - started_at
+            self._semaphore.release()
+
+    async def _generate_content(self, contents: str, config: Optional[types.GenerateContentConfig] = None):
+        """
+        Call Gemini through the async client, bounded by the concurrency
+        semaphore and the per-request timeout
+        """
+        async with self._llm_slot():
+            return await asyncio.wait_for(
+                self.client.aio.models.generate_content(model=self.model, contents=contents, config=config),
+                timeout=self.request_timeout
+            )
+
+    async def _stream_content(self, contents: str, config: types.GenerateContentConfig) -> AsyncIterator:
+        """
+        Streaming variant of _generate_content. The call runs in its own task,
+        which holds the concurrency slot and the per-request timeout and
+        queues chunks as they arrive, so a slow reader downstream neither
+        keeps the slot nor counts against the timeout. Errors from the call,
+        timeouts included, are raised here.
+        """
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async with self._llm_slot():
+                    async with asyncio.timeout(self.request_timeout):
+                        stream = await self.client.aio.models.generate_content_stream(
+                            model=self.model, contents=contents, config=config
+                        )
+                        async for chunk in stream:
+                            chunks.put_nowait(chunk)
+                chunks.put_nowait(None)
+            except Exception as e:
+                chunks.put_nowait(e)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await chunks.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+
+    def get_metrics(self) -> Dict:
+        """Snapshot of LLM concurrency and queueing metrics"""
+        metrics = dict(self._metrics)
+        finished = metrics["completed"] + metrics["failed"] + metrics["timeouts"]
+        admitted = finished + metrics["in_flight"] + metrics["queue_timeouts"]
+        metrics["max_concurrency"] = self.max_concurrency
+        metrics["avg_queue_wait_seconds"] = metrics["total_queue_wait_seconds"] / admitted if admitted else 0.0
+        metrics["avg_call_seconds"] = metrics["total_call_seconds"] / finished if finished else 0.0
+        return metrics
+
+    def recommend_from_rules(self, user_data: Dict) -> Optional[Dict]:
+        """
+        Answer from the rule tier when the tier mode allows it; None means
+        the request should go to the LLM
+        """
+        if self.tier_mode == "llm":
+            return None
+        metrics = self._tier_metrics
+        metrics["requests"] += 1
+        decision = self.rule_engine.evaluate(user_data)
+        if decision.conclusive or self.tier_mode == "rules":
+            metrics["served_by_rules"] += 1
+            return decision.response
+        metrics["escalated"] += 1
+        for reason in decision.reasons:
+            metrics["escalation_reasons"][reason] += 1
+        return None
+
+    def escalated(self, user_data: Dict) -> bool:
+        """True when an escalation rule fires, e.g. severe pain; such states always get a fresh answer"""
+        return "escalate_rule" in self.rule_engine.evaluate(user_data).reasons
+
+    def get_tier_metrics(self) -> Dict:
+        """Share of recommendation requests answered without the LLM"""
+        metrics = dict(self._tier_metrics)
+        metrics["escalation_reasons"] = dict(metrics["escalation_reasons"])
+        metrics["mode"] = self.tier_mode
+        metrics["llm_avoided_ratio"] = metrics["served_by_rules"] / metrics["requests"] if metrics["requests"] else 0.0
+        return metrics
+
     async def generate_recommendations(self, user_data: Dict) -> List[Dict]:
         """
         Generate AI recommendations based on user vital signs and therapy data
         """
         try:
-            # Prepare user data message
-            user_message_text = f"""
-You are a medical AI assistant specialized in pain management and physiotherapy for the BioPatch smart pain monitoring system. 
-
-Analyze the provided patient data and generate 3-4 personalized recommendations in Vietnamese. Focus on:
-1. Therapy adjustments (TENS/Microcurrent settings)
-2. Lifestyle modifications  
-3. Exercise recommendations
-4. Safety alerts if needed
-
-Return JSON format with this exact structure:
-{{
-  "recommendations": [
-    {{
-      "id": 1,
-      "type": "therapy|lifestyle|exercise|safety",
-      "priority": "high|medium|low", 
-      "title": "Vietnamese title",
-      "description": "Vietnamese description",
-      "actionType": "therapy_setting|exercise|guide|article",
-      "actionText": "Vietnamese action button text",
-      "rationale": "Why this recommendation is important"
-    }}
-  ],
-  "summary": "Overall health assessment in Vietnamese",
-  "alerts": ["Any safety concerns in Vietnamese"]
-}}
-
-Base recommendations on EMG levels, heart rate variability, temperature readings, and previous therapy effectiveness.
-
-Phân tích dữ liệu bệnh nhân BioPatch:
-
-THÔNG TIN BỆNH NHÂN:
-- Tuổi: {user_data.get('age', 35)}
-- Giới tính: {user_data.get('gender', 'Nam')}
-- Vùng đau: {user_data.get('pain_location', 'Cổ và vai')}
-- Mức độ đau chủ quan: {user_data.get('pain_level', 6)}/10
-
-DỮ LIỆU SINH LÝ HIỆN TẠI:
-- EMG RMS: {user_data.get('emg_rms', 45.6)} µV
-- Nhịp tim: {user_data.get('heart_rate', 72)} bpm
-- HRV: {user_data.get('hrv', 28.5)} ms
-- EDA peaks: {user_data.get('eda_peaks', 12)} peaks
-- Nhiệt độ vùng đau: {user_data.get('temperature', 37.2)}°C
-- Tình trạng viêm: {user_data.get('inflammation', 'Nhẹ')}
-
-LỊCH SỬ LIỆU PHÁP (7 NGÀY QUA):
-- Tổng thời gian TENS: {user_data.get('tens_minutes', 150)} phút
-- Tổng thời gian Microcurrent: {user_data.get('microcurrent_minutes', 210)} phút
-- Tần số trung bình: {user_data.get('avg_frequency', 85)} Hz
-- Cường độ trung bình: {user_data.get('avg_intensity', 65)}%
-- Điểm phục hồi hiện tại: {user_data.get('recovery_score', 78)}/100
-
-XU HƯỚNG:
-- Xu hướng đau: {user_data.get('pain_trend', 'Cải thiện')}
-- Hiệu quả trị liệu: {user_data.get('therapy_effectiveness', 'Tốt')}
-- Căng cơ cao điểm: {user_data.get('muscle_tension_peaks', 3)} lần/ngày
-
-Vui lòng tạo khuyến nghị cá nhân hóa để cải thiện tình trạng phục hồi.
-"""
-            
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro",
-                contents=user_message_text
-            )
+            prompt = self.prompt_builder.build(user_data)
+            response = await self._generate_content(prompt.text, config=await self._generation_config())
+            usage = self._record_usage(prompt, response)
             
-            # Parse AI response
             try:
-                # Clean the response to extract JSON
-                response_text = response.text.strip() if response.text else ""
-                if response_text.startswith('```json'):
-                    response_text = response_text[7:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
-                
-                ai_recommendations = json.loads(response_text.strip())
-                return ai_recommendations
-                
-            except json.JSONDecodeError:
-                # Fallback to manual parsing or default recommendations
+                parsed, repaired = parse_response(response.text or "")
+            except ValueError as e:
+                self._metrics["invalid_responses"] += 1
+                print(f"AI recommendation error: unusable response: {str(e)}")
                 return self._get_fallback_recommendations(user_data)
-                
+
+            self._metrics["parsed"] += 1
+            self._metrics["repaired"] += repaired
+            ai_recommendations = parsed.model_dump()
+            ai_recommendations["source"] = "gemini"
+            ai_recommendations["usage"] = usage
+            if repaired:
+                ai_recommendations["repaired"] = True
+            return ai_recommendations
+
+        except asyncio.TimeoutError:
+            print("AI recommendation error: Gemini request timed out")
+            return self._get_fallback_recommendations(user_data)
         except Exception as e:
             print(f"AI recommendation error: {str(e)}")
             return self._get_fallback_recommendations(user_data)
     
+    async def stream_recommendations(self, user_data: Dict) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Yield ("recommendation", item) as each recommendation in the LLM
+        output completes, then ("done", summary) with summary, alerts,
+        source and usage. Falls back to the rule engine when the call fails
+        before any recommendation has been delivered; a failure after that
+        ends the stream with what was delivered, marked partial.
+        """
+        prompt = self.prompt_builder.build(user_data)
+        scanner = IncrementalJSONScanner()
+        delivered = 0
+        partial = False
+        last_chunk = None
+        try:
+            async for chunk in self._stream_content(prompt.text, await self._generation_config()):
+                last_chunk = chunk
+                for raw_item in scanner.feed(chunk.text or ""):
+                    item = parse_item(raw_item)
+                    if item is not None:
+                        delivered += 1
+                        yield "recommendation", item
+        except Exception as e:
+            print(f"AI recommendation stream error: {str(e) or type(e).__name__}")
+            if not delivered:
+                fallback = self._get_fallback_recommendations(user_data)
+                for item in fallback.pop("recommendations"):
+                    yield "recommendation", item
+                yield "done", fallback
+                return
+            partial = True
+
+        if not delivered:
+            self._metrics["invalid_responses"] += 1
+            fallback = self._get_fallback_recommendations(user_data)
+            for item in fallback.pop("recommendations"):
+                yield "recommendation", item
+            yield "done", fallback
+            return
+
+        # Usage metadata arrives on the final chunk
+        usage = self._record_usage(prompt, last_chunk)
+        try:
+            parsed, repaired = parse_response(scanner.text)
+            summary = {"summary": parsed.summary, "alerts": parsed.alerts}
+        except ValueError:
+            repaired = True
+            summary = {"summary": "", "alerts": []}
+        self._metrics["parsed"] += 1
+        self._metrics["repaired"] += repaired
+        done = {**summary, "source": "gemini", "usage": usage, "repaired": repaired}
+        if partial:
+            done["partial"] = True
+        yield "done", done
+
     def _get_fallback_recommendations(self, user_data: Dict) -> Dict:
         """
-        Fallback recommendations based on rule-based logic
+        Fallback recommendations from the rule engine, whether or not the
+        rules are conclusive for this patient state
         """
-        recommendations = []
-        alerts = []
-        
-        # Analyze EMG levels
-        emg_rms = user_data.get('emg_rms', 45)
-        if emg_rms > 60:
-            recommendations.append({
-                "id": len(recommendations) + 1,
-                "type": "therapy",
-                "priority": "high",
-                "title": "Tăng cường liệu pháp microcurrent",
-                "description": "EMG cao cho thấy căng cơ tăng. Tăng thời gian microcurrent 10 phút/phiên.",
-                "actionType": "therapy_setting",
-                "actionText": "Cập nhật cài đặt",
-                "rationale": "Microcurrent giúp giảm căng cơ hiệu quả"
-            })
-        
-        # Analyze temperature
-        temperature = user_data.get('temperature', 37.0)
-        if temperature > 37.5:
-            recommendations.append({
-                "id": len(recommendations) + 1,
-                "type": "safety",
-                "priority": "high", 
-                "title": "Giám sát tình trạng viêm",
-                "description": "Nhiệt độ vùng đau cao. Theo dõi sát và nghỉ ngơi.",
-                "actionType": "guide",
-                "actionText": "Xem hướng dẫn",
-                "rationale": "Nhiệt độ cao có thể chỉ ra viêm cấp tính"
-            })
-            alerts.append("Nhiệt độ vùng đau cao hơn bình thường")
-        
-        # Heart rate analysis
-        heart_rate = user_data.get('heart_rate', 72)
-        if heart_rate > 90:
-            recommendations.append({
-                "id": len(recommendations) + 1,
-                "type": "lifestyle",
-                "priority": "medium",
-                "title": "Kỹ thuật thư giãn và hít thở",
-                "description": "Nhịp tim hơi cao. Thực hiện bài tập hít thở sâu 10 phút/ngày.",
-                "actionType": "exercise",
-                "actionText": "Học kỹ thuật",
-                "rationale": "Hít thở sâu giúp giảm stress và nhịp tim"
-            })
-        
-        # Default exercise recommendation
-        recommendations.append({
-            "id": len(recommendations) + 1,
-            "type": "exercise",
-            "priority": "medium",
-            "title": "Bài tập giãn cơ cổ vai",
-            "description": "Thực hiện bài tập giãn cơ 15 phút mỗi sáng để cải thiện độ linh hoạt.",
-            "actionType": "exercise", 
-            "actionText": "Xem video hướng dẫn",
-            "rationale": "Giãn cơ đều đặn giúp ngăn ngừa căng cơ"
-        })
-        
-        return {
-            "recommendations": recommendations,
-            "summary": f"Phân tích tổng thể: Điểm phục hồi {user_data.get('recovery_score', 78)}/100 cho thấy tiến triển tích cực. Cần chú ý theo dõi và điều chỉnh liệu pháp phù hợp.",
-            "alerts": alerts
-        }
+        return self.rule_engine.evaluate(user_data, source="fallback").response
 
 # Create global AI service instance
 ai_service = AIRecommendationService()
\ No newline at end of file
@@ -0,0 +1,239 @@
+import os
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Metric -> (high limit, title, message). Same limits as the rule-based
+# fallback recommendations, applied to every reading instead.
+ABSOLUTE_LIMITS = {
+    "temperature": (37.5, "Nhiệt độ vùng đau cao", "Nhiệt độ vùng đau cao hơn bình thường"),
+    "heart_rate": (90.0, "Nhịp tim cao", "Nhịp tim cao hơn bình thường"),
+}
+
+# Metrics tracked against the user's own rolling baseline -> minimum std
+# used for z-scores, so a very steady baseline doesn't flag sensor noise
+BASELINE_METRICS = {
+    "emg_rms": 2.0,
+    "heart_rate": 3.0,
+    "hrv": 3.0,
+    "eda_peaks": 2.0,
+    "temperature": 0.15,
+}
+
+METRIC_LABELS = {
+    "emg_rms": "EMG RMS",
+    "heart_rate": "Nhịp tim",
+    "hrv": "HRV",
+    "eda_peaks": "EDA peaks",
+    "temperature": "Nhiệt độ",
+}
+
+
+class BaselineState:
+    """Per-user EWMA mean/variance for each metric plus alert cooldowns"""
+
+    __slots__ = ("mean", "var", "count", "last_alert", "dirty")
+
+    def __init__(self, mean=None, var=None, count=0, last_alert=None):
+        self.mean: Dict[str, float] = mean or {}
+        self.var: Dict[str, float] = var or {}
+        self.count = count
+        self.last_alert: Dict[str, datetime] = last_alert or {}
+        self.dirty = False
+
+    @classmethod
+    def from_document(cls, document: Dict) -> "BaselineState":
+        return cls(document.get("mean"), document.get("var"), document.get("count", 0), document.get("last_alert"))
+
+    def to_document(self) -> Dict:
+        """A copy, so the live state can keep changing while the document is written"""
+        return {"mean": dict(self.mean), "var": dict(self.var), "count": self.count, "last_alert": dict(self.last_alert)}
+
+
+class AnomalyDetector:
+    """
+    Online anomaly detection on the vitals ingest path. Each reading is
+    scored against the user's EWMA baseline (z-score) and the absolute
+    limits, then folded into the baseline in O(1). Baselines live in
+    memory and are checkpointed to the anomaly_state collection
+    periodically, so the only database read is one lazy load per user.
+    """
+
+    def __init__(
+        self,
+        collection,
+        alpha: float = 0.05,
+        z_threshold: float = 4.0,
+        warmup: int = 30,
+        cooldown: float = 600.0,
+        max_users: int = 50000
+    ):
+        self.collection = collection
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.cooldown = timedelta(seconds=cooldown)
+        self.max_users = max_users
+        self._states: "OrderedDict[str, BaselineState]" = OrderedDict()
+        self._evicted: Dict[str, BaselineState] = {}
+        self._metrics = {"observed": 0, "alerts": 0, "suppressed": 0, "loads": 0, "checkpoints": 0}
+
+    async def _state(self, user_id: str) -> BaselineState:
+        state = self._states.get(user_id)
+        if state is not None:
+            self._states.move_to_end(user_id)
+            return state
+        state = self._evicted.pop(user_id, None)
+        if state is None:
+            document = await self.collection.find_one({"user_id": user_id})
+            self._metrics["loads"] += 1
+            # Another reading for this user may have loaded it meanwhile
+            state = self._states.get(user_id) or (
+                BaselineState.from_document(document) if document else BaselineState()
+            )
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        if len(self._states) > self.max_users:
+            evicted_user, evicted_state = self._states.popitem(last=False)
+            if evicted_state.dirty:
+                self._evicted[evicted_user] = evicted_state
+        return state
+
+    def _alert(self, user_id: str, reading: Dict, metric: str, rule: str, priority: str, title: str, message: str, **metadata) -> Dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": "error" if priority == "high" else "warning",
+            "title": title,
+            "message": message,
+            "timestamp": reading["timestamp"],
+            "resolved": False,
+            "priority": priority,
+            "metadata": {"metric": metric, "value": reading[metric], "rule": rule, **metadata},
+        }
+
+    def _score(self, user_id: str, state: BaselineState, reading: Dict) -> List[Dict]:
+        alerts = []
+        for metric, (limit, title, message) in ABSOLUTE_LIMITS.items():
+            value = reading.get(metric)
+            if value is not None and value > limit:
+                alerts.append(self._alert(user_id, reading, metric, "threshold", "high", title, message, limit=limit))
+
+        if state.count >= self.warmup:
+            for metric, min_std in BASELINE_METRICS.items():
+                value = reading.get(metric)
+                variance = state.var.get(metric)
+                if value is None or variance is None:
+                    continue
+                std = max(variance ** 0.5, min_std)
+                z = (value - state.mean[metric]) / std
+                if abs(z) >= self.z_threshold:
+                    direction = "tăng" if z > 0 else "giảm"
+                    alerts.append(self._alert(
+                        user_id, reading, metric, "baseline", "medium",
+                        f"{METRIC_LABELS[metric]} bất thường",
+                        f"{METRIC_LABELS[metric]} {direction} bất thường so với mức nền của bạn",
+                        z=round(z, 2), baseline_mean=round(state.mean[metric], 3), baseline_std=round(std, 3)
+                    ))
+
+        # One alert per metric per cooldown window; the threshold alert wins
+        emitted = []
+        for alert in alerts:
+            metric = alert["metadata"]["metric"]
+            last = state.last_alert.get(metric)
+            if (last is not None and alert["timestamp"] - last < self.cooldown) or any(
+                other["metadata"]["metric"] == metric for other in emitted
+            ):
+                self._metrics["suppressed"] += 1
+                continue
+            state.last_alert[metric] = alert["timestamp"]
+            emitted.append(alert)
+        return emitted
+
+    def _update(self, state: BaselineState, reading: Dict) -> None:
+        alpha = self.alpha
+        for metric in BASELINE_METRICS:
+            value = reading.get(metric)
+            if value is None:
+                continue
+            mean = state.mean.get(metric)
+            if mean is None:
+                state.mean[metric] = float(value)
+                state.var[metric] = 0.0
+                continue
+            diff = value - mean
+            increment = alpha * diff
+            state.mean[metric] = mean + increment
+            state.var[metric] = (1 - alpha) * (state.var[metric] + diff * increment)
+        state.count += 1
+        state.dirty = True
+
+    async def observe(self, readings: Iterable[Dict]) -> List[Dict]:
+        """Score readings in timestamp order and return the alerts raised"""
+        alerts = []
+        for reading in sorted(readings, key=lambda reading: reading["timestamp"]):
+            user_id = reading["user_id"]
+            state = await self._state(user_id)
+            alerts.extend(self._score(user_id, state, reading))
+            self._update(state, reading)
+            self._metrics["observed"] += 1
+        self._metrics["alerts"] += len(alerts)
+        return alerts
+
+    async def checkpoint(self) -> int:
+        """Persist every baseline changed since the last checkpoint"""
+        dirty = dict(self._evicted)
+        dirty.update((user_id, state) for user_id, state in self._states.items() if state.dirty)
+        if not dirty:
+            return 0
+        # observe() keeps updating the live states while the write is in flight
+        snapshots = {user_id: state.to_document() for user_id, state in dirty.items()}
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"user_id": user_id}, {"$set": {**document, "updated_at": now}}, upsert=True)
+            for user_id, document in snapshots.items()
+        ]
+        # On failure everything stays dirty (and evicted) for the next checkpoint
+        await self.collection.bulk_write(operations, ordered=False)
+
+        for user_id, state in dirty.items():
+            # count grows with every reading: a newer reading isn't in this write
+            if state.count == snapshots[user_id]["count"]:
+                state.dirty = False
+                if self._evicted.get(user_id) is state:
+                    del self._evicted[user_id]
+        self._metrics["checkpoints"] += 1
+        return len(operations)
+
+    async def run_checkpoints(self, interval: float) -> None:
+        """Checkpoint loop; runs until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.error(f"Anomaly baseline checkpoint failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        metrics = dict(self._metrics)
+        metrics["users"] = len(self._states)
+        metrics["dirty"] = len(self._evicted) + sum(1 for state in self._states.values() if state.dirty)
+        return metrics
+
+
+def create_anomaly_detector(db) -> AnomalyDetector:
+    return AnomalyDetector(
+        db.anomaly_state,
+        alpha=float(os.environ.get("ANOMALY_EWMA_ALPHA", "0.05")),
+        z_threshold=float(os.environ.get("ANOMALY_Z_THRESHOLD", "4")),
+        warmup=int(os.environ.get("ANOMALY_WARMUP_READINGS", "30")),
+        cooldown=float(os.environ.get("ANOMALY_ALERT_COOLDOWN_SECONDS", "600")),
+        max_users=int(os.environ.get("ANOMALY_MAX_USERS", "50000")),
+    )
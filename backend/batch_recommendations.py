@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Precompute AI recommendations for every user with vital signs newer than
+their last ai_recommendations record, so the dashboard's first request of
+the day is a cache hit instead of an LLM call.
+
+Results are written to ai_recommendations flagged precomputed; the
+endpoint serves a user's newest one to requests with the same
+fingerprint until a newer reading arrives, for up to
+RECOMMENDATION_PRECOMPUTED_TTL_SECONDS (RECOMMENDATION_PRECOMPUTED=false
+turns the lookup off). States an escalation rule fires for are skipped.
+Progress is checkpointed in batch_jobs, so an interrupted run resumes
+where it stopped.
+
+    python batch_recommendations.py --since-hours 24 --concurrency 4 --rate 60
+    python batch_recommendations.py --stub-llm --limit 100   # offline dry run
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from database import create_mongo_connections
+from hrv import create_hrv_engine
+from models.vital_signs_models import InflammationLevel
+from prompt_builder import weekly_history
+from recommendation_cache import fingerprint
+from recovery_score import create_recovery_engine
+from vitals_storage import create_vitals_store
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger("batch_recommendations")
+
+SCAN_CHUNK_SIZE = 500
+
+# Mirrors the AIRecommendationRequest defaults used by the endpoint
+REQUEST_DEFAULTS = {
+    "age": 35,
+    "gender": "Nam",
+    "pain_location": "Cổ và vai",
+    "pain_level": 6,
+    "emg_rms": 45.6,
+    "heart_rate": 72,
+    "hrv": 28.5,
+    "eda_peaks": 12,
+    "temperature": 37.2,
+    "inflammation": "Nhẹ",
+    "recovery_score": 78,
+}
+INFLAMMATION_LABELS = {"low": "Nhẹ", "medium": "Trung bình", "high": "Cao"}
+
+
+class RateLimiter:
+    """Spaces call starts at least 60 / per_minute seconds apart across all workers"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class RecommendationBatchJob:
+    def __init__(self, db, service, concurrency: int, rate_per_minute: float, job_id: str, checkpoint_every: int = 50):
+        self.db = db
+        self.service = service
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_per_minute)
+        self.job_id = job_id
+        self.checkpoint_every = checkpoint_every
+        self.vitals_store = create_vitals_store(db)
+        self.recovery_engine = create_recovery_engine(db)
+        self.hrv_engine = create_hrv_engine(db)
+        self.stats = {"scanned": 0, "generated": 0, "rules": 0, "escalated": 0, "failed": 0}
+
+    async def candidates(self, since: datetime, after_user: Optional[str], limit: Optional[int]) -> List[str]:
+        """Users with readings since `since` and newer than their last recommendation, by user_id"""
+        query = {"vitals_at": {"$gte": since}}
+        if after_user is not None:
+            query["user_id"] = {"$gt": after_user}
+        cursor = self.db.recovery_state.find(query, {"user_id": 1, "vitals_at": 1}).sort("user_id", 1)
+
+        users = []
+        chunk = []
+        async for state in cursor:
+            chunk.append(state)
+            if len(chunk) >= SCAN_CHUNK_SIZE:
+                users.extend(await self._without_fresh_recommendation(chunk))
+                chunk = []
+            if limit and len(users) >= limit:
+                break
+        if chunk:
+            users.extend(await self._without_fresh_recommendation(chunk))
+        return users[:limit] if limit else users
+
+    async def _without_fresh_recommendation(self, states: List[Dict]) -> List[str]:
+        last_recommendation = {
+            row["_id"]: row["last"]
+            for row in await self.db.ai_recommendations.aggregate([
+                {"$match": {"user_id": {"$in": [state["user_id"] for state in states]}}},
+                {"$group": {"_id": "$user_id", "last": {"$max": "$timestamp"}}},
+            ]).to_list(None)
+        }
+        self.stats["scanned"] += len(states)
+        return [
+            state["user_id"] for state in states
+            if state["user_id"] not in last_recommendation or last_recommendation[state["user_id"]] < state["vitals_at"]
+        ]
+
+    async def build_user_data(self, user_id: str) -> Dict:
+        """The same inputs the endpoint would receive, read from the stored state"""
+        vitals, profile, recovery, hrv_summary, history = await asyncio.gather(
+            self.vitals_store.latest(user_id),
+            self.db.user_profiles.find_one({"user_id": user_id}),
+            self.recovery_engine.get(user_id),
+            self.hrv_engine.summary(user_id),
+            weekly_history(self.db, user_id),
+        )
+        user_data = dict(REQUEST_DEFAULTS, user_id=user_id, **history)
+        if profile:
+            for field in ("age", "gender", "pain_location", "pain_level"):
+                if profile.get(field) is not None:
+                    user_data[field] = profile[field]
+        if vitals:
+            for field in ("emg_rms", "heart_rate", "hrv", "eda_peaks", "temperature"):
+                user_data[field] = vitals[field]
+            user_data["inflammation"] = INFLAMMATION_LABELS[InflammationLevel.from_temperature(vitals["temperature"]).value]
+        if recovery.get("current_score") is not None:
+            user_data["recovery_score"] = recovery["current_score"]
+        if hrv_summary:
+            latest_hrv = hrv_summary["latest"]
+            user_data["hrv"] = latest_hrv["rmssd"]
+            user_data["hrv_sdnn"] = latest_hrv["sdnn"]
+            user_data["hrv_pnn50"] = latest_hrv["pnn50"]
+            user_data["hrv_lf_hf"] = latest_hrv["lf_hf"]
+        return user_data
+
+    async def process(self, user_id: str) -> None:
+        user_data = await self.build_user_data(user_id)
+        # States the rule tier answers never reach the LLM, so there's nothing to precompute
+        if self.service.tier_mode != "llm" and self.service.rule_engine.evaluate(user_data).conclusive:
+            self.stats["rules"] += 1
+            return
+        # and escalated ones are never served a precomputed answer
+        if self.service.escalated(user_data):
+            self.stats["escalated"] += 1
+            return
+
+        await self.rate_limiter.wait()
+        recommendations = await self.service.generate_recommendations(user_data)
+        # A truncated answer would be served as if complete
+        if recommendations.get("source") == "fallback" or recommendations.get("repaired"):
+            self.stats["failed"] += 1
+            return
+        await self.db.ai_recommendations.insert_one({
+            "user_id": user_id,
+            "timestamp": datetime.utcnow(),
+            "recommendations": recommendations,
+            "user_data_snapshot": user_data,
+            "fingerprint": fingerprint(user_data),
+            "cached": False,
+            "precomputed": True,
+            "job_id": self.job_id
+        })
+        self.stats["generated"] += 1
+
+    async def _checkpoint(self, since: datetime, last_user: Optional[str], status: str) -> None:
+        await self.db.batch_jobs.update_one(
+            {"_id": self.job_id},
+            {"$set": {
+                "since": since,
+                "last_user_id": last_user,
+                "status": status,
+                "stats": self.stats,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    async def run(self, since: datetime, limit: Optional[int] = None, restart: bool = False) -> Dict:
+        checkpoint = None if restart else await self.db.batch_jobs.find_one({"_id": self.job_id, "status": "running"})
+        after_user = None
+        if checkpoint:
+            since = checkpoint["since"]
+            after_user = checkpoint.get("last_user_id")
+            logger.info(f"Resuming {self.job_id} after user {after_user}")
+
+        users = await self.candidates(since, after_user, limit)
+        logger.info(f"{len(users)} users need recommendations")
+        await self._checkpoint(since, after_user, "running")
+
+        # Workers finish out of order; the checkpoint only advances past a
+        # user once everyone before it in user_id order is done
+        done = [False] * len(users)
+        watermark = 0
+        queue: "asyncio.Queue[int]" = asyncio.Queue()
+        for index in range(len(users)):
+            queue.put_nowait(index)
+
+        async def worker():
+            nonlocal watermark
+            while not queue.empty():
+                index = queue.get_nowait()
+                try:
+                    await self.process(users[index])
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.error(f"Failed to precompute recommendations for {users[index]}: {str(e)}")
+                done[index] = True
+                previous = watermark
+                while watermark < len(users) and done[watermark]:
+                    watermark += 1
+                if watermark // self.checkpoint_every > previous // self.checkpoint_every:
+                    await self._checkpoint(since, users[watermark - 1], "running")
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.concurrency))))
+        await self._checkpoint(since, users[-1] if users else after_user, "completed")
+        return self.stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since-hours", type=float, default=24.0, help="only users with readings in this window")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4")))
+    parser.add_argument("--rate", type=float, default=60.0, help="max LLM calls per minute (0 = unlimited)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many users")
+    parser.add_argument("--job-id", default="precompute-recommendations")
+    parser.add_argument("--restart", action="store_true", help="ignore an unfinished checkpoint")
+    parser.add_argument("--stub-llm", action="store_true", help="use the offline stub client instead of Gemini")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.stub_llm:
+        os.environ["GEMINI_STUB"] = "true"
+    # Imported late: the module-level service reads GEMINI_STUB on import
+    from ai_service import ai_service
+
+    mongo = create_mongo_connections()
+    try:
+        job = RecommendationBatchJob(
+            mongo.database("background"),
+            ai_service,
+            concurrency=args.concurrency,
+            rate_per_minute=args.rate,
+            job_id=args.job_id
+        )
+        started = time.perf_counter()
+        stats = await job.run(datetime.utcnow() - timedelta(hours=args.since_hours), args.limit, args.restart)
+        logger.info(f"Finished in {time.perf_counter() - started:.1f}s: {stats}")
+    finally:
+        mongo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
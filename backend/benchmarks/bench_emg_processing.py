@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Throughput of signal_processing.EMGProcessor on one core: how many patches
+streaming at 1 kHz can be processed in real time when each patch's last
+second is one window and all patches are processed as one batch.
+
+    python benchmarks/bench_emg_processing.py --patches 1000 5000 10000
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from signal_processing import EMGProcessor  # noqa: E402
+
+
+def synthetic_windows(patches: int, samples: int, rng) -> np.ndarray:
+    windows = rng.normal(0.0, 5.0, (patches, samples))
+    # Muscle bursts in a third of the windows
+    bursts = rng.random(patches) < 0.33
+    windows[bursts, samples // 3: samples // 2] += rng.normal(0.0, 40.0, (int(bursts.sum()), samples // 2 - samples // 3))
+    return windows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patches", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--sample-rate", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    processor = EMGProcessor(sample_rate=args.sample_rate)
+    print(f"{'patches':>8} {'batch time':>11} {'realtime capacity':>18}")
+    for patches in args.patches:
+        windows = synthetic_windows(patches, args.sample_rate, rng)
+        processor.process(windows)  # allocate buffers outside the timing
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            processor.process(windows)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        # Each window is one second of signal, so windows/s == patches sustainable in real time
+        print(f"{patches:>8} {best * 1000:>9.1f}ms {int(patches / best):>10} patches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Latency of the hot read paths vs collection size, with and without the
+indexes from db_indexes.INDEX_SPECS.
+
+Runs against MONGO_URL in a scratch database that is dropped afterwards:
+    python benchmarks/bench_index_latency.py --sizes 1000 10000 100000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+load_dotenv(ROOT_DIR / '.env')
+
+from db_indexes import INDEX_SPECS  # noqa: E402
+
+USERS = 100
+
+
+def seed(db, size):
+    start = datetime.utcnow() - timedelta(seconds=size)
+    docs = [
+        {
+            "user_id": f"user-{i % USERS}",
+            "emg_rms": random.uniform(20, 80),
+            "heart_rate": random.randint(55, 110),
+            "hrv": random.uniform(15, 60),
+            "eda_peaks": random.randint(0, 30),
+            "temperature": random.uniform(36.0, 38.5),
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(size)
+    ]
+    for offset in range(0, size, 10000):
+        db.vital_signs.insert_many(docs[offset:offset + 10000], ordered=False)
+
+
+def measure(db, queries):
+    """p50/p99 in ms of latest-reading and last-24 queries over random users"""
+    latest, recent = [], []
+    for _ in range(queries):
+        user_id = f"user-{random.randrange(USERS)}"
+        started = time.perf_counter()
+        db.vital_signs.find_one({"user_id": user_id}, sort=[("timestamp", -1)])
+        latest.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        list(db.vital_signs.find({"user_id": user_id}).sort("timestamp", -1).limit(24))
+        recent.append((time.perf_counter() - started) * 1000)
+
+    def percentiles(samples):
+        samples.sort()
+        return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+    return percentiles(latest), percentiles(recent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client["biopatch_index_bench"]
+    keys = next(keys for name, keys, _ in INDEX_SPECS if name == "vital_signs")
+
+    print(f"{'docs':>10} {'index':>6} {'latest p50':>11} {'latest p99':>11} {'last24 p50':>11} {'last24 p99':>11}")
+    try:
+        for size in args.sizes:
+            client.drop_database(db.name)
+            seed(db, size)
+            for indexed in (False, True):
+                if indexed:
+                    db.vital_signs.create_index(keys)
+                (l50, l99), (r50, r99) = measure(db, args.queries)
+                print(f"{size:>10} {'yes' if indexed else 'no':>6} "
+                      f"{l50:>9.2f}ms {l99:>9.2f}ms {r50:>9.2f}ms {r99:>9.2f}ms")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Composite-endpoint latency with sequential queries vs query_fanout.fan_out,
+against a simulated slow database (log-normal round-trips with a heavy tail).
+
+    python benchmarks/bench_query_fanout.py --requests 500 --median-ms 20
+"""
+
+import sys
+import time
+import math
+import random
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from query_fanout import fan_out  # noqa: E402
+
+
+async def slow_query(median_ms: float, sigma: float):
+    await asyncio.sleep(random.lognormvariate(math.log(median_ms / 1000), sigma))
+    return []
+
+
+async def sequential(queries: int, median_ms: float, sigma: float):
+    return [await slow_query(median_ms, sigma) for _ in range(queries)]
+
+
+async def concurrent(queries: int, median_ms: float, sigma: float, timeout: float):
+    return await fan_out(
+        {f"q{i}": slow_query(median_ms, sigma) for i in range(queries)},
+        timeout=timeout
+    )
+
+
+async def run(mode, args):
+    samples = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        if mode == "sequential":
+            await sequential(args.queries, args.median_ms, args.sigma)
+        else:
+            await concurrent(args.queries, args.median_ms, args.sigma, args.timeout)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=3, help="independent queries per request")
+    parser.add_argument("--median-ms", type=float, default=20.0)
+    parser.add_argument("--sigma", type=float, default=0.6, help="log-normal spread (tail heaviness)")
+    parser.add_argument("--timeout", type=float, default=5.0, help="per-query timeout for fan_out (s)")
+    args = parser.parse_args()
+
+    print(f"{args.queries} queries/request, median round-trip {args.median_ms}ms, sigma {args.sigma}")
+    print(f"{'mode':>12} {'p50':>10} {'p99':>10}")
+    for mode in ("sequential", "fan_out"):
+        p50, p99 = asyncio.run(run(mode, args))
+        print(f"{mode:>12} {p50:>8.1f}ms {p99:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Latency of the recommendation rule tier: one request at a time (the
+/recommendations path) and whole-population batches, plus the share of
+synthetic patient states the rules could answer without the LLM.
+
+    python benchmarks/bench_rule_engine.py --requests 20000 --batch 100000
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from recommendation_rules import load_rule_engine  # noqa: E402
+
+
+def synthetic_states(rows: int, rng) -> np.ndarray:
+    """Columns follow the order of the default rules config features"""
+    return np.column_stack([
+        rng.integers(20, 75, rows),          # age
+        rng.integers(1, 10, rows),           # pain_level
+        rng.normal(50.0, 12.0, rows),        # emg_rms
+        rng.normal(75.0, 10.0, rows),        # heart_rate
+        rng.normal(35.0, 10.0, rows),        # hrv
+        rng.integers(0, 30, rows),           # eda_peaks
+        rng.normal(37.0, 0.3, rows),         # temperature
+        rng.integers(40, 100, rows),         # recovery_score
+    ]).astype(np.float64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100000)
+    parser.add_argument("--rules", default=None, help="rules config (default: RECOMMENDATION_RULES_PATH or bundled)")
+    args = parser.parse_args()
+
+    engine = load_rule_engine(args.rules)
+    rng = np.random.default_rng(0)
+
+    states = synthetic_states(args.requests, rng)
+    requests = [dict(zip(engine.features, row.tolist())) for row in states]
+    started = time.perf_counter()
+    conclusive = sum(engine.evaluate(user_data).conclusive for user_data in requests)
+    elapsed = time.perf_counter() - started
+    print(f"per request: {elapsed / args.requests * 1e6:.1f}us  answered by rules: {conclusive / args.requests:.1%}")
+
+    states = synthetic_states(args.batch, rng)
+    started = time.perf_counter()
+    batch = engine.evaluate_batch(states)
+    elapsed = time.perf_counter() - started
+    print(f"batch of {args.batch}: {elapsed * 1000:.1f}ms  answered by rules: {batch.conclusive.mean():.1%}")
+    for reason, flags in batch.reasons.items():
+        print(f"  escalated for {reason}: {flags.mean():.1%}")
+
+
+if __name__ == "__main__":
+    main()
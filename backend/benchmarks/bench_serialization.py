@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Encode cost of a read endpoint's payload: the old path (stringify _id in a
+Python loop, jsonable_encoder, json.dumps) vs responses.dumps.
+
+    python benchmarks/bench_serialization.py --sizes 1000 10000
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from responses import dumps, orjson  # noqa: E402
+
+
+def make_documents(count):
+    start = datetime.utcnow() - timedelta(seconds=count)
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": "user-1",
+            "emg_rms": random.uniform(20, 80),
+            "heart_rate": random.randint(55, 110),
+            "hrv": random.uniform(15, 60),
+            "eda_peaks": random.randint(0, 30),
+            "temperature": random.uniform(36.0, 38.5),
+            "timestamp": start + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_encode(documents):
+    for document in documents:
+        document["_id"] = str(document["_id"])
+    return json.dumps(jsonable_encoder(documents), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def best_of(repeat, encode, count):
+    timings = []
+    for _ in range(repeat):
+        documents = make_documents(count)
+        started = time.perf_counter()
+        encode(documents)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    print(f"{'docs':>8} {'legacy':>10} {'dumps':>10} {'speedup':>8}")
+    for size in args.sizes:
+        legacy = best_of(args.repeat, legacy_encode, size)
+        fast = best_of(args.repeat, dumps, size)
+        print(f"{size:>8} {legacy:>8.2f}ms {fast:>8.2f}ms {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
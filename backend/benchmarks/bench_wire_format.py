@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Upload cost of a /vitals/batch body: JSON array parsed and validated per
+reading (the JSON path) vs the columnar binary frame decoded with
+np.frombuffer. Reports body size per reading and ingest throughput.
+
+    python benchmarks/bench_wire_format.py --sizes 100 1000 10000
+"""
+
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import vitals_wire  # noqa: E402
+from recommendation_schema import orjson  # noqa: E402
+
+
+class UserVitalSigns(BaseModel):
+    """Mirrors server.UserVitalSigns without importing the app"""
+    user_id: str
+    emg_rms: float
+    heart_rate: int
+    hrv: float
+    eda_peaks: int
+    temperature: float
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+def make_readings(count, rng):
+    start_ms = int(datetime.now(timezone.utc).timestamp() * 1000) - count * 1000
+    timestamps_ms = start_ms + np.cumsum(rng.integers(900, 1100, count))
+    columns = {
+        "emg_rms": rng.uniform(20, 80, count).round(2),
+        "heart_rate": rng.integers(55, 110, count),
+        "hrv": rng.uniform(15, 60, count).round(2),
+        "eda_peaks": rng.integers(0, 30, count),
+        "temperature": rng.uniform(36.0, 38.5, count).round(2),
+    }
+    return timestamps_ms, columns
+
+
+def json_body(user_id, timestamps_ms, columns):
+    return json.dumps([
+        {
+            "user_id": user_id,
+            "emg_rms": float(columns["emg_rms"][i]),
+            "heart_rate": int(columns["heart_rate"][i]),
+            "hrv": float(columns["hrv"][i]),
+            "eda_peaks": int(columns["eda_peaks"][i]),
+            "temperature": float(columns["temperature"][i]),
+            "timestamp": datetime.fromtimestamp(timestamps_ms[i] / 1000, timezone.utc).replace(tzinfo=None).isoformat(),
+        }
+        for i in range(len(timestamps_ms))
+    ]).encode()
+
+
+def ingest_json(body, loads):
+    return [UserVitalSigns(**item).dict() for item in loads(body)]
+
+
+def ingest_binary(body):
+    documents, _ = vitals_wire.to_documents(vitals_wire.decode(body))
+    return documents
+
+
+def best_of(repeat, fn, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    paths = [("json", lambda body: ingest_json(body, json.loads))]
+    if orjson is not None:
+        paths.append(("orjson", lambda body: ingest_json(body, orjson.loads)))
+
+    for size in args.sizes:
+        timestamps_ms, columns = make_readings(size, rng)
+        text = json_body("user-1", timestamps_ms, columns)
+        frame = vitals_wire.encode("user-1", timestamps_ms, columns)
+        assert len(ingest_binary(frame)) == size
+
+        print(f"{size} readings: json {len(text) / size:.1f} B/reading, binary {len(frame) / size:.1f} B/reading")
+        for name, ingest in paths:
+            elapsed = best_of(args.repeat, ingest, text)
+            print(f"  {name:<8} {elapsed * 1000:8.2f}ms  {size / elapsed:12,.0f} readings/s")
+        elapsed = best_of(args.repeat, ingest_binary, frame)
+        print(f"  {'binary':<8} {elapsed * 1000:8.2f}ms  {size / elapsed:12,.0f} readings/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Throughput of raw EMG processing (the /emg/raw hot path) through the CPU
+pool as it grows from 1 to 8 processes, against running inline on the
+event loop, plus the cost of pickling the input instead of handing it
+over in shared memory.
+
+    python benchmarks/bench_worker_scaling.py --tasks 64 --seconds 60 --pools 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cpu_pool import CPUPool  # noqa: E402
+from signal_processing import process_windows, to_windows  # noqa: E402
+
+
+def make_uploads(tasks: int, seconds: int, sample_rate: int, rng):
+    """One upload per task: `seconds` of a patch, as one-second windows"""
+    return [
+        to_windows(rng.normal(0.0, 20.0, seconds * sample_rate), sample_rate)
+        for _ in range(tasks)
+    ]
+
+
+async def run_pool(pool: CPUPool, uploads, sample_rate: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(pool.run(process_windows, windows, sample_rate) for windows in uploads))
+    return time.perf_counter() - started
+
+
+async def run_pickled(executor: ProcessPoolExecutor, uploads, sample_rate: int) -> float:
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    await asyncio.gather(*(loop.run_in_executor(executor, process_windows, windows, sample_rate) for windows in uploads))
+    return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=64)
+    parser.add_argument("--seconds", type=int, default=60, help="seconds of signal per upload")
+    parser.add_argument("--sample-rate", type=int, default=1000)
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    uploads = make_uploads(args.tasks, args.seconds, args.sample_rate, np.random.default_rng(0))
+    total_mb = sum(windows.nbytes for windows in uploads) / 1e6
+    print(f"{args.tasks} uploads of {args.seconds}s at {args.sample_rate} Hz ({total_mb:.0f} MB), {os.cpu_count()} CPUs")
+
+    inline = CPUPool(workers=0)
+    baseline = await run_pool(inline, uploads, args.sample_rate)
+    print(f"  inline     {baseline * 1000:8.1f}ms  {args.tasks / baseline:8.1f} uploads/s")
+
+    for workers in args.pools:
+        pool = CPUPool(workers=workers, min_bytes=0)
+        pool.start()
+        try:
+            # First round spawns the processes and imports NumPy in each
+            await run_pool(pool, uploads[:workers], args.sample_rate)
+            elapsed = await run_pool(pool, uploads, args.sample_rate)
+        finally:
+            pool.shutdown()
+        print(f"  pool x{workers:<3}  {elapsed * 1000:8.1f}ms  {args.tasks / elapsed:8.1f} uploads/s  speedup {baseline / elapsed:.2f}x")
+
+    workers = max(args.pools)
+    with ProcessPoolExecutor(workers) as executor:
+        await run_pickled(executor, uploads[:workers], args.sample_rate)
+        elapsed = await run_pickled(executor, uploads, args.sample_rate)
+    print(f"  pickled x{workers:<2} {elapsed * 1000:8.1f}ms  {args.tasks / elapsed:8.1f} uploads/s  speedup {baseline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
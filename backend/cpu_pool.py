@@ -0,0 +1,93 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def _run_shared(fn: Callable, name: str, shape: Tuple[int, ...], dtype: str, args: tuple):
+    """Pool-side: view the parent's shared block as an array and call fn on it"""
+    block = SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+    try:
+        return fn(array, *args)
+    finally:
+        del array
+        try:
+            block.close()
+        except BufferError:
+            # fn's traceback still references the view; the mapping is
+            # released when that is collected
+            pass
+
+
+def _release(block: SharedMemory) -> None:
+    block.close()
+    block.unlink()
+
+
+class CPUPool:
+    """
+    Process pool for CPU-bound NumPy work, so signal processing doesn't
+    stall the event loop. The input array is copied once into a shared
+    memory block and viewed in place by the pool process; only the
+    (small) result is pickled back. fn must be a module-level function
+    that takes the array first and returns no views into it.
+
+    With workers=0, or for inputs under min_bytes where the round trip
+    costs more than the work, fn runs inline on the event loop.
+    """
+
+    def __init__(self, workers: int = 0, min_bytes: int = 256 * 1024):
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._metrics = {"offloaded": 0, "inline": 0, "shared_bytes": 0, "errors": 0}
+
+    def start(self) -> None:
+        if self.workers > 0 and self._executor is None:
+            # spawn: forking a process that runs an event loop and driver threads isn't safe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def run(self, fn: Callable, array, *args):
+        array = np.ascontiguousarray(array)
+        if self._executor is None or array.nbytes < self.min_bytes:
+            self._metrics["inline"] += 1
+            return fn(array, *args)
+
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        try:
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            future = self._executor.submit(_run_shared, fn, block.name, array.shape, array.dtype.str, args)
+        except BaseException:
+            _release(block)
+            raise
+        # Released when the pool is done with the block, not when this task is:
+        # a cancelled await leaves the pool process still reading it
+        future.add_done_callback(lambda _: _release(block))
+        self._metrics["offloaded"] += 1
+        self._metrics["shared_bytes"] += array.nbytes
+        try:
+            return await asyncio.wrap_future(future)
+        except Exception:
+            self._metrics["errors"] += 1
+            raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers if self._executor is not None else 0, **self._metrics}
+
+
+def create_cpu_pool() -> CPUPool:
+    return CPUPool(
+        workers=int(os.environ.get("CPU_POOL_WORKERS", "0")),
+        min_bytes=int(os.environ.get("CPU_POOL_MIN_BYTES", str(256 * 1024))),
+    )
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Per-user daily rollups of therapy sessions, pain reports and vital signs,
+kept in the daily_rollups collection so reports and trends for any date
+range read one small document per day instead of scanning the source
+collections. The write paths apply $inc/$min/$max upserts as data comes
+in; this command rebuilds the rollups from the source collections:
+
+    python daily_rollups.py --since-days 90
+    python daily_rollups.py --since-days 7 --user-id user-1
+
+A rebuild replaces the rollups of every day it touches. Run it over days
+that are no longer receiving writes (or while ingest is stopped), since a
+write landing mid-rebuild can be counted twice.
+"""
+
+import sys
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from database import create_mongo_connections
+from recovery_score import VITAL_COMPONENTS, compute_score
+from vitals_storage import VITAL_FIELDS, create_vitals_store
+
+logger = logging.getLogger(__name__)
+
+SESSION_TYPES = {"TENS": "tens_minutes", "Microcurrent": "microcurrent_minutes"}
+SETTINGS = ("frequency", "intensity", "pulse_width")
+
+
+def day_of(timestamp: datetime) -> datetime:
+    """UTC midnight of the day a timestamp falls on, as stored in Mongo"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _upsert(user_id: str, day: datetime, increments: Dict, minimums: Dict = None, maximums: Dict = None) -> UpdateOne:
+    update = {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}}
+    if minimums:
+        update["$min"] = minimums
+    if maximums:
+        update["$max"] = maximums
+    return UpdateOne({"user_id": user_id, "date": day}, update, upsert=True)
+
+
+def vitals_update(user_id: str, day: datetime, count: int, stats: Dict[str, Tuple[float, float, float]]) -> UpdateOne:
+    """stats: field -> (sum, min, max) over `count` readings"""
+    increments = {"vitals.count": count}
+    minimums, maximums = {}, {}
+    for field, (total, low, high) in stats.items():
+        increments[f"vitals.{field}.sum"] = total
+        minimums[f"vitals.{field}.min"] = low
+        maximums[f"vitals.{field}.max"] = high
+    return _upsert(user_id, day, increments, minimums, maximums)
+
+
+def pain_update(user_id: str, day: datetime, count: int, total: float, low: float, high: float) -> UpdateOne:
+    return _upsert(
+        user_id, day,
+        {"pain.count": count, "pain.sum": total},
+        {"pain.min": low},
+        {"pain.max": high}
+    )
+
+
+def session_update(
+    user_id: str,
+    day: datetime,
+    session_type: Optional[str],
+    sessions: int,
+    minutes: float,
+    settings: Dict[str, Tuple[float, int]],
+    effectiveness: Tuple[float, int]
+) -> UpdateOne:
+    """settings: name -> (sum, count); effectiveness: (sum, count)"""
+    increments = {"therapy.sessions": sessions, "therapy.minutes": minutes}
+    if session_type in SESSION_TYPES:
+        increments[f"therapy.{SESSION_TYPES[session_type]}"] = minutes
+    for name, (total, count) in settings.items():
+        if count:
+            increments[f"therapy.{name}.sum"] = total
+            increments[f"therapy.{name}.count"] = count
+    if effectiveness[1]:
+        increments["therapy.effectiveness.sum"] = effectiveness[0]
+        increments["therapy.effectiveness.count"] = effectiveness[1]
+    return _upsert(user_id, day, increments)
+
+
+def _mean(total: Optional[Dict]) -> Optional[float]:
+    if not total or not total.get("count"):
+        return None
+    return round(total["sum"] / total["count"], 1)
+
+
+def combine(days: Iterable[Dict]) -> Dict:
+    """Merge daily rollups into one rollup for the whole period"""
+    combined: Dict = {"therapy": {}, "pain": {}, "vitals": {}}
+    for day in days:
+        for section in ("therapy", "pain", "vitals"):
+            _merge(combined[section], day.get(section) or {})
+    return combined
+
+
+def _merge(into: Dict, values: Dict) -> None:
+    for key, value in values.items():
+        if isinstance(value, dict):
+            _merge(into.setdefault(key, {}), value)
+        elif key == "min":
+            into[key] = value if into.get(key) is None else min(into[key], value)
+        elif key == "max":
+            into[key] = value if into.get(key) is None else max(into[key], value)
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def summarize(rollup: Dict) -> Dict:
+    """Means and the recovery index of a (daily or combined) rollup"""
+    therapy = rollup.get("therapy") or {}
+    pain = rollup.get("pain") or {}
+    vitals = rollup.get("vitals") or {}
+    vitals_count = vitals.get("count", 0)
+
+    vitals_summary = {"count": vitals_count}
+    for field in VITAL_FIELDS:
+        stats = vitals.get(field)
+        vitals_summary[field] = {
+            "mean": round(stats["sum"] / vitals_count, 2),
+            "min": stats["min"],
+            "max": stats["max"],
+        } if stats and vitals_count else None
+
+    pain_summary = {
+        "count": pain["count"],
+        "mean": _mean(pain),
+        "min": pain.get("min"),
+        "max": pain.get("max"),
+    } if pain.get("count") else None
+
+    effectiveness = _mean(therapy.get("effectiveness"))
+    components = {
+        field: vitals_summary[field]["mean"]
+        for field in VITAL_COMPONENTS
+        if vitals_summary[field] is not None
+    }
+    # Pain as the sensors see it: the vitals-only score on the 0-10 pain scale
+    vitals_score = compute_score(components)
+    if pain_summary:
+        components["pain_level"] = pain_summary["mean"]
+    if effectiveness is not None:
+        components["effectiveness"] = effectiveness
+    score = compute_score(components)
+
+    return {
+        "sessions": therapy.get("sessions", 0),
+        "therapy_minutes": therapy.get("minutes", 0),
+        "tens_minutes": therapy.get("tens_minutes", 0),
+        "microcurrent_minutes": therapy.get("microcurrent_minutes", 0),
+        "avg_frequency": _mean(therapy.get("frequency")),
+        "avg_intensity": _mean(therapy.get("intensity")),
+        "avg_pulse_width": _mean(therapy.get("pulse_width")),
+        "avg_effectiveness": effectiveness,
+        "pain": pain_summary,
+        "vitals": vitals_summary,
+        "recovery_index": round(score) if score is not None else None,
+        "objective_pain": round((100 - vitals_score) / 10, 1) if vitals_score is not None else None,
+    }
+
+
+def therapy_report(days: List[Dict]) -> Dict:
+    """Totals and averages over the period, plus one entry per day"""
+    total = summarize(combine(days))
+    return {
+        "totalTherapyMinutes": total["therapy_minutes"],
+        "tensMinutes": total["tens_minutes"],
+        "microcurrentMinutes": total["microcurrent_minutes"],
+        "averageFrequency": total["avg_frequency"],
+        "averageIntensity": total["avg_intensity"],
+        "averagePulseWidth": total["avg_pulse_width"],
+        "averageEffectiveness": total["avg_effectiveness"],
+        "sessions": total["sessions"],
+        "days": [
+            {
+                "date": day["date"].date().isoformat(),
+                "sessions": summary["sessions"],
+                "therapyMinutes": summary["therapy_minutes"],
+                "tensMinutes": summary["tens_minutes"],
+                "microcurrentMinutes": summary["microcurrent_minutes"],
+                "averageEffectiveness": summary["avg_effectiveness"],
+            }
+            for day, summary in ((day, summarize(day)) for day in days)
+        ],
+    }
+
+
+def _trend_point(start: datetime, rollup: Dict) -> Dict:
+    summary = summarize(rollup)
+    pain = summary["pain"] or {}
+    return {
+        "date": start.date().isoformat(),
+        "recoveryIndex": summary["recovery_index"],
+        "painLevel": pain.get("mean"),
+        "painMin": pain.get("min"),
+        "painMax": pain.get("max"),
+        "objectivePain": summary["objective_pain"],
+        "sessions": summary["sessions"],
+        "therapyMinutes": summary["therapy_minutes"],
+    }
+
+
+def periods(days: List[Dict], start: datetime, length: int) -> List[Tuple[datetime, Dict]]:
+    """Group daily rollups into consecutive `length`-day periods from start; empty periods are skipped"""
+    start = day_of(start)
+    grouped: Dict[int, List[Dict]] = {}
+    for day in days:
+        grouped.setdefault((day["date"] - start).days // length, []).append(day)
+    return [
+        (start + timedelta(days=index * length), combine(group))
+        for index, group in sorted(grouped.items())
+    ]
+
+
+def trend(days: List[Dict], start: datetime, granularity: str) -> List[Dict]:
+    length = 7 if granularity == "week" else 1
+    return [_trend_point(period_start, rollup) for period_start, rollup in periods(days, start, length)]
+
+
+def progress(days: List[Dict], start: datetime) -> Dict:
+    """Weekly recovery/pain trend and daily subjective vs objective pain"""
+    weekly = []
+    for period_start, rollup in periods(days, start, 7):
+        point = _trend_point(period_start, rollup)
+        weekly.append({
+            "week": f"Tuần {(period_start - day_of(start)).days // 7 + 1}",
+            "start": point["date"],
+            "recoveryIndex": point["recoveryIndex"],
+            "painLevel": point["painLevel"],
+        })
+    comparison = []
+    for day in days:
+        summary = summarize(day)
+        if summary["pain"] is None and summary["objective_pain"] is None:
+            continue
+        comparison.append({
+            "date": day["date"].strftime("%d/%m"),
+            "subjective": summary["pain"]["mean"] if summary["pain"] else None,
+            "objective": summary["objective_pain"],
+        })
+    return {"weeklyTrend": weekly, "painComparison": comparison}
+
+
+class DailyRollups:
+    """
+    Incremental per-user daily rollups. Every document is keyed by
+    (user_id, date) and only ever changed with $inc/$min/$max upserts,
+    so concurrent writers never need a read-modify-write.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record_vitals(self, readings: Iterable[Dict]) -> None:
+        groups: Dict[Tuple[str, datetime], List[Dict]] = {}
+        for reading in readings:
+            groups.setdefault((reading["user_id"], day_of(reading["timestamp"])), []).append(reading)
+        if not groups:
+            return
+        operations = []
+        for (user_id, day), group in groups.items():
+            stats = {}
+            for field in VITAL_FIELDS:
+                values = [reading[field] for reading in group]
+                stats[field] = (sum(values), min(values), max(values))
+            operations.append(vitals_update(user_id, day, len(group), stats))
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def record_pain(self, user_id: str, pain_level: int, timestamp: datetime) -> None:
+        await self.collection.bulk_write([pain_update(user_id, day_of(timestamp), 1, pain_level, pain_level, pain_level)])
+
+    async def record_session(self, session: Dict) -> None:
+        """Count a completed session on the day it started"""
+        settings = session.get("settings") or {}
+        effectiveness = session.get("effectiveness")
+        await self.collection.bulk_write([session_update(
+            session["user_id"],
+            day_of(session["start_time"]),
+            session.get("session_type"),
+            1,
+            session.get("duration") or 0,
+            {
+                name: (settings[name], 1)
+                for name in SETTINGS
+                if isinstance(settings.get(name), (int, float))
+            },
+            (effectiveness, 1) if effectiveness is not None else (0, 0)
+        )])
+
+    async def days(self, user_id: str, start: datetime, end: datetime) -> List[Dict]:
+        """Daily rollups from start to end (both inclusive, by day), oldest first"""
+        return await self.collection.find(
+            {"user_id": user_id, "date": {"$gte": day_of(start), "$lte": day_of(end)}},
+            {"_id": 0}
+        ).sort("date", 1).to_list(None)
+
+    async def rebuild(self, db, vitals_store, start: datetime, end: datetime, user_id: Optional[str] = None) -> Dict:
+        """Recompute the rollups of every day in [start, end) from the source collections"""
+        start, end = day_of(start), day_of(end)
+        user_match = {"user_id": user_id} if user_id else {}
+        deleted = await self.collection.delete_many({**user_match, "date": {"$gte": start, "$lt": end}})
+
+        day = {"$dateTrunc": {"date": "$timestamp", "unit": "day"}}
+        operations = []
+
+        sessions = db.therapy_sessions.aggregate([
+            {"$match": {**user_match, "completed": True, "start_time": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "date": {"$dateTrunc": {"date": "$start_time", "unit": "day"}}, "type": "$session_type"},
+                "sessions": {"$sum": 1},
+                "minutes": {"$sum": {"$ifNull": ["$duration", 0]}},
+                **{f"{name}_sum": {"$sum": f"$settings.{name}"} for name in SETTINGS},
+                **{f"{name}_count": {"$sum": {"$cond": [{"$isNumber": f"$settings.{name}"}, 1, 0]}} for name in SETTINGS},
+                "effectiveness_sum": {"$sum": "$effectiveness"},
+                "effectiveness_count": {"$sum": {"$cond": [{"$isNumber": "$effectiveness"}, 1, 0]}},
+            }},
+        ])
+        async for row in sessions:
+            operations.append(session_update(
+                row["_id"]["user_id"], row["_id"]["date"], row["_id"].get("type"), row["sessions"], row["minutes"],
+                {name: (row[f"{name}_sum"], row[f"{name}_count"]) for name in SETTINGS},
+                (row["effectiveness_sum"], row["effectiveness_count"])
+            ))
+
+        pain = db.pain_history.aggregate([
+            {"$match": {**user_match, "timestamp": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "date": day},
+                "count": {"$sum": 1},
+                "sum": {"$sum": "$pain_level"},
+                "min": {"$min": "$pain_level"},
+                "max": {"$max": "$pain_level"},
+            }},
+        ])
+        async for row in pain:
+            operations.append(pain_update(row["_id"]["user_id"], row["_id"]["date"], row["count"], row["sum"], row["min"], row["max"]))
+
+        if vitals_store.mode == "bucket":
+            # One document per user-hour with the readings in `samples`
+            prefix = [
+                {"$match": {**user_match, "bucket_start": {"$gte": start, "$lt": end}}},
+                {"$unwind": "$samples"},
+                {"$replaceWith": {"$mergeObjects": ["$samples", {"user_id": "$user_id"}]}},
+            ]
+        else:
+            prefix = [{"$match": {**user_match, "timestamp": {"$gte": start, "$lt": end}}}]
+        vitals = vitals_store.collection.aggregate(prefix + [
+            {"$group": {
+                "_id": {"user_id": "$user_id", "date": day},
+                "count": {"$sum": 1},
+                **{f"{field}_{op}": {f"${op}": f"${field}"} for field in VITAL_FIELDS for op in ("sum", "min", "max")},
+            }},
+        ])
+        async for row in vitals:
+            operations.append(vitals_update(
+                row["_id"]["user_id"], row["_id"]["date"], row["count"],
+                {field: (row[f"{field}_sum"], row[f"{field}_min"], row[f"{field}_max"]) for field in VITAL_FIELDS}
+            ))
+
+        for offset in range(0, len(operations), 1000):
+            await self.collection.bulk_write(operations[offset:offset + 1000], ordered=False)
+        return {"deleted": deleted.deleted_count, "updates": len(operations)}
+
+
+def create_daily_rollups(db) -> DailyRollups:
+    return DailyRollups(db.daily_rollups)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since-days", type=int, default=90, help="rebuild this many days back, today included")
+    parser.add_argument("--user-id", default=None, help="only this user (default: everyone)")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    mongo = create_mongo_connections()
+    try:
+        db = mongo.database("background")
+        end = day_of(datetime.utcnow()) + timedelta(days=1)
+        stats = await create_daily_rollups(db).rebuild(
+            db, create_vitals_store(db), end - timedelta(days=args.since_days), end, args.user_id
+        )
+        logger.info(f"Rebuilt daily rollups: {stats}")
+    finally:
+        mongo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
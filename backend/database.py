@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import logging
+import threading
+import importlib.util
+from collections import deque
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
+
+logger = logging.getLogger(__name__)
+
+# Workloads with their own pool (MONGO_SEPARATE_POOLS=true) and settings:
+# ingest writes from the patch, dashboard reads, and the offline jobs
+WORKLOADS = ("ingest", "dashboard", "background")
+
+# Env suffix -> (client option, parser). Read as MONGO_<WORKLOAD>_<SUFFIX>,
+# falling back to MONGO_<SUFFIX>, falling back to the driver default.
+CLIENT_OPTIONS = {
+    "MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MIN_POOL_SIZE": ("minPoolSize", int),
+    "MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MAX_CONNECTING": ("maxConnecting", int),
+    "WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "COMPRESSORS": ("compressors", str),
+    "APP_NAME": ("appname", str),
+}
+
+# Dashboards tolerate replication lag; everything else reads its own writes
+DEFAULT_READ_PREFERENCES = {"ingest": "primary", "dashboard": "secondaryPreferred", "background": "primary"}
+
+# Collection -> write concern; collections not listed use the client default (w=1, journaled).
+# High-rate derived samples skip the journal wait; records a user typed in or
+# will act on wait for a majority. Override with MONGO_WRITE_CONCERNS (JSON).
+DEFAULT_WRITE_CONCERNS = {
+    "emg_data": {"w": 1, "j": False},
+    "temperature_data": {"w": 1, "j": False},
+    "hrv_features": {"w": 1, "j": False},
+    "user_profiles": {"w": "majority", "wtimeout": 5000},
+    "therapy_sessions": {"w": "majority", "wtimeout": 5000},
+    "alerts": {"w": "majority", "wtimeout": 5000},
+}
+
+# Compressor -> module it needs; zlib ships with Python
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+
+
+def _setting(workload: str, suffix: str) -> Optional[str]:
+    return os.environ.get(f"MONGO_{workload.upper()}_{suffix}", os.environ.get(f"MONGO_{suffix}"))
+
+
+def _compressors(value: str) -> str:
+    """Keep the compressors whose libraries are installed, in preference order"""
+    available = []
+    for name in (part.strip() for part in value.split(",")):
+        if name not in COMPRESSOR_MODULES:
+            logger.warning(f"Unknown MongoDB compressor {name}; ignoring")
+        elif COMPRESSOR_MODULES[name] and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is None:
+            logger.warning(f"MongoDB compressor {name} needs the {COMPRESSOR_MODULES[name]} package; ignoring")
+        else:
+            available.append(name)
+    return ",".join(available)
+
+
+def client_options(workload: str) -> Dict:
+    options = {}
+    for suffix, (option, parse) in CLIENT_OPTIONS.items():
+        value = _setting(workload, suffix)
+        if value:
+            options[option] = parse(value)
+    if "compressors" in options:
+        options["compressors"] = _compressors(options["compressors"])
+        if not options["compressors"]:
+            del options["compressors"]
+    return options
+
+
+def read_preference(workload: str):
+    name = _setting(workload, "READ_PREFERENCE") or DEFAULT_READ_PREFERENCES[workload]
+    max_staleness = _setting(workload, "MAX_STALENESS_SECONDS")
+    mode = read_pref_mode_from_name(name)
+    if max_staleness and name != "primary":
+        return make_read_preference(mode, None, max_staleness=int(max_staleness))
+    return make_read_preference(mode, None)
+
+
+def write_concerns() -> Dict[str, WriteConcern]:
+    specs = dict(DEFAULT_WRITE_CONCERNS)
+    if os.environ.get("MONGO_WRITE_CONCERNS"):
+        specs.update(json.loads(os.environ["MONGO_WRITE_CONCERNS"]))
+    return {collection: WriteConcern(**spec) for collection, spec in specs.items()}
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters and checkout wait times for one client. The
+    driver publishes a checkout's start and result on the thread doing
+    the checkout, so the wait is timed with a thread-local start time.
+    """
+
+    def __init__(self, samples: int = 1024):
+        self._started = threading.local()
+        self._waits = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checked_out": 0,
+            "pool_clears": 0,
+        }
+        self.failure_reasons: Dict[str, int] = {}
+        self.max_wait_ms = 0.0
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[counter] += amount
+
+    def _waited(self) -> float:
+        started = getattr(self._started, "value", None)
+        return (time.perf_counter() - started) * 1000 if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._waited()
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self.counters["checked_out"] += 1
+            self._waits.append(wait)
+            self.max_wait_ms = max(self.max_wait_ms, wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.counters["checkout_failures"] += 1
+            self.failure_reasons[event.reason] = self.failure_reasons.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        self._count("checked_out", -1)
+
+    def connection_created(self, event):
+        self._count("connections_created")
+
+    def connection_closed(self, event):
+        self._count("connections_closed")
+
+    def pool_cleared(self, event):
+        self._count("pool_clears")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = dict(self.counters)
+            stats["failure_reasons"] = dict(self.failure_reasons)
+        stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+        stats["wait_ms"] = {
+            "p50": round(waits[len(waits) // 2], 3) if waits else None,
+            "p99": round(waits[min(len(waits) - 1, int(len(waits) * 0.99))], 3) if waits else None,
+            "max": round(self.max_wait_ms, 3),
+        }
+        return stats
+
+
+class ConfiguredDatabase:
+    """
+    Database handle whose collections carry the configured write concern.
+    Attribute and item access return collections, as on a Motor database;
+    Motor's database methods (create_collection, command, ...) pass through.
+    """
+
+    def __init__(self, database: AsyncIOMotorDatabase, concerns: Dict[str, WriteConcern]):
+        self._database = database
+        self._concerns = concerns
+        self._collections = {}
+
+    def __getitem__(self, name: str):
+        collection = self._collections.get(name)
+        if collection is None:
+            concern = self._concerns.get(name)
+            collection = self._collections[name] = (
+                self._database.get_collection(name, write_concern=concern) if concern else self._database[name]
+            )
+        return collection
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if hasattr(type(self._database), name):
+            return getattr(self._database, name)
+        return self[name]
+
+
+class MongoConnections:
+    """One client per workload (or one shared client) plus its pool metrics"""
+
+    def __init__(self, url: str, db_name: str, separate_pools: bool = True):
+        self.url = url
+        self.db_name = db_name
+        self.separate_pools = separate_pools
+        self._concerns = write_concerns()
+        self._clients: Dict[str, AsyncIOMotorClient] = {}
+        self._metrics: Dict[str, PoolMetrics] = {}
+        self._databases: Dict[str, ConfiguredDatabase] = {}
+
+    def client(self, workload: str) -> AsyncIOMotorClient:
+        pool = workload if self.separate_pools else "shared"
+        client = self._clients.get(pool)
+        if client is None:
+            metrics = self._metrics[pool] = PoolMetrics()
+            options = client_options(workload if self.separate_pools else "shared")
+            client = self._clients[pool] = AsyncIOMotorClient(self.url, event_listeners=[metrics], **options)
+            logger.info(f"MongoDB {pool} pool: {options or 'driver defaults'}")
+        return client
+
+    def database(self, workload: str) -> ConfiguredDatabase:
+        if workload not in WORKLOADS:
+            raise ValueError(f"Unknown workload {workload}; expected one of {', '.join(WORKLOADS)}")
+        database = self._databases.get(workload)
+        if database is None:
+            database = self._databases[workload] = ConfiguredDatabase(
+                self.client(workload).get_database(self.db_name, read_preference=read_preference(workload)),
+                self._concerns
+            )
+        return database
+
+    def stats(self) -> Dict:
+        return {
+            pool: {"max_pool_size": self._clients[pool].options.pool_options.max_pool_size, **metrics.stats()}
+            for pool, metrics in self._metrics.items()
+        }
+
+    def close(self) -> None:
+        for client in self._clients.values():
+            client.close()
+
+
+def create_mongo_connections() -> MongoConnections:
+    return MongoConnections(
+        os.environ['MONGO_URL'],
+        os.environ['DB_NAME'],
+        separate_pools=os.environ.get("MONGO_SEPARATE_POOLS", "true").lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,86 @@
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# (collection, keys, options) for every index the API's hot query paths rely on
+INDEX_SPECS = [
+    ("vital_signs", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    ("emg_data", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    ("temperature_data", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    ("pain_history", [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    ("therapy_sessions", [("user_id", ASCENDING), ("start_time", DESCENDING), ("_id", DESCENDING)], {}),
+    ("therapy_sessions", [("id", ASCENDING)], {"unique": True}),
+    ("user_profiles", [("user_id", ASCENDING)], {"unique": True}),
+    ("status_checks", [("timestamp", DESCENDING), ("_id", DESCENDING)], {}),
+    ("vital_signs_buckets", [("user_id", ASCENDING), ("bucket_start", DESCENDING)], {"unique": True}),
+    ("recovery_state", [("user_id", ASCENDING)], {"unique": True}),
+    ("recovery_state", [("vitals_at", DESCENDING)], {}),
+    ("hrv_features", [("user_id", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ("hrv_state", [("user_id", ASCENDING)], {"unique": True}),
+    ("anomaly_state", [("user_id", ASCENDING)], {"unique": True}),
+    ("alerts", [("user_id", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ("alerts", [("id", ASCENDING)], {"unique": True}),
+    ("daily_rollups", [("user_id", ASCENDING), ("date", ASCENDING)], {"unique": True}),
+    # Mongo tier of the recommendation cache
+    ("ai_recommendations", [("fingerprint", ASCENDING), ("timestamp", DESCENDING)], {}),
+    ("ai_recommendations", [("user_id", ASCENDING), ("timestamp", DESCENDING)], {}),
+]
+
+# Indexes replaced by a spec above; pagination sorts on (field, _id), so the
+# old prefixes only cost writes now
+SUPERSEDED_INDEXES = [
+    ("vital_signs", "user_id_1_timestamp_-1"),
+    ("emg_data", "user_id_1_timestamp_-1"),
+    ("temperature_data", "user_id_1_timestamp_-1"),
+    ("pain_history", "user_id_1_timestamp_-1"),
+    ("therapy_sessions", "user_id_1_start_time_-1"),
+    ("status_checks", "timestamp_-1"),
+]
+
+
+async def ensure_indexes(db) -> List[Dict]:
+    """
+    Create all indexes in INDEX_SPECS and drop SUPERSEDED_INDEXES. create_index
+    is a no-op when an identical index already exists, so this is safe to run
+    on every startup.
+    """
+    results = []
+    for collection_name, keys, options in INDEX_SPECS:
+        try:
+            name = await db[collection_name].create_index(keys, **options)
+            results.append({"collection": collection_name, "index": name, "status": "ok"})
+        except OperationFailure as e:
+            # e.g. existing duplicates violating a unique index; keep going
+            logger.error(f"Failed to create index {keys} on {collection_name}: {str(e)}")
+            results.append({"collection": collection_name, "keys": keys, "status": "failed", "error": str(e)})
+    for collection_name, index_name in SUPERSEDED_INDEXES:
+        try:
+            await db[collection_name].drop_index(index_name)
+            results.append({"collection": collection_name, "index": index_name, "status": "dropped"})
+        except OperationFailure as e:
+            # NamespaceNotFound / IndexNotFound: nothing to drop, e.g. on a fresh
+            # database or after an earlier startup already dropped it
+            if e.code not in (26, 27):
+                logger.error(f"Failed to drop index {index_name} on {collection_name}: {str(e)}")
+    return results
+
+
+async def index_usage_report(db) -> Dict[str, List[Dict]]:
+    """Per-collection index usage counters from $indexStats"""
+    report = {}
+    for collection_name in sorted({spec[0] for spec in INDEX_SPECS}):
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        report[collection_name] = [
+            {
+                "name": stat["name"],
+                "key": dict(stat["key"]),
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"],
+            }
+            for stat in stats
+        ]
+    return report
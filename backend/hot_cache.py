@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from responses import dumps
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+NAMESPACES = ("vitals_latest", "profile", "insights")
+
+
+class LocalCacheBackend:
+    """In-process LRU/TTL backend; also the stand-in when Redis isn't configured"""
+
+    name = "local"
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._cache.delete(key)
+
+    async def clear(self) -> None:
+        self._cache.clear()
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+
+class RedisCacheBackend:
+    """Shared backend for any Redis-protocol server; values are stored as JSON"""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float = 30.0, prefix: str = "biopatch:"):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._redis.set(self.prefix + key, dumps(value), px=int((self.ttl if ttl is None else ttl) * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._redis.delete(*(self.prefix + key for key in keys))
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+class HotDataCache:
+    """
+    Read-through cache for per-user endpoint results. Writers call
+    invalidate() after every write touching the same user.
+
+    A read that started before an invalidation would otherwise write the
+    pre-write value back for a full TTL, so readers take generation()
+    before reading and pass it to set(), which drops the value if the key
+    was invalidated in between. Until the first fill after an
+    invalidation, fresh_read_required() tells readers that normally use a
+    secondary to read from the primary instead, so replication lag can't
+    put the pre-write value back either.
+
+    Generations are per process: with a shared backend, other workers
+    learn about a write from the invalidation bus (mark_invalidated()).
+    """
+
+    def __init__(self, backend, read_window: float = 60.0):
+        self.backend = backend
+        # How long a read can take; invalidations older than this can't race one
+        self.read_window = read_window
+        self.hits = {namespace: 0 for namespace in NAMESPACES}
+        self.misses = {namespace: 0 for namespace in NAMESPACES}
+        self.invalidations = 0
+        self.stale_fills = 0
+        self.errors = 0
+        self._generation = 0
+        # key -> [generation of the last invalidation, when, not filled since]
+        self._invalidated: "OrderedDict[str, list]" = OrderedDict()
+
+    @staticmethod
+    def key(namespace: str, user_id: str) -> str:
+        return f"{namespace}:{user_id}"
+
+    async def get(self, namespace: str, user_id: str) -> Optional[Any]:
+        try:
+            value = await self.backend.get(self.key(namespace, user_id))
+        except Exception as e:
+            # A cache outage degrades to a database read
+            self.errors += 1
+            logger.warning(f"Hot cache get failed: {str(e)}")
+            value = None
+        if value is None:
+            self.misses[namespace] += 1
+        else:
+            self.hits[namespace] += 1
+        return value
+
+    def generation(self) -> int:
+        """Token to take before reading the value that will be passed to set()"""
+        return self._generation
+
+    def fresh_read_required(self, namespace: str, user_id: str) -> bool:
+        """True until the first fill after an invalidation"""
+        entry = self._invalidated.get(self.key(namespace, user_id))
+        return entry is not None and entry[2]
+
+    async def set(self, namespace: str, user_id: str, value: Any, generation: int) -> None:
+        key = self.key(namespace, user_id)
+        entry = self._invalidated.get(key)
+        if entry is not None and entry[0] > generation:
+            # Read before the last invalidation: the value may predate the write
+            self.stale_fills += 1
+            return
+        try:
+            await self.backend.set(key, value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Hot cache set failed: {str(e)}")
+            return
+        if entry is not None:
+            entry[2] = False
+
+    def mark_invalidated(self, user_id: str, *namespaces: str) -> None:
+        """Start a new generation for these keys without touching the backend"""
+        self._generation += 1
+        now = time.monotonic()
+        for namespace in namespaces:
+            key = self.key(namespace, user_id)
+            self._invalidated[key] = [self._generation, now, True]
+            self._invalidated.move_to_end(key)
+        while self._invalidated:
+            key, (_, invalidated_at, _) = next(iter(self._invalidated.items()))
+            if now - invalidated_at < self.read_window:
+                break
+            del self._invalidated[key]
+
+    async def invalidate(self, user_id: str, *namespaces: str) -> None:
+        # Before the delete, so a read finishing in between can't fill the key
+        self.mark_invalidated(user_id, *namespaces)
+        try:
+            await self.backend.delete(*(self.key(namespace, user_id) for namespace in namespaces))
+            self.invalidations += len(namespaces)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Hot cache invalidation failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        namespaces = {}
+        for namespace in NAMESPACES:
+            lookups = self.hits[namespace] + self.misses[namespace]
+            namespaces[namespace] = {
+                "hits": self.hits[namespace],
+                "misses": self.misses[namespace],
+                "hit_ratio": self.hits[namespace] / lookups if lookups else 0.0,
+            }
+        hits = sum(self.hits.values())
+        lookups = hits + sum(self.misses.values())
+        return {
+            "backend": self.backend.name,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "stale_fills": self.stale_fills,
+            "errors": self.errors,
+            "namespaces": namespaces,
+        }
+
+
+def create_hot_cache() -> HotDataCache:
+    """Pick the backend from HOT_CACHE_BACKEND (local | redis)"""
+    ttl = float(os.environ.get("HOT_CACHE_TTL_SECONDS", "30"))
+    backend_name = os.environ.get("HOT_CACHE_BACKEND", "local").lower()
+    if backend_name == "redis":
+        try:
+            return HotDataCache(RedisCacheBackend(os.environ.get("HOT_CACHE_URL", "redis://localhost:6379/0"), ttl=ttl))
+        except ImportError:
+            logger.warning("HOT_CACHE_BACKEND=redis but the redis package is not installed; using local cache")
+    return HotDataCache(LocalCacheBackend(maxsize=int(os.environ.get("HOT_CACHE_SIZE", "10000")), ttl=ttl))
@@ -0,0 +1,228 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Frequency bands (Hz) for short-term HRV
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.40)
+RESAMPLE_HZ = 4.0
+
+# Features with a per-user baseline
+BASELINE_FEATURES = ("rmssd", "sdnn", "lf_hf")
+
+
+def _pad(windows: List[np.ndarray]) -> np.ndarray:
+    """Stack variable-length windows into a NaN-padded matrix"""
+    matrix = np.full((len(windows), max(len(window) for window in windows)), np.nan)
+    for row, window in enumerate(windows):
+        matrix[row, :len(window)] = window
+    return matrix
+
+
+def time_domain(rr: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    RMSSD, SDNN, pNN50 and mean heart rate for a NaN-padded
+    (windows, beats) matrix of RR intervals in milliseconds
+    """
+    diffs = np.diff(rr, axis=1)
+    valid = ~np.isnan(diffs)
+    successive = np.maximum(valid.sum(axis=1), 1)
+    squared = np.where(valid, diffs * diffs, 0.0)
+    over_50 = np.where(valid, np.abs(np.nan_to_num(diffs)) > 50.0, False)
+    return {
+        "rmssd": np.sqrt(squared.sum(axis=1) / successive),
+        "sdnn": np.nanstd(rr, axis=1, ddof=1),
+        "pnn50": over_50.sum(axis=1) / successive * 100.0,
+        "mean_hr": 60000.0 / np.nanmean(rr, axis=1),
+    }
+
+
+def frequency_domain(windows: List[np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    LF/HF power (ms²) per window: each RR series is interpolated onto an
+    evenly sampled grid, then all windows share one batched FFT
+    """
+    resampled = []
+    for rr in windows:
+        beat_times = np.cumsum(rr) / 1000.0
+        grid = np.arange(beat_times[0], beat_times[-1], 1.0 / RESAMPLE_HZ)
+        resampled.append(np.interp(grid, beat_times, rr) if len(grid) > 1 else np.zeros(2))
+
+    length = max(len(series) for series in resampled)
+    signal = np.zeros((len(resampled), length))
+    taper = np.zeros((len(resampled), length))
+    for row, series in enumerate(resampled):
+        signal[row, :len(series)] = series - series.mean()
+        taper[row, :len(series)] = np.hanning(len(series))
+    signal *= taper
+
+    spectrum = np.abs(np.fft.rfft(signal, axis=1)) ** 2
+    # One-sided periodogram normalised by the taper energy of each window
+    spectrum /= RESAMPLE_HZ * np.maximum((taper ** 2).sum(axis=1, keepdims=True), 1e-12)
+    spectrum[:, 1:] *= 2
+    frequencies = np.fft.rfftfreq(length, d=1.0 / RESAMPLE_HZ)
+    resolution = frequencies[1] - frequencies[0] if len(frequencies) > 1 else 0.0
+
+    def band_power(band):
+        mask = (frequencies >= band[0]) & (frequencies < band[1])
+        return spectrum[:, mask].sum(axis=1) * resolution
+
+    lf = band_power(LF_BAND)
+    hf = band_power(HF_BAND)
+    return {"lf": lf, "hf": hf, "lf_hf": np.divide(lf, hf, out=np.zeros_like(lf), where=hf > 0)}
+
+
+def ppg_to_rr(samples, sample_rate: float, refractory_s: float = 0.33) -> np.ndarray:
+    """RR intervals (ms) from a PPG waveform via vectorized systolic peak detection"""
+    ppg = np.asarray(samples, dtype=np.float64)
+    radius = max(1, int(refractory_s * sample_rate))
+    if ppg.size < 2 * radius + 1:
+        return np.empty(0)
+    ppg = ppg - ppg.mean()
+
+    # A sample is a beat if it is the maximum of the surrounding refractory
+    # window and clearly above the baseline
+    padded = np.pad(ppg, radius, mode="edge")
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1).max(axis=1)
+    peaks = np.flatnonzero((ppg == local_max) & (ppg > 0.5 * ppg.std()))
+    if peaks.size > 1:
+        # Plateaus produce adjacent equal maxima; keep the first of each
+        peaks = peaks[np.insert(np.diff(peaks) > radius, 0, True)]
+    return np.diff(peaks) / sample_rate * 1000.0
+
+
+def compute_features(rr_intervals, window_beats: int, min_beats: int) -> Optional[Dict[str, np.ndarray]]:
+    """Features of every full-enough beat window; a module-level function so it can run in the CPU pool"""
+    rr = np.asarray(rr_intervals, dtype=np.float64)
+    # Physiologically implausible intervals are artefacts
+    rr = rr[(rr >= 300) & (rr <= 2000)]
+    windows = [rr[start:start + window_beats] for start in range(0, len(rr), window_beats)]
+    windows = [window for window in windows if len(window) >= min_beats]
+    if not windows:
+        return None
+    features = time_domain(_pad(windows))
+    features.update(frequency_domain(windows))
+    features["beats"] = np.array([len(window) for window in windows])
+    features["duration_ms"] = np.array([window.sum() for window in windows])
+    return features
+
+
+def fold_baseline(baseline: Optional[Dict], features: Dict[str, np.ndarray], alpha: float) -> Dict:
+    """
+    Fold new windows, oldest first, into a per-feature EWMA mean/variance
+    (the same update the anomaly detector keeps per reading)
+    """
+    baseline = {name: dict(moments) for name, moments in (baseline or {}).items()}
+    for name in BASELINE_FEATURES:
+        for value in features[name].tolist():
+            moments = baseline.get(name)
+            if moments is None:
+                baseline[name] = {"mean": value, "var": 0.0}
+                continue
+            diff = value - moments["mean"]
+            increment = alpha * diff
+            moments["mean"] += increment
+            moments["var"] = (1 - alpha) * (moments["var"] + diff * increment)
+    return baseline
+
+
+class HRVEngine:
+    """
+    Splits incoming RR streams into fixed-size beat windows, computes
+    time- and frequency-domain features for all windows in one batch, and
+    keeps a per-user EWMA baseline that follows the user's recent windows
+    rather than their whole history.
+    """
+
+    FEATURES = ("rmssd", "sdnn", "pnn50", "mean_hr", "lf", "hf", "lf_hf")
+
+    def __init__(self, db, window_beats: int = 64, min_beats: int = 16, alpha: float = 0.02, max_retries: int = 5):
+        self.features_collection = db.hrv_features
+        self.state_collection = db.hrv_state
+        self.window_beats = window_beats
+        self.min_beats = min_beats
+        self.alpha = alpha
+        self.max_retries = max_retries
+
+    async def store(self, user_id: str, features: Optional[Dict[str, np.ndarray]], end_time: datetime, source: str = "rr") -> List[Dict]:
+        """Persist features computed by compute_features() and fold them into the baseline"""
+        if features is None:
+            return []
+
+        # Window end times, counting back from the end of the upload
+        elapsed = np.cumsum(features["duration_ms"])
+        offsets = (elapsed[-1] - elapsed).tolist()
+        columns = {name: np.round(features[name], 3).tolist() for name in self.FEATURES}
+        records = [
+            {
+                "user_id": user_id,
+                "timestamp": end_time - timedelta(milliseconds=offset),
+                "beats": beats,
+                "source": source,
+                **{name: columns[name][row] for name in self.FEATURES},
+            }
+            for row, (offset, beats) in enumerate(zip(offsets, features["beats"].tolist()))
+        ]
+        await self.features_collection.insert_many(records, ordered=False)
+        await self._update_state(user_id, features, records)
+        return records
+
+    async def _update_state(self, user_id: str, features: Dict[str, np.ndarray], records: List[Dict]) -> None:
+        """
+        Read-modify-write of the baseline, conditional on the window count
+        it was read at; a concurrent upload for the same user changes the
+        count (or, for a new user, hits the unique index) and we re-read
+        """
+        latest = {name: records[-1][name] for name in self.FEATURES}
+        for _ in range(self.max_retries):
+            state = await self.state_collection.find_one({"user_id": user_id}, {"baseline": 1, "windows": 1})
+            windows = state.get("windows", 0) if state else 0
+            try:
+                await self.state_collection.update_one(
+                    {"user_id": user_id, "windows": windows},
+                    {
+                        "$set": {
+                            "baseline": fold_baseline(state.get("baseline") if state else None, features, self.alpha),
+                            "windows": windows + len(records),
+                            "latest": latest,
+                            "updated_at": records[-1]["timestamp"],
+                        },
+                    },
+                    upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                continue
+        logger.warning(f"HRV baseline for {user_id} not updated: {self.max_retries} conflicting writes")
+
+    async def summary(self, user_id: str) -> Optional[Dict]:
+        """Latest window features plus the rolling baseline (mean/std per feature)"""
+        state = await self.state_collection.find_one({"user_id": user_id}, {"_id": 0})
+        if not state:
+            return None
+        baseline = {
+            name: {"mean": round(moments["mean"], 3), "std": round(max(moments["var"], 0.0) ** 0.5, 3)}
+            for name, moments in state.get("baseline", {}).items()
+        }
+        return {
+            "user_id": user_id,
+            "latest": state["latest"],
+            "baseline": baseline,
+            "windows": state["windows"],
+            "updated_at": state["updated_at"],
+        }
+
+
+def create_hrv_engine(db) -> HRVEngine:
+    return HRVEngine(
+        db,
+        window_beats=int(os.environ.get("HRV_WINDOW_BEATS", "64")),
+        min_beats=int(os.environ.get("HRV_MIN_BEATS", "16")),
+        alpha=float(os.environ.get("HRV_BASELINE_ALPHA", "0.02")),
+    )
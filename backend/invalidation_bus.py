@@ -0,0 +1,119 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# handler(user_id, scopes); user_id None means "drop everything", sent after
+# a reconnect because messages may have been missed while disconnected
+Handler = Callable[[Optional[str], Sequence[str]], Awaitable[None]]
+
+
+class LocalInvalidationBus:
+    """
+    Stand-in for a single worker: the writer already dropped its own
+    state, and there is nobody else to tell.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self._handlers: List[Handler] = []
+        self._metrics = {"published": 0, "received": 0, "errors": 0, "reconnects": 0}
+
+    def subscribe(self, handler: Handler) -> None:
+        self._handlers.append(handler)
+
+    async def publish(self, user_id: str, scopes: Sequence[str]) -> None:
+        self._metrics["published"] += 1
+
+    async def _dispatch(self, user_id: Optional[str], scopes: Sequence[str]) -> None:
+        self._metrics["received"] += 1
+        for handler in self._handlers:
+            try:
+                await handler(user_id, scopes)
+            except Exception as e:
+                self._metrics["errors"] += 1
+                logger.error(f"Invalidation handler failed: {str(e)}")
+
+    def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, **self._metrics}
+
+
+class RedisInvalidationBus(LocalInvalidationBus):
+    """
+    Fans per-user invalidations out to every worker over a Redis pub/sub
+    channel. Each worker ignores its own messages.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str = "biopatch:invalidate", retry_seconds: float = 1.0):
+        import redis.asyncio as redis
+
+        super().__init__()
+        self._redis = redis.from_url(url)
+        self.channel = channel
+        self.retry_seconds = retry_seconds
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, user_id: str, scopes: Sequence[str]) -> None:
+        message = json.dumps({"origin": self.origin, "user_id": user_id, "scopes": list(scopes)})
+        try:
+            await self._redis.publish(self.channel, message)
+            self._metrics["published"] += 1
+        except Exception as e:
+            # Other workers serve stale entries until their TTL expires
+            self._metrics["errors"] += 1
+            logger.warning(f"Invalidation publish failed: {str(e)}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    if connected_before:
+                        self._metrics["reconnects"] += 1
+                        await self._dispatch(None, ())
+                    connected_before = True
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        payload = json.loads(message["data"])
+                        if payload["origin"] != self.origin:
+                            await self._dispatch(payload["user_id"], payload["scopes"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Invalidation subscription lost: {str(e)}")
+                await asyncio.sleep(self.retry_seconds)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self._redis.close()
+
+
+def create_invalidation_bus():
+    """Pick the backend from INVALIDATION_BUS (local | redis)"""
+    if os.environ.get("INVALIDATION_BUS", "local").lower() == "redis":
+        url = os.environ.get("INVALIDATION_BUS_URL") or os.environ.get("HOT_CACHE_URL", "redis://localhost:6379/0")
+        try:
+            return RedisInvalidationBus(url)
+        except ImportError:
+            logger.warning("INVALIDATION_BUS=redis but the redis package is not installed; using local bus")
+    return LocalInvalidationBus()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set, Tuple
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    A single stream consumer. The queue is bounded; when a slow consumer
+    falls behind, the oldest pending event is dropped so producers never block.
+    """
+
+    def __init__(self, user_id: str, maxsize: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def push(self, event: Tuple[str, str]) -> bool:
+        dropped = False
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.queue.put_nowait(event)
+        return dropped
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """Next (event_type, json_text); None if the timeout elapses first"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class VitalsBroker:
+    """In-process pub/sub fanning ingest events out to live stream subscribers"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    def publish(self, user_id: str, event_type: str, data: Dict) -> None:
+        subscribers = self._subscribers.get(user_id)
+        self.published += 1
+        if not subscribers:
+            return
+        # Encode once, however many dashboards are watching
+        text = dumps({"type": event_type, "data": data}).decode("utf-8")
+        for subscription in subscribers:
+            if subscription.push((event_type, text)):
+                self.dropped += 1
+            self.delivered += 1
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "queue_size": self.queue_size,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+async def watch_change_stream(broker: VitalsBroker, collection, retry_delay: float = 5.0) -> None:
+    """
+    Feed the broker from a MongoDB change stream on the vitals collection, so
+    every worker sees readings ingested by any other worker. Requires a
+    replica set; runs until cancelled.
+    """
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    resume_token = None
+    while True:
+        try:
+            async with collection.watch(pipeline, resume_after=resume_token) as stream:
+                logger.info(f"Watching change stream on {collection.name}")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    document = change["fullDocument"]
+                    broker.publish(document["user_id"], "vitals", document)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Change stream on {collection.name} failed, retrying in {retry_delay}s: {str(e)}")
+            await asyncio.sleep(retry_delay)
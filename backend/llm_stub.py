@@ -0,0 +1,61 @@
+import json
+import asyncio
+from types import SimpleNamespace
+
+
+class StubGenAIClient:
+    """
+    Offline stand-in for google.genai.Client exposing the calls the
+    service makes (client.aio.models.generate_content[_stream]). Returns a fixed,
+    schema-conforming answer after a configurable delay so batch jobs and
+    load tests can run without a Gemini key or network.
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.calls = 0
+        self.aio = SimpleNamespace(models=SimpleNamespace(
+            generate_content=self.generate_content,
+            generate_content_stream=self.generate_content_stream
+        ))
+
+    async def generate_content(self, model: str, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = json.dumps(STUB_RESPONSE, ensure_ascii=False)
+        # Rough counts so token accounting can be exercised offline
+        usage = SimpleNamespace(
+            prompt_token_count=len(str(contents)) // 3,
+            cached_content_token_count=None,
+            candidates_token_count=len(text) // 3
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+        return self._chunks(response)
+
+    async def _chunks(self, response, size: int = 64):
+        text = response.text
+        for start in range(0, len(text), size):
+            await asyncio.sleep(0)
+            last = start + size >= len(text)
+            yield SimpleNamespace(text=text[start:start + size], usage_metadata=response.usage_metadata if last else None)
+
+
+STUB_RESPONSE = {
+    "recommendations": [
+        {
+            "id": 1,
+            "type": "therapy",
+            "priority": "medium",
+            "title": "Duy trì liệu trình hiện tại",
+            "description": "Tiếp tục TENS 20 phút/phiên với cường độ hiện tại.",
+            "actionType": "therapy_setting",
+            "actionText": "Xem cài đặt",
+            "rationale": "Phản hồi mẫu từ stub client"
+        }
+    ],
+    "summary": "Phản hồi mẫu từ stub client",
+    "alerts": []
+}
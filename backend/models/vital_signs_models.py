@@ -8,6 +8,14 @@ class InflammationLevel(str, Enum):
     MEDIUM = "medium"
     HIGH = "high"
 
+    @classmethod
+    def from_temperature(cls, temperature: float) -> "InflammationLevel":
+        if temperature >= 37.5:
+            return cls.HIGH
+        if temperature >= 37.0:
+            return cls.MEDIUM
+        return cls.LOW
+
 class EMGData(BaseModel):
     rms: float = Field(..., description="Root Mean Square (µV)")
     unit: str = Field(default="µV")
@@ -35,6 +43,20 @@ class VitalSignsReading(BaseModel):
     batteryLevel: Optional[float] = Field(None, ge=0, le=100, description="Device battery (%)")
     signalQuality: Optional[float] = Field(None, ge=0, le=100, description="Signal quality (%)")
 
+    @classmethod
+    def from_record(cls, record: dict) -> "VitalSignsReading":
+        """Build a reading from a stored vital_signs document"""
+        return cls(
+            id=str(record["_id"]),
+            userId=record["user_id"],
+            timestamp=record["timestamp"],
+            emg=EMGData(rms=record["emg_rms"]),
+            ppg=PPGData(heartRate=record["heart_rate"], hrv=record["hrv"]),
+            eda=EDAData(amplitude=record.get("eda_amplitude", 0.0), peakCount=record["eda_peaks"]),
+            temperature=record["temperature"],
+            inflammation=InflammationLevel.from_temperature(record["temperature"]),
+        )
+
 class VitalSignsCreate(BaseModel):
     userId: str
     emg: EMGData
@@ -50,6 +72,7 @@ class VitalSignsResponse(BaseModel):
     totalCount: int
     page: int
     pageSize: int
+    nextCursor: Optional[str] = Field(None, description="Cursor for the next page, absent on the last page")
 
 class LatestVitalSigns(BaseModel):
     userId: str
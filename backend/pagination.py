@@ -0,0 +1,108 @@
+import json
+import base64
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from responses import dumps
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class Cursor:
+    """Keyset position: the sort value and _id of the last row already returned"""
+
+    __slots__ = ("sort_value", "object_id", "page")
+
+    def __init__(self, sort_value: datetime, object_id: ObjectId, page: int):
+        self.sort_value = sort_value
+        self.object_id = object_id
+        self.page = page
+
+    def encode(self) -> str:
+        payload = {"t": self.sort_value.isoformat(), "i": str(self.object_id), "p": self.page}
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str) -> "Cursor":
+        """Parse an opaque cursor token; raises ValueError when malformed"""
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return cls(datetime.fromisoformat(payload["t"]), ObjectId(payload["i"]), int(payload["p"]))
+        except (ValueError, KeyError, TypeError, InvalidId) as e:
+            raise ValueError(f"Invalid cursor: {token}") from e
+
+    @classmethod
+    def after(cls, row: Dict, sort_field: str, page: int) -> "Cursor":
+        return cls(row[sort_field], row["_id"], page)
+
+
+def keyset_filter(sort_field: str, cursor: Optional[Cursor]) -> Dict:
+    """Rows strictly after the cursor in (sort_field desc, _id desc) order"""
+    if cursor is None:
+        return {}
+    return {
+        "$or": [
+            {sort_field: {"$lt": cursor.sort_value}},
+            {sort_field: cursor.sort_value, "_id": {"$lt": cursor.object_id}},
+        ]
+    }
+
+
+def keyset_sort(sort_field: str) -> List[Tuple[str, int]]:
+    return [(sort_field, -1), ("_id", -1)]
+
+
+def clamp_page_size(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE) -> int:
+    if limit is None:
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+async def fetch_page(
+    collection,
+    query: Dict,
+    sort_field: str,
+    limit: int,
+    cursor: Optional[Cursor]
+) -> Tuple[List[Dict], Optional[str]]:
+    """One keyset page, newest first, plus the cursor for the next page (None at the end)"""
+    rows = await collection.find(
+        {**query, **keyset_filter(sort_field, cursor)}
+    ).sort(keyset_sort(sort_field)).limit(limit + 1).to_list(limit + 1)
+    return page_result(rows, sort_field, limit, cursor)
+
+
+def page_result(
+    rows: List[Dict],
+    sort_field: str,
+    limit: int,
+    cursor: Optional[Cursor]
+) -> Tuple[List[Dict], Optional[str]]:
+    """Trim the look-ahead row fetched with limit + 1 and build the next cursor"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    page = cursor.page + 1 if cursor else 2
+    return rows, Cursor.after(rows[-1], sort_field, page).encode()
+
+
+def ndjson_line(document: Dict) -> bytes:
+    return dumps(document) + b"\n"
+
+
+async def stream_ndjson(
+    rows: AsyncIterator[Dict],
+    transform: Optional[Callable[[Dict], Any]] = None
+) -> AsyncIterator[bytes]:
+    """Encode rows one at a time as they come off the database cursor"""
+    async for row in rows:
+        if transform is None:
+            yield ndjson_line(row)
+        else:
+            yield transform(row)
@@ -0,0 +1,205 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Fixed instructions, sent once per request as the system instruction (or
+# once per cache lifetime with context caching) instead of in the prompt
+SYSTEM_INSTRUCTION = """You are a medical AI assistant specialized in pain management and physiotherapy for the BioPatch smart pain monitoring system.
+
+Analyze the patient data in the user message and generate 3-4 personalized recommendations in Vietnamese. Focus on:
+1. Therapy adjustments (TENS/Microcurrent settings)
+2. Lifestyle modifications
+3. Exercise recommendations
+4. Safety alerts if needed
+
+Base recommendations on EMG levels, heart rate variability, temperature readings, and previous therapy effectiveness. Sections missing from the patient data had no measurements; do not assume values for them.
+
+Return JSON format with this exact structure:
+{
+  "recommendations": [
+    {
+      "id": 1,
+      "type": "therapy|lifestyle|exercise|safety",
+      "priority": "high|medium|low",
+      "title": "Vietnamese title",
+      "description": "Vietnamese description",
+      "actionType": "therapy_setting|exercise|guide|article",
+      "actionText": "Vietnamese action button text",
+      "rationale": "Why this recommendation is important"
+    }
+  ],
+  "summary": "Overall health assessment in Vietnamese",
+  "alerts": ["Any safety concerns in Vietnamese"]
+}"""
+
+HISTORY_DAYS = 7
+
+
+class Prompt(NamedTuple):
+    text: str
+    estimated_tokens: int
+    dropped_sections: List[str]
+    over_budget: bool
+
+
+def _lines(*rows: Tuple[str, Optional[object], str]) -> List[str]:
+    """Render "label: value unit" rows, skipping values that were never measured"""
+    return [f"- {label}: {value}{unit}" for label, value, unit in rows if value is not None]
+
+
+def _patient(user_data: Dict) -> List[str]:
+    return _lines(
+        ("Tuổi", user_data.get("age"), ""),
+        ("Giới tính", user_data.get("gender"), ""),
+        ("Vùng đau", user_data.get("pain_location"), ""),
+        ("Mức độ đau chủ quan", user_data.get("pain_level"), "/10"),
+    )
+
+
+def _vitals(user_data: Dict) -> List[str]:
+    lines = _lines(
+        ("EMG RMS", user_data.get("emg_rms"), " µV"),
+        ("Nhịp tim", user_data.get("heart_rate"), " bpm"),
+        ("HRV", user_data.get("hrv"), " ms"),
+        ("EDA peaks", user_data.get("eda_peaks"), ""),
+        ("Nhiệt độ vùng đau", user_data.get("temperature"), "°C"),
+        ("Tình trạng viêm", user_data.get("inflammation"), ""),
+        ("Điểm phục hồi", user_data.get("recovery_score"), "/100"),
+    )
+    if user_data.get("hrv_sdnn") is not None:
+        lines.append(
+            f"- HRV chi tiết: SDNN {user_data['hrv_sdnn']} ms, "
+            f"pNN50 {user_data.get('hrv_pnn50')}%, LF/HF {user_data.get('hrv_lf_hf')}"
+        )
+    return lines
+
+
+def _history(user_data: Dict) -> List[str]:
+    return _lines(
+        ("Số buổi trị liệu", user_data.get("sessions_7d"), ""),
+        ("Tổng thời gian TENS", user_data.get("tens_minutes"), " phút"),
+        ("Tổng thời gian Microcurrent", user_data.get("microcurrent_minutes"), " phút"),
+        ("Tần số trung bình", user_data.get("avg_frequency"), " Hz"),
+        ("Cường độ trung bình", user_data.get("avg_intensity"), "%"),
+    )
+
+
+def _trends(user_data: Dict) -> List[str]:
+    return _lines(
+        ("Xu hướng đau", user_data.get("pain_trend"), ""),
+        ("Hiệu quả trị liệu", user_data.get("therapy_effectiveness"), ""),
+        ("Căng cơ cao điểm", user_data.get("muscle_tension_peaks"), " lần/ngày"),
+    )
+
+
+# (name, heading, renderer, droppable), in prompt order. Droppable sections
+# are removed from the end first when the prompt is over budget.
+SECTIONS: List[Tuple[str, str, Callable[[Dict], List[str]], bool]] = [
+    ("patient", "THÔNG TIN BỆNH NHÂN", _patient, False),
+    ("vitals", "DỮ LIỆU SINH LÝ HIỆN TẠI", _vitals, False),
+    ("history", f"LỊCH SỬ LIỆU PHÁP ({HISTORY_DAYS} NGÀY QUA)", _history, True),
+    ("trends", "XU HƯỚNG", _trends, True),
+]
+
+
+class PromptBuilder:
+    """
+    Renders the per-patient user message under a token budget. Tokens are
+    estimated locally from the character count (Vietnamese text with
+    diacritics runs at roughly 3 characters per token); the exact counts
+    come back in the response's usage metadata.
+    """
+
+    def __init__(self, token_budget: int = 400, chars_per_token: float = 3.0):
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    def build(self, user_data: Dict) -> Prompt:
+        sections = []
+        for name, heading, render, droppable in SECTIONS:
+            lines = render(user_data)
+            if lines:
+                sections.append((name, heading + ":\n" + "\n".join(lines), droppable))
+
+        dropped = []
+        while True:
+            text = "Phân tích dữ liệu bệnh nhân BioPatch:\n\n" + "\n\n".join(body for _, body, _ in sections)
+            tokens = self.estimate_tokens(text)
+            droppable = [index for index, (_, _, can_drop) in enumerate(sections) if can_drop]
+            if tokens <= self.token_budget or not droppable:
+                return Prompt(text, tokens, dropped, tokens > self.token_budget)
+            dropped.append(sections.pop(droppable[-1])[0])
+
+
+def _pain_trend(first_half: Optional[float], second_half: Optional[float]) -> Optional[str]:
+    if first_half is None or second_half is None:
+        return None
+    if second_half < first_half - 0.5:
+        return "Cải thiện"
+    if second_half > first_half + 0.5:
+        return "Xấu đi"
+    return "Ổn định"
+
+
+def _effectiveness_label(effectiveness: Optional[float]) -> Optional[str]:
+    if effectiveness is None:
+        return None
+    if effectiveness >= 75:
+        return "Tốt"
+    if effectiveness >= 50:
+        return "Trung bình"
+    return "Kém"
+
+
+async def weekly_history(db, user_id: str, days: int = HISTORY_DAYS) -> Dict:
+    """
+    Therapy history and trend fields for the prompt, aggregated server-side
+    over the last `days` days. Fields without data are None and are left
+    out of the prompt.
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(days=days)
+    midpoint = now - timedelta(days=days / 2)
+
+    sessions, pain, tension = await asyncio.gather(
+        db.therapy_sessions.aggregate([
+            {"$match": {"user_id": user_id, "start_time": {"$gte": since}}},
+            {"$group": {
+                "_id": "$session_type",
+                "sessions": {"$sum": 1},
+                "minutes": {"$sum": {"$ifNull": ["$duration", 0]}},
+                "frequency": {"$avg": "$settings.frequency"},
+                "intensity": {"$avg": "$settings.intensity"},
+                "effectiveness": {"$avg": "$effectiveness"},
+            }},
+        ]).to_list(None),
+        db.pain_history.aggregate([
+            {"$match": {"user_id": user_id, "timestamp": {"$gte": since}}},
+            {"$group": {"_id": {"$gte": ["$timestamp", midpoint]}, "pain_level": {"$avg": "$pain_level"}}},
+        ]).to_list(None),
+        db.emg_data.count_documents({"user_id": user_id, "timestamp": {"$gte": since}, "peak": True}),
+    )
+
+    by_type = {row["_id"]: row for row in sessions}
+    total_sessions = sum(row["sessions"] for row in sessions)
+
+    def weighted(field: str) -> Optional[float]:
+        rows = [row for row in sessions if row.get(field) is not None]
+        if not rows:
+            return None
+        return round(sum(row[field] * row["sessions"] for row in rows) / sum(row["sessions"] for row in rows), 1)
+
+    pain_by_half = {row["_id"]: row["pain_level"] for row in pain}
+    return {
+        "sessions_7d": total_sessions,
+        "tens_minutes": by_type.get("TENS", {}).get("minutes", 0),
+        "microcurrent_minutes": by_type.get("Microcurrent", {}).get("minutes", 0),
+        "avg_frequency": weighted("frequency"),
+        "avg_intensity": weighted("intensity"),
+        "pain_trend": _pain_trend(pain_by_half.get(False), pain_by_half.get(True)),
+        "therapy_effectiveness": _effectiveness_label(weighted("effectiveness")),
+        "muscle_tension_peaks": round(tension / days, 1),
+    }
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+async def fan_out(
+    queries: Dict[str, Awaitable],
+    timeout: float,
+    defaults: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Run independent queries concurrently, each bounded by `timeout` seconds.
+
+    A query that fails or times out is replaced by its entry in `defaults`
+    (an empty list unless given) instead of failing the whole request.
+    Returns the results keyed like `queries` and the keys that fell back.
+    """
+    defaults = defaults or {}
+    keys = list(queries)
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(queries[key], timeout=timeout) for key in keys),
+        return_exceptions=True
+    )
+
+    results = {}
+    failed = []
+    for key, outcome in zip(keys, outcomes):
+        if isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            reason = "timed out" if isinstance(outcome, asyncio.TimeoutError) else str(outcome)
+            logger.warning(f"Query '{key}' failed, using fallback: {reason}")
+            results[key] = defaults.get(key, [])
+            failed.append(key)
+        else:
+            results[key] = outcome
+    return results, failed
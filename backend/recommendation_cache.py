@@ -0,0 +1,173 @@
+import os
+import copy
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from ttl_cache import TTLCache
+
+# Bucket width per numeric prompt input. Readings that land in the same
+# bucket produce the same prompt for all practical purposes, so they share
+# a cached answer.
+QUANTIZATION_STEPS = {
+    "age": 5,
+    "pain_level": 1,
+    "emg_rms": 5.0,
+    "heart_rate": 5,
+    "hrv": 5.0,
+    "hrv_sdnn": 5.0,
+    "hrv_pnn50": 5.0,
+    "hrv_lf_hf": 0.5,
+    "eda_peaks": 3,
+    "temperature": 0.2,
+    "recovery_score": 5,
+    "tens_minutes": 15,
+    "microcurrent_minutes": 15,
+    "avg_frequency": 5,
+    "avg_intensity": 5,
+    "muscle_tension_peaks": 1,
+}
+
+# Categorical prompt inputs, used verbatim
+PROFILE_FIELDS = (
+    "gender",
+    "pain_location",
+    "inflammation",
+    "pain_trend",
+    "therapy_effectiveness",
+)
+
+
+def quantize(value, step):
+    """Snap a numeric value to the lower edge of its bucket"""
+    if value is None:
+        return None
+    try:
+        return round((float(value) // step) * step, 6)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def fingerprint(user_data: Dict) -> str:
+    """Stable hash of the quantized prompt inputs"""
+    state = {field: quantize(user_data.get(field), step) for field, step in QUANTIZATION_STEPS.items()}
+    state.update({field: user_data.get(field) for field in PROFILE_FIELDS})
+    encoded = json.dumps(state, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class RecommendationCache:
+    """
+    Two-tier cache for generated recommendations: an in-process TTL/LRU
+    tier and an optional MongoDB tier backed by the ai_recommendations
+    collection (records carry the fingerprint they were generated for).
+
+    Records written by the batch job are flagged precomputed. The user's
+    newest one is served when it was generated for the same fingerprint
+    and no reading has arrived since, for up to precomputed_ttl.
+    """
+
+    def __init__(
+        self,
+        collection=None,
+        maxsize: int = 1024,
+        ttl: float = 900.0,
+        precomputed_ttl: float = 86400.0,
+        precomputed_collection=None
+    ):
+        self.collection = collection
+        self.precomputed_collection = precomputed_collection
+        self.ttl = ttl
+        self.precomputed_ttl = precomputed_ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.mongo_hits = 0
+        self.mongo_misses = 0
+        self.precomputed_hits = 0
+        self.precomputed_misses = 0
+
+    async def get(self, user_data: Dict, vitals_at: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Cached answer for this patient state. vitals_at is the time of the
+        user's latest reading; without it precomputed answers are skipped.
+        """
+        key = fingerprint(user_data)
+        cached = self._local.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
+        if vitals_at is not None and self.precomputed_collection is not None:
+            precomputed = await self._precomputed(user_data["user_id"], key, vitals_at)
+            if precomputed is not None:
+                return precomputed
+
+        if self.collection is None:
+            return None
+
+        now = datetime.utcnow()
+        record = await self.collection.find_one(
+            {
+                "fingerprint": key,
+                "cached": {"$ne": True},
+                "recommendations.source": {"$nin": ["fallback", "rules"]},
+                "recommendations.repaired": {"$ne": True},
+                "recommendations.partial": {"$ne": True},
+                "timestamp": {"$gte": now - timedelta(seconds=max(self.ttl, self.precomputed_ttl))},
+            },
+            {"recommendations": 1, "timestamp": 1, "precomputed": 1},
+            sort=[("timestamp", -1)]
+        )
+        ttl = self.precomputed_ttl if record and record.get("precomputed") else self.ttl
+        if not record or record["timestamp"] < now - timedelta(seconds=ttl):
+            self.mongo_misses += 1
+            return None
+
+        self.mongo_hits += 1
+        remaining = ttl - (now - record["timestamp"]).total_seconds()
+        self._local.set(key, record["recommendations"], ttl=max(remaining, 0.0))
+        return copy.deepcopy(record["recommendations"])
+
+    async def _precomputed(self, user_id: str, key: str, vitals_at: datetime) -> Optional[Dict]:
+        now = datetime.utcnow()
+        record = await self.precomputed_collection.find_one(
+            {
+                "user_id": user_id,
+                "precomputed": True,
+                "timestamp": {"$gte": max(vitals_at, now - timedelta(seconds=self.precomputed_ttl))},
+            },
+            {"recommendations": 1, "fingerprint": 1},
+            sort=[("timestamp", -1)]
+        )
+        # The request can differ from the stored state the job read (profile
+        # fields, client-side vitals), and then the answer isn't for it
+        if not record or record.get("fingerprint") != key:
+            self.precomputed_misses += 1
+            return None
+        self.precomputed_hits += 1
+        return record["recommendations"]
+
+    def set(self, user_data: Dict, recommendations: Dict) -> None:
+        self._local.set(fingerprint(user_data), copy.deepcopy(recommendations))
+
+    def stats(self) -> Dict:
+        stats = self._local.stats()
+        stats["mongo_enabled"] = self.collection is not None
+        stats["mongo_hits"] = self.mongo_hits
+        stats["mongo_misses"] = self.mongo_misses
+        stats["precomputed_enabled"] = self.precomputed_collection is not None
+        stats["precomputed_hits"] = self.precomputed_hits
+        stats["precomputed_misses"] = self.precomputed_misses
+        return stats
+
+
+def create_recommendation_cache(db) -> RecommendationCache:
+    """Build the cache from environment configuration"""
+    use_mongo = os.environ.get("RECOMMENDATION_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+    use_precomputed = os.environ.get("RECOMMENDATION_PRECOMPUTED", "true").lower() in ("1", "true", "yes")
+    return RecommendationCache(
+        collection=db.ai_recommendations if use_mongo else None,
+        maxsize=int(os.environ.get("RECOMMENDATION_CACHE_SIZE", "1024")),
+        ttl=float(os.environ.get("RECOMMENDATION_CACHE_TTL_SECONDS", "900")),
+        precomputed_ttl=float(os.environ.get("RECOMMENDATION_PRECOMPUTED_TTL_SECONDS", "86400")),
+        precomputed_collection=db.ai_recommendations if use_precomputed else None,
+    )
@@ -0,0 +1,170 @@
+import os
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "recommendation_rules.json"
+
+# Condition operator -> (bound, inclusive)
+OPERATORS = {
+    "gt": ("low", False),
+    "gte": ("low", True),
+    "lt": ("high", False),
+    "lte": ("high", True),
+}
+
+# Reasons a patient state is escalated to the LLM instead of served by rules
+ESCALATION_REASONS = ("missing", "out_of_range", "borderline", "escalate_rule", "complex")
+
+
+class RuleBatch(NamedTuple):
+    fired: np.ndarray        # (rows, rules) rule matched
+    reasons: Dict[str, np.ndarray]  # reason -> (rows,) escalation flag
+    conclusive: np.ndarray   # (rows,) True when rules alone can answer
+
+
+class RuleDecision(NamedTuple):
+    response: Dict
+    conclusive: bool
+    reasons: List[str]
+
+
+class _TemplateValues(dict):
+    def __missing__(self, key):
+        return "?"
+
+
+class RuleEngine:
+    """
+    Declarative recommendation rules compiled into NumPy arrays. Every
+    condition is a (feature, lower bound, upper bound) interval; a rule
+    fires when all of its conditions hold, which for a batch of patient
+    states is one comparison pass plus a matrix product with the
+    condition -> rule incidence matrix.
+
+    A state is conclusive when rules alone can answer it: every feature
+    the rules read is present and inside the range the rules were written
+    for, no value sits within the configured margin of a threshold, no
+    escalation rule fired, and at most max_high_priority high-priority
+    rules fired at once.
+    """
+
+    def __init__(self, config: Dict):
+        self.features: List[str] = list(config["features"])
+        self.rules: List[Dict] = config["rules"]
+        self.summary_template: str = config.get("summary", "")
+        self.max_high_priority: int = config.get("max_high_priority", 1)
+        self._compile(config)
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES_PATH) -> "RuleEngine":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _compile(self, config: Dict) -> None:
+        feature_index = {feature: index for index, feature in enumerate(self.features)}
+        cond_feature, cond_rule, low, high, low_inclusive, high_inclusive = [], [], [], [], [], []
+        for rule_index, rule in enumerate(self.rules):
+            for feature, operators in rule.get("when", {}).items():
+                if feature not in feature_index:
+                    raise ValueError(f"Rule {rule['id']} uses unknown feature {feature}")
+                bounds = {"low": (-math.inf, False), "high": (math.inf, False)}
+                for operator, value in operators.items():
+                    if operator not in OPERATORS:
+                        raise ValueError(f"Rule {rule['id']} uses unknown operator {operator}")
+                    bound, inclusive = OPERATORS[operator]
+                    bounds[bound] = (float(value), inclusive)
+                cond_feature.append(feature_index[feature])
+                cond_rule.append(rule_index)
+                low.append(bounds["low"][0])
+                low_inclusive.append(bounds["low"][1])
+                high.append(bounds["high"][0])
+                high_inclusive.append(bounds["high"][1])
+
+        self._cond_feature = np.array(cond_feature, dtype=np.intp)
+        self._low = np.array(low)
+        self._high = np.array(high)
+        self._low_inclusive = np.array(low_inclusive, dtype=bool)
+        self._high_inclusive = np.array(high_inclusive, dtype=bool)
+
+        self._incidence = np.zeros((len(cond_feature), len(self.rules)))
+        self._incidence[np.arange(len(cond_rule)), cond_rule] = 1.0
+        self._required = self._incidence.sum(axis=0)
+
+        margins = config.get("margins", {})
+        self._margin = np.array([margins.get(self.features[index], 0.0) for index in cond_feature])
+        ranges = config.get("known_ranges", {})
+        self._known_low = np.array([ranges.get(feature, [-math.inf, math.inf])[0] for feature in self.features], dtype=float)
+        self._known_high = np.array([ranges.get(feature, [-math.inf, math.inf])[1] for feature in self.features], dtype=float)
+        self._used = np.zeros(len(self.features), dtype=bool)
+        self._used[self._cond_feature] = True
+
+        self._escalate = np.array([bool(rule.get("escalate")) for rule in self.rules])
+        self._high_priority = np.array([
+            rule.get("recommendation", {}).get("priority") == "high" for rule in self.rules
+        ])
+
+    def vector(self, user_data: Dict) -> np.ndarray:
+        values = np.full(len(self.features), np.nan)
+        for index, feature in enumerate(self.features):
+            try:
+                values[index] = float(user_data[feature])
+            except (KeyError, TypeError, ValueError):
+                pass
+        return values
+
+    def evaluate_batch(self, states: np.ndarray) -> RuleBatch:
+        """Evaluate a (rows, features) matrix of patient states"""
+        states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+        values = states[:, self._cond_feature]
+        with np.errstate(invalid="ignore"):
+            satisfied = (
+                np.where(self._low_inclusive, values >= self._low, values > self._low)
+                & np.where(self._high_inclusive, values <= self._high, values < self._high)
+            )
+            fired = satisfied.astype(np.float64) @ self._incidence >= self._required
+            distance = np.minimum(np.abs(values - self._low), np.abs(values - self._high))
+
+        reasons = {
+            "missing": np.isnan(states[:, self._used]).any(axis=1),
+            "out_of_range": ((states < self._known_low) | (states > self._known_high)).any(axis=1),
+            "borderline": (distance < self._margin).any(axis=1),
+            "escalate_rule": (fired & self._escalate).any(axis=1),
+            "complex": (fired & self._high_priority).sum(axis=1) > self.max_high_priority,
+        }
+        conclusive = ~np.logical_or.reduce(list(reasons.values()))
+        return RuleBatch(fired=fired, reasons=reasons, conclusive=conclusive)
+
+    def render(self, user_data: Dict, fired: np.ndarray, source: str) -> Dict:
+        """Build a recommendation response from the rules that fired"""
+        recommendations = []
+        alerts = []
+        for rule_index in np.flatnonzero(fired):
+            rule = self.rules[rule_index]
+            if "recommendation" in rule:
+                recommendations.append({"id": len(recommendations) + 1, **rule["recommendation"]})
+            if "alert" in rule:
+                alerts.append(rule["alert"])
+        return {
+            "recommendations": recommendations,
+            "summary": self.summary_template.format_map(_TemplateValues(user_data)),
+            "alerts": alerts,
+            "source": source,
+            "rules": [self.rules[rule_index]["id"] for rule_index in np.flatnonzero(fired)],
+        }
+
+    def evaluate(self, user_data: Dict, source: str = "rules") -> RuleDecision:
+        batch = self.evaluate_batch(self.vector(user_data))
+        reasons = [reason for reason, flags in batch.reasons.items() if flags[0]]
+        return RuleDecision(
+            response=self.render(user_data, batch.fired[0], source),
+            conclusive=bool(batch.conclusive[0]),
+            reasons=reasons,
+        )
+
+
+def load_rule_engine(path: Optional[str] = None) -> RuleEngine:
+    return RuleEngine.from_file(path or os.environ.get("RECOMMENDATION_RULES_PATH", DEFAULT_RULES_PATH))
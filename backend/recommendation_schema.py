@@ -0,0 +1,147 @@
+import json
+from typing import Dict, Iterator, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class Recommendation(BaseModel):
+    id: int
+    type: Literal["therapy", "lifestyle", "exercise", "safety"]
+    priority: Literal["high", "medium", "low"]
+    title: str
+    description: str
+    actionType: Literal["therapy_setting", "exercise", "guide", "article"]
+    actionText: str
+    rationale: str
+
+
+class RecommendationResponse(BaseModel):
+    """Response schema requested from the LLM and validated on the way back"""
+    recommendations: List[Recommendation] = Field(..., min_length=1)
+    summary: str = ""
+    alerts: List[str] = Field(default_factory=list)
+
+
+def loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def strip_fences(text: str) -> str:
+    """Tolerate a ```json fence even though JSON mode shouldn't produce one"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+class IncrementalJSONScanner:
+    """
+    Single-pass scanner over a JSON document arriving in chunks. Tracks
+    string/escape state and the container stack so it can (a) emit each
+    element of the top-level "recommendations" array the moment its closing
+    brace arrives and (b) cut a truncated document back to the last complete
+    value for repair. Each character is examined once across all chunks.
+    """
+
+    def __init__(self, array_key: str = "recommendations"):
+        self.array_key = array_key
+        self.text = ""
+        self._position = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._top_key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        # (end offset, open containers) after the last complete value
+        self._safe_point: Tuple[int, List[str]] = (0, [])
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        """Append a chunk; yield the raw text of every array item it completes"""
+        self.text += chunk
+        text = self.text
+        stack = self._stack
+        for index in range(self._position, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:index]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char == ":":
+                if len(stack) == 1:
+                    self._top_key = self._last_string
+            elif char in "{[":
+                stack.append(char)
+                if char == "{" and self._in_items():
+                    self._item_start = index
+            elif char in "}]":
+                if char == "}" and self._in_items() and self._item_start is not None:
+                    yield text[self._item_start:index + 1]
+                    self._item_start = None
+                if stack:
+                    stack.pop()
+                self._safe_point = (index + 1, list(stack))
+            elif char == ",":
+                self._safe_point = (index, list(stack))
+        self._position = len(text)
+
+    def _in_items(self) -> bool:
+        stack = self._stack
+        return len(stack) == 3 and stack[0] == "{" and stack[1] == "[" and self._top_key == self.array_key
+
+    @property
+    def complete(self) -> bool:
+        return not self._stack and self._safe_point[0] > 0
+
+    def repaired(self) -> str:
+        """The document cut back to its last complete value with open containers closed"""
+        end, stack = self._safe_point
+        closers = "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+        return self.text[:end].rstrip().rstrip(",") + closers
+
+
+def parse_response(text: str) -> Tuple[RecommendationResponse, bool]:
+    """
+    Parse and validate an LLM answer. A truncated answer is repaired by
+    dropping the incomplete tail; returns (response, repaired). Raises
+    ValueError (pydantic's ValidationError included) when nothing usable is left.
+    """
+    text = strip_fences(text)
+    try:
+        return RecommendationResponse.model_validate(loads(text)), False
+    except ValueError as e:
+        scanner = IncrementalJSONScanner()
+        items = [item for item in map(parse_item, scanner.feed(text)) if item is not None]
+        if scanner.complete:
+            raise e
+        repaired = loads(scanner.repaired())
+        if not isinstance(repaired, dict):
+            raise e
+        # Keep only the recommendations that arrived complete
+        repaired["recommendations"] = items
+        return RecommendationResponse.model_validate(repaired), True
+
+
+def parse_item(text: str) -> Optional[Dict]:
+    """Validate one streamed recommendation; None if it doesn't match the schema"""
+    try:
+        return Recommendation.model_validate(loads(text)).model_dump()
+    except ValueError:
+        return None
@@ -0,0 +1,169 @@
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Component -> (weight, value giving 0 points, value giving 100 points)
+SCORE_COMPONENTS = {
+    "pain_level": (0.35, 10.0, 0.0),
+    "emg_rms": (0.20, 80.0, 20.0),
+    "hrv": (0.15, 15.0, 60.0),
+    "heart_rate": (0.10, 110.0, 70.0),
+    "temperature": (0.10, 38.0, 37.0),
+    "effectiveness": (0.10, 0.0, 100.0),
+}
+VITAL_COMPONENTS = ("emg_rms", "hrv", "heart_rate", "temperature")
+
+# Change in score (percent) below which the status is reported as stable
+STABLE_BAND = 1.0
+
+
+def compute_score(state: Optional[Dict]) -> Optional[float]:
+    """Weighted 0-100 score from the running component averages"""
+    if not state:
+        return None
+    total = 0.0
+    weights = 0.0
+    for component, (weight, worst, best) in SCORE_COMPONENTS.items():
+        value = state.get(component)
+        if value is None:
+            continue
+        points = (value - worst) / (best - worst)
+        total += weight * min(max(points, 0.0), 1.0) * 100
+        weights += weight
+    if not weights:
+        return None
+    return total / weights
+
+
+class RecoveryScoreEngine:
+    """
+    Maintains per-user running averages of the score components in the
+    recovery_state collection. Each ingest folds new observations into
+    exponentially weighted averages with an atomic pipeline update, so
+    reading the score is a single point lookup instead of a history scan.
+    """
+
+    def __init__(self, collection, vitals_alpha: float = 0.01, pain_alpha: float = 0.3, session_alpha: float = 0.3):
+        self.collection = collection
+        self.vitals_alpha = vitals_alpha
+        self.pain_alpha = pain_alpha
+        self.session_alpha = session_alpha
+
+    @staticmethod
+    def _fold(values: List[float], alpha: float) -> Dict:
+        """
+        Collapse sequential EWMA steps into new = decay * old + contribution,
+        so a whole batch is applied in a single update
+        """
+        decay = 1.0
+        contribution = 0.0
+        for value in values:
+            contribution = (1 - alpha) * contribution + alpha * value
+            decay *= 1 - alpha
+        return {"decay": decay, "contribution": contribution, "seed": sum(values) / len(values)}
+
+    @staticmethod
+    def _update(
+        user_id: str,
+        folds: Dict[str, Dict],
+        counters: Dict[str, int],
+        vitals_at: Optional[datetime] = None
+    ) -> UpdateOne:
+        now = datetime.utcnow()
+        today = now.strftime("%Y-%m-%d")
+        components = {component: f"${component}" for component in SCORE_COMPONENTS}
+        changes = {"updated_at": now}
+        for component, fold in folds.items():
+            changes[component] = {
+                "$add": [
+                    {"$multiply": [fold["decay"], {"$ifNull": [f"${component}", fold["seed"]]}]},
+                    fold["contribution"]
+                ]
+            }
+        for counter, amount in counters.items():
+            changes[counter] = {"$add": [{"$ifNull": [f"${counter}", 0]}, amount]}
+        if vitals_at is not None:
+            # Newest reading time, used to find users with new data without scanning vitals
+            changes["vitals_at"] = {"$max": ["$vitals_at", vitals_at]}
+        pipeline = [
+            # Snapshot yesterday's closing state the first time we see a new day
+            {"$set": {
+                "day_open": {"$cond": [{"$ne": ["$day", today]}, components, "$day_open"]},
+                "day": today
+            }},
+            {"$set": changes},
+        ]
+        return UpdateOne({"user_id": user_id}, pipeline, upsert=True)
+
+    async def record_vitals(self, readings: Iterable[Dict]) -> None:
+        by_user: Dict[str, List[Dict]] = {}
+        for reading in readings:
+            by_user.setdefault(reading["user_id"], []).append(reading)
+        if not by_user:
+            return
+
+        operations = []
+        for user_id, user_readings in by_user.items():
+            user_readings.sort(key=lambda reading: reading["timestamp"])
+            folds = {
+                component: self._fold([reading[component] for reading in user_readings], self.vitals_alpha)
+                for component in VITAL_COMPONENTS
+            }
+            operations.append(self._update(
+                user_id, folds, {"vitals_count": len(user_readings)}, vitals_at=user_readings[-1]["timestamp"]
+            ))
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def record_pain(self, user_id: str, pain_level: int) -> None:
+        fold = self._fold([float(pain_level)], self.pain_alpha)
+        await self.collection.bulk_write([self._update(user_id, {"pain_level": fold}, {"pain_reports": 1})])
+
+    async def record_session(self, user_id: str, effectiveness: Optional[int]) -> None:
+        folds = {}
+        if effectiveness is not None:
+            folds["effectiveness"] = self._fold([float(effectiveness)], self.session_alpha)
+        await self.collection.bulk_write([self._update(user_id, folds, {"sessions_completed": 1})])
+
+    async def vitals_at(self, user_id: str) -> Optional[datetime]:
+        """Time of the user's newest reading folded into the score"""
+        state = await self.collection.find_one({"user_id": user_id}, {"vitals_at": 1})
+        return state.get("vitals_at") if state else None
+
+    async def get(self, user_id: str) -> Dict:
+        state = await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+        score = compute_score(state)
+        if score is None:
+            return {"current_score": None, "daily_improvement": 0, "status": "insufficient_data"}
+
+        improvement = 0.0
+        opening_score = compute_score(state.get("day_open"))
+        if opening_score:
+            improvement = (score - opening_score) / opening_score * 100
+
+        if improvement > STABLE_BAND:
+            status = "improving"
+        elif improvement < -STABLE_BAND:
+            status = "declining"
+        else:
+            status = "stable"
+
+        return {
+            "current_score": round(score),
+            "daily_improvement": round(improvement, 1),
+            "status": status,
+            "updated_at": state["updated_at"].isoformat() if state.get("updated_at") else None
+        }
+
+
+def create_recovery_engine(db) -> RecoveryScoreEngine:
+    return RecoveryScoreEngine(
+        db.recovery_state,
+        vitals_alpha=float(os.environ.get("RECOVERY_VITALS_ALPHA", "0.01")),
+        pain_alpha=float(os.environ.get("RECOVERY_PAIN_ALPHA", "0.3")),
+        session_alpha=float(os.environ.get("RECOVERY_SESSION_ALPHA", "0.3")),
+    )
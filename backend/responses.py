@@ -0,0 +1,44 @@
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+
+from bson import ObjectId
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(value: Any):
+    """Types Mongo documents carry that the JSON encoders don't know about"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode Mongo documents straight to JSON bytes, ObjectIds as strings"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response that encodes raw database output directly. Returning it
+    from an endpoint skips FastAPI's jsonable_encoder pass and response
+    model validation, so it is meant for trusted documents we wrote ourselves.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
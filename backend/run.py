@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Run the API under uvicorn with one or more worker processes.
+
+    python run.py --workers 4 --port 8001
+    python run.py --workers 1 --reload          # development
+
+Every worker is a separate process with its own event loop, Mongo
+connection pools (one per workload, up to MONGO_MAX_POOL_SIZE connections
+each, so size it against the server's connection limit divided by
+workers), LLM concurrency limit and CPU pool (CPU_POOL_WORKERS processes
+each, so keep workers x (1 + CPU_POOL_WORKERS) within the cores
+available). Per-worker in-memory state needs these settings to
+stay coherent with more than one worker:
+
+    HOT_CACHE_BACKEND=redis            shared hot cache
+    INVALIDATION_BUS=redis             drop other workers' vitals rings and local cache entries
+    VITALS_STREAM_SOURCE=changestream  live streams see readings ingested by any worker
+
+Anomaly baselines stay per worker: readings for one user that land on
+different workers update different copies, and the last checkpoint wins.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger("run")
+
+# Setting -> (value for several workers, what goes wrong without it)
+SHARED_STATE_SETTINGS = {
+    "HOT_CACHE_BACKEND": ("redis", "each worker caches separately"),
+    "INVALIDATION_BUS": ("redis", "workers serve stale cached data and vitals rings after another worker's write"),
+    "VITALS_STREAM_SOURCE": ("changestream", "live streams only see readings ingested by their own worker"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--reload", action="store_true", help="restart on code changes (single worker only)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.reload and args.workers > 1:
+        parser.error("--reload runs a single worker")
+    if args.workers > 1:
+        for name, (expected, consequence) in SHARED_STATE_SETTINGS.items():
+            if os.environ.get(name, "").lower() != expected:
+                logger.warning(f"{args.workers} workers without {name}={expected}: {consequence}")
+
+    uvicorn.run(
+        "server:app",
+        app_dir=str(ROOT_DIR),
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=args.reload,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,110 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pydantic import ValidationError
 import os
+import json
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from ai_service import ai_service
+from database import create_mongo_connections
+from recommendation_cache import create_recommendation_cache, fingerprint
+from db_indexes import ensure_indexes, index_usage_report
+from vitals_storage import create_vitals_store, RESOLUTIONS
+from vitals_ring_buffer import create_vitals_ring_buffers
+from recovery_score import create_recovery_engine
+from daily_rollups import create_daily_rollups, day_of, progress, therapy_report, trend
+from live_stream import VitalsBroker, watch_change_stream
+from hot_cache import create_hot_cache
+from invalidation_bus import create_invalidation_bus
+from cpu_pool import create_cpu_pool
+from query_fanout import fan_out
+from pagination import (
+    Cursor, NDJSON_MEDIA_TYPE, clamp_page_size, fetch_page, keyset_sort, ndjson_line, page_result, stream_ndjson
+)
+from models.vital_signs_models import VitalSignsReading, VitalSignsResponse
+from responses import FastJSONResponse
+from write_behind import create_write_behind_queue
+from signal_processing import process_windows, to_windows
+from hrv import compute_features, create_hrv_engine, ppg_to_rr
+from anomaly_detection import create_anomaly_detector
+from prompt_builder import weekly_history
+import vitals_wire
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connections: pool size, timeouts, compression and read preference
+# per workload, write concern per collection (see database.py)
+mongo = create_mongo_connections()
+db = mongo.database("ingest")
+
+# Reads behind the analytics, insights and report endpoints; these may be
+# served by a secondary and lag the latest writes
+dashboard_db = mongo.database("dashboard")
+
+# Batch ingestion limits
+VITALS_BATCH_MAX_ITEMS = int(os.environ.get('VITALS_BATCH_MAX_ITEMS', '10000'))
+VITALS_BATCH_CHUNK_SIZE = int(os.environ.get('VITALS_BATCH_CHUNK_SIZE', '1000'))
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Per-query timeout for composite endpoints that fan out to several collections
+QUERY_FANOUT_TIMEOUT_SECONDS = float(os.environ.get('QUERY_FANOUT_TIMEOUT_SECONDS', '5'))
+
+# Vital signs storage backend (raw | bucket | timeseries)
+vitals_store = create_vitals_store(db, chunk_size=VITALS_BATCH_CHUNK_SIZE)
+
+# Last N readings per user in memory, for "recent points" reads
+vitals_rings = create_vitals_ring_buffers(vitals_store)
+
+# Running recovery score aggregates, updated on ingest
+recovery_engine = create_recovery_engine(db)
+
+# Per-user daily rollups behind the report and trend endpoints, updated on write
+daily_rollups = create_daily_rollups(db)
+dashboard_rollups = create_daily_rollups(dashboard_db)
+
+# Live vitals fan-out. "local" publishes from this process's ingest path;
+# "changestream" feeds every worker from a MongoDB change stream instead.
+VITALS_STREAM_SOURCE = os.environ.get('VITALS_STREAM_SOURCE', 'local').lower()
+STREAM_KEEPALIVE_SECONDS = float(os.environ.get('STREAM_KEEPALIVE_SECONDS', '15'))
+vitals_broker = VitalsBroker(queue_size=int(os.environ.get('VITALS_STREAM_QUEUE_SIZE', '100')))
+change_stream_task = None
+
+# Batched background inserts for records the client doesn't wait on
+write_behind = create_write_behind_queue(db)
+
+# Read-through cache for latest vitals, profiles and insights
+hot_cache = create_hot_cache()
+
+# Tells the other workers to drop their copies of per-user state
+# (local hot cache entries, vitals rings) after a write
+invalidation_bus = create_invalidation_bus()
+
+# Process pool for CPU-bound signal processing (CPU_POOL_WORKERS=0 runs inline)
+cpu_pool = create_cpu_pool()
+
+# Recommendation cache keyed by quantized patient state
+recommendation_cache = create_recommendation_cache(db)
+
+# Server-side HRV features from raw RR intervals / PPG waveforms
+hrv_engine = create_hrv_engine(db)
+
+# Online anomaly detection on ingest; baselines are checkpointed periodically
+anomaly_detector = create_anomaly_detector(db)
+ANOMALY_CHECKPOINT_SECONDS = float(os.environ.get('ANOMALY_CHECKPOINT_SECONDS', '30'))
+anomaly_checkpoint_task = None
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -70,6 +153,17 @@ class AIRecommendationRequest(BaseModel):
     inflammation: Optional[str] = "Nhẹ"
     recovery_score: Optional[int] = 78
 
+class RawRRUpload(BaseModel):
+    user_id: str
+    rr_intervals: List[float]  # ms between successive beats
+    end_time: datetime = Field(default_factory=datetime.utcnow)
+
+class RawPPGUpload(BaseModel):
+    user_id: str
+    samples: List[float]
+    sample_rate: int = Field(default=100, gt=0)
+    end_time: datetime = Field(default_factory=datetime.utcnow)
+
 class UserProfile(BaseModel):
     user_id: str
     full_name: str
@@ -89,6 +183,14 @@ class UpdatePainLevelRequest(BaseModel):
     pain_level: int
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class RawEMGUpload(BaseModel):
+    user_id: str
+    samples: List[float]  # raw EMG samples (µV), oldest first
+    sample_rate: int = Field(default=1000, gt=0)  # Hz
+    window_ms: int = Field(default=1000, gt=0)  # one emg_data point per window
+    start_time: datetime = Field(default_factory=datetime.utcnow)
+    session_id: Optional[str] = None
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -102,9 +204,57 @@ async def create_status_check(input: StatusCheckCreate):
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    if format == "ndjson":
+        rows = db.status_checks.find({}, {"_id": 0}).sort(keyset_sort("timestamp"))
+        return StreamingResponse(stream_ndjson(rows), media_type=NDJSON_MEDIA_TYPE)
+
+    status_checks, next_cursor = await fetch_page(
+        db.status_checks, {}, "timestamp", clamp_page_size(limit, 1000), _decode_cursor(cursor)
+    )
+    # Documents were written from StatusCheck, so only strip the Mongo _id
+    for status_check in status_checks:
+        del status_check["_id"]
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(status_checks, headers=headers)
+
+def _decode_cursor(token: Optional[str]) -> Optional[Cursor]:
+    if not token:
+        return None
+    try:
+        return Cursor.decode(token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/metrics")
+async def get_service_metrics():
+    """Operational metrics for tuning and monitoring"""
+    return {
+        "llm": ai_service.get_metrics(),
+        "recommendation_tiers": ai_service.get_tier_metrics(),
+        "llm_tokens": ai_service.get_token_metrics(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "live_stream": vitals_broker.stats(),
+        "hot_cache": hot_cache.stats(),
+        "write_behind": write_behind.stats(),
+        "anomaly_detection": anomaly_detector.stats(),
+        "vitals_rings": vitals_rings.stats(),
+        "invalidation_bus": invalidation_bus.stats(),
+        "cpu_pool": cpu_pool.stats(),
+        "mongo_pools": mongo.stats()
+    }
+
+@api_router.get("/admin/indexes")
+async def get_index_usage():
+    """Index usage report for the collections behind the hot query paths"""
+    try:
+        return await index_usage_report(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get index usage: {str(e)}")
 
 # BioPatch specific endpoints
 
@@ -113,108 +263,644 @@ async def record_vital_signs(vitals: UserVitalSigns):
     """Record vital signs data from BioPatch device"""
     try:
         vitals_dict = vitals.dict()
-        result = await db.vital_signs.insert_one(vitals_dict)
-        return {"message": "Vital signs recorded successfully", "id": str(result.inserted_id)}
+        inserted_id = await vitals_store.insert_one(vitals_dict)
+        vitals_rings.append([vitals_dict])
+        await _invalidate(vitals.user_id, "vitals_latest")
+        await asyncio.gather(
+            _update_recovery_state(recovery_engine.record_vitals([vitals_dict])),
+            _update_daily_rollups(daily_rollups.record_vitals([vitals_dict]))
+        )
+        _publish_vitals([vitals_dict])
+        await _detect_anomalies([vitals_dict])
+        return {"message": "Vital signs recorded successfully", "id": inserted_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to record vital signs: {str(e)}")
 
+@api_router.post("/vitals/batch")
+async def record_vital_signs_batch(request: Request):
+    """Record a batch of vital signs readings (JSON array, NDJSON or binary vitals frame body)"""
+    try:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type == vitals_wire.MEDIA_TYPE:
+            results, valid_docs, valid_indexes = _decode_vitals_frame(body)
+        else:
+            results, valid_docs, valid_indexes = _validate_vitals_items(_parse_vitals_batch(body, content_type))
+
+        write_errors = await vitals_store.insert_many(valid_docs)
+        for position, index in enumerate(valid_indexes):
+            if position in write_errors:
+                results[index] = {"index": index, "status": "rejected", "error": write_errors[position]}
+            else:
+                results[index] = {"index": index, "status": "accepted", "id": str(valid_docs[position]["_id"])}
+        accepted_docs = [doc for position, doc in enumerate(valid_docs) if position not in write_errors]
+        vitals_rings.append(accepted_docs)
+        for user_id in {doc["user_id"] for doc in accepted_docs}:
+            await _invalidate(user_id, "vitals_latest")
+        await asyncio.gather(
+            _update_recovery_state(recovery_engine.record_vitals(accepted_docs)),
+            _update_daily_rollups(daily_rollups.record_vitals(accepted_docs))
+        )
+        _publish_vitals(accepted_docs)
+        await _detect_anomalies(accepted_docs)
+
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+        return {
+            "message": "Vital signs batch processed",
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record vital signs batch: {str(e)}")
+
+async def _invalidate(user_id: str, *namespaces: str) -> None:
+    """Drop cached per-user state in this worker and, through the bus, in every other one"""
+    await hot_cache.invalidate(user_id, *namespaces)
+    await invalidation_bus.publish(user_id, namespaces)
+
+async def _apply_remote_invalidation(user_id: Optional[str], namespaces) -> None:
+    """Another worker wrote for this user (user_id None: messages may have been missed)"""
+    if user_id is None:
+        vitals_rings.clear()
+        if hot_cache.backend.name == "local":
+            await hot_cache.backend.clear()
+        return
+    if "vitals_latest" in namespaces:
+        # New readings went into that worker's ring, not this one's
+        vitals_rings.invalidate(user_id)
+    if hot_cache.backend.name == "local":
+        await hot_cache.invalidate(user_id, *namespaces)
+    else:
+        # The writer already deleted the shared entry; stop reads in flight here from restoring it
+        hot_cache.mark_invalidated(user_id, *namespaces)
+
+invalidation_bus.subscribe(_apply_remote_invalidation)
+
+async def _update_recovery_state(update) -> None:
+    """Apply a recovery score update without failing the write that triggered it"""
+    try:
+        await update
+    except Exception as e:
+        logger.error(f"Failed to update recovery state: {str(e)}")
+
+async def _update_daily_rollups(update) -> None:
+    """Apply a daily rollup update without failing the write that triggered it"""
+    try:
+        await update
+    except Exception as e:
+        logger.error(f"Failed to update daily rollups: {str(e)}")
+
+def _publish_vitals(docs: List[Dict]) -> None:
+    """Push the newest reading per user to live stream subscribers"""
+    if change_stream_task is not None:
+        return  # the change stream delivers it instead
+    latest = {}
+    for doc in docs:
+        current = latest.get(doc["user_id"])
+        if current is None or doc["timestamp"] >= current["timestamp"]:
+            latest[doc["user_id"]] = doc
+    for user_id, doc in latest.items():
+        vitals_broker.publish(user_id, "vitals", doc)
+
+async def _detect_anomalies(docs: List[Dict]) -> None:
+    """Score new readings and fan out any alerts without failing the write"""
+    try:
+        alerts = await anomaly_detector.observe(docs)
+    except Exception as e:
+        logger.error(f"Anomaly detection failed: {str(e)}")
+        return
+    for alert in alerts:
+        vitals_broker.publish(alert["user_id"], "alert", alert)
+        await write_behind.submit("alerts", alert)
+
+def _check_batch_size(count: int) -> None:
+    if not count:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if count > VITALS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {count} readings (max {VITALS_BATCH_MAX_ITEMS})"
+        )
+
+def _validate_vitals_items(items: list):
+    """Validate every reading up front so one bad item doesn't sink the batch"""
+    _check_batch_size(len(items))
+    results = [None] * len(items)
+    valid_docs = []
+    valid_indexes = []
+    for index, item in enumerate(items):
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            if not isinstance(item, dict):
+                raise ValueError("Reading must be a JSON object")
+            valid_docs.append(UserVitalSigns(**item).dict())
+            valid_indexes.append(index)
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            results[index] = {"index": index, "status": "rejected", "error": error}
+        except (ValueError, TypeError) as e:
+            results[index] = {"index": index, "status": "rejected", "error": str(e)}
+    return results, valid_docs, valid_indexes
+
+def _decode_vitals_frame(body: bytes):
+    """Columnar binary frame; the layout already guarantees the field types"""
+    try:
+        frame = vitals_wire.decode(body)
+    except vitals_wire.WireFormatError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed vitals frame: {str(e)}")
+    count = frame.timestamps.size
+    _check_batch_size(count)
+    valid_docs, rejected = vitals_wire.to_documents(frame)
+    results = [None] * count
+    for index, error in rejected.items():
+        results[index] = {"index": index, "status": "rejected", "error": error}
+    valid_indexes = [index for index in range(count) if index not in rejected]
+    return results, valid_docs, valid_indexes
+
+def _parse_vitals_batch(body: bytes, content_type: str) -> list:
+    """Decode a batch body into a list of raw readings"""
+    if content_type in NDJSON_CONTENT_TYPES:
+        # Malformed lines are kept as errors so they are rejected individually
+        items = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                items.append(ValueError(f"Malformed NDJSON line: {str(e)}"))
+        return items
+    try:
+        items = json.loads(body) if body.strip() else []
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch body: {str(e)}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or NDJSON stream")
+    return items
+
 @api_router.get("/vitals/latest/{user_id}")
 async def get_latest_vitals(user_id: str):
     """Get latest vital signs for a user"""
     try:
-        latest_vitals = await db.vital_signs.find_one(
-            {"user_id": user_id},
-            sort=[("timestamp", -1)]
-        )
+        cached = await hot_cache.get("vitals_latest", user_id)
+        if cached is not None:
+            return FastJSONResponse(cached)
+
+        generation = hot_cache.generation()
+        latest_vitals = await vitals_store.latest(user_id)
         if not latest_vitals:
             return {"message": "No vital signs found"}
         
-        # Convert ObjectId to string for JSON serialization
-        latest_vitals["_id"] = str(latest_vitals["_id"])
-        return latest_vitals
+        await hot_cache.set("vitals_latest", user_id, latest_vitals, generation)
+        return FastJSONResponse(latest_vitals)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get vital signs: {str(e)}")
 
+@api_router.get("/vitals/recent/{user_id}")
+async def get_recent_vitals(user_id: str, limit: int = Query(20, ge=1)):
+    """Latest readings (up to the ring capacity) as columns, oldest first, served from memory"""
+    try:
+        columns = await vitals_rings.columnar(user_id, limit)
+        return FastJSONResponse({"user_id": user_id, "count": len(columns["timestamp"]), **columns})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recent vital signs: {str(e)}")
+
+@api_router.get("/vitals/recent/{user_id}/stats")
+async def get_recent_vitals_stats(user_id: str, window_minutes: float = Query(15, gt=0)):
+    """count/min/max/mean per field over the last few minutes of readings"""
+    try:
+        stats = await vitals_rings.window(user_id, window_minutes * 60)
+        return {"user_id": user_id, "window_minutes": window_minutes, **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recent vital signs stats: {str(e)}")
+
+@api_router.post("/emg/raw")
+async def process_raw_emg(upload: RawEMGUpload):
+    """Compute RMS and peak detection from raw EMG samples and store one point per window"""
+    window_size = upload.sample_rate * upload.window_ms // 1000
+    windows = to_windows(upload.samples, window_size) if window_size else None
+    if windows is None or len(windows) == 0:
+        raise HTTPException(status_code=400, detail=f"Need at least one full window of {window_size} samples")
+    try:
+        features = await cpu_pool.run(process_windows, windows, upload.sample_rate)
+
+        window_duration = timedelta(milliseconds=upload.window_ms)
+        timestamps = [upload.start_time + window_duration * i for i in range(len(windows))]
+        emg_points = [
+            {
+                "user_id": upload.user_id,
+                "time": timestamp.strftime("%H:%M"),
+                "value": rms,
+                "peak": peak,
+                "peak_count": peak_count,
+                "envelope_max": envelope_max,
+                "session_id": upload.session_id,
+                "source": "raw",
+                "timestamp": timestamp
+            }
+            for timestamp, rms, peak, peak_count, envelope_max in zip(
+                timestamps,
+                features.rms.round(2).tolist(),
+                features.peak.tolist(),
+                features.peak_count.tolist(),
+                features.envelope_max.round(2).tolist()
+            )
+        ]
+        await db.emg_data.insert_many(emg_points, ordered=False)
+        await _invalidate(upload.user_id, "insights")
+        
+        return {
+            "message": "EMG samples processed",
+            "windows": len(emg_points),
+            "peak_windows": int(features.peak.sum()),
+            "mean_rms": round(float(features.rms.mean()), 2)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process EMG samples: {str(e)}")
+
+@api_router.post("/hrv/rr")
+async def process_rr_intervals(upload: RawRRUpload):
+    """Compute windowed HRV features from raw RR intervals"""
+    return await _ingest_hrv(upload.user_id, upload.rr_intervals, upload.end_time, "rr")
+
+@api_router.post("/hrv/ppg")
+async def process_ppg(upload: RawPPGUpload):
+    """Detect beats in a raw PPG waveform and compute windowed HRV features"""
+    try:
+        rr_intervals = await cpu_pool.run(ppg_to_rr, upload.samples, upload.sample_rate)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to detect beats: {str(e)}")
+    return await _ingest_hrv(upload.user_id, rr_intervals, upload.end_time, "ppg")
+
+@api_router.get("/hrv/{user_id}")
+async def get_hrv_summary(user_id: str):
+    """Latest HRV features and the user's running baseline"""
+    try:
+        summary = await hrv_engine.summary(user_id)
+        if not summary:
+            return {"message": "No HRV data found"}
+        return FastJSONResponse(summary)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get HRV summary: {str(e)}")
+
+async def _ingest_hrv(user_id: str, rr_intervals, end_time: datetime, source: str):
+    if len(rr_intervals) < hrv_engine.min_beats:
+        raise HTTPException(status_code=400, detail=f"Need at least {hrv_engine.min_beats} beats")
+    try:
+        features = await cpu_pool.run(compute_features, rr_intervals, hrv_engine.window_beats, hrv_engine.min_beats)
+        records = await hrv_engine.store(user_id, features, end_time, source=source)
+        if not records:
+            raise HTTPException(status_code=400, detail=f"Need at least {hrv_engine.min_beats} valid beats")
+        return {
+            "message": "HRV features computed",
+            "windows": len(records),
+            "latest": {name: records[-1][name] for name in hrv_engine.FEATURES}
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to compute HRV features: {str(e)}")
+
+@api_router.websocket("/vitals/stream/{user_id}")
+async def stream_vitals_websocket(websocket: WebSocket, user_id: str):
+    """Live vital signs for a user over WebSocket"""
+    await websocket.accept()
+    subscription = vitals_broker.subscribe(user_id)
+    disconnected = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        while True:
+            next_event = asyncio.create_task(subscription.queue.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                break
+            await websocket.send_text(next_event.result()[1])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        vitals_broker.unsubscribe(subscription)
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    """Drain client messages until the socket closes"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+@api_router.get("/vitals/stream/{user_id}/sse")
+async def stream_vitals_sse(user_id: str, request: Request):
+    """Live vital signs for a user as Server-Sent Events (WebSocket fallback)"""
+    subscription = vitals_broker.subscribe(user_id)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                event_type, data = event
+                yield f"event: {event_type}\ndata: {data}\n\n"
+        finally:
+            vitals_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/vitals/history/{user_id}", response_model=VitalSignsResponse)
+async def get_vitals_history(
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """Get vital signs history for a user, newest first, one keyset page at a time"""
+    page_cursor = _decode_cursor(cursor)
+    try:
+        if format == "ndjson":
+            return StreamingResponse(
+                stream_ndjson(
+                    vitals_store.iter_history(user_id),
+                    transform=lambda record: (VitalSignsReading.from_record(record).model_dump_json() + "\n").encode()
+                ),
+                media_type=NDJSON_MEDIA_TYPE
+            )
+
+        page_size = clamp_page_size(limit)
+        rows, total_count = await asyncio.gather(
+            vitals_store.history(user_id, page_cursor, page_size + 1),
+            vitals_store.count(user_id)
+        )
+        rows, next_cursor = page_result(rows, "timestamp", page_size, page_cursor)
+        return VitalSignsResponse(
+            readings=[VitalSignsReading.from_record(row) for row in rows],
+            totalCount=total_count,
+            page=page_cursor.page if page_cursor else 1,
+            pageSize=page_size,
+            nextCursor=next_cursor
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get vital signs history: {str(e)}")
+
+@api_router.get("/vitals/rollups/{user_id}")
+async def get_vitals_rollups(
+    user_id: str,
+    resolution: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Get min/max/mean/count of vital signs per time bucket"""
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    try:
+        end = end or datetime.utcnow()
+        start = start or end - timedelta(hours=24)
+        rollups = await vitals_store.rollups(user_id, start, end, resolution)
+        return {
+            "user_id": user_id,
+            "resolution": resolution,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "rollups": rollups
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get vital signs rollups: {str(e)}")
+
 @api_router.post("/sessions")
 async def create_therapy_session(session: TherapySession):
     """Create a new therapy session"""
     try:
         session_dict = session.dict()
         result = await db.therapy_sessions.insert_one(session_dict)
+        await _invalidate(session.user_id, "insights")
+        if session.completed:
+            # Logged after the fact; it never goes through /complete
+            await _update_daily_rollups(daily_rollups.record_session(session_dict))
         return {"message": "Therapy session created", "id": str(result.inserted_id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create session: {str(e)}")
 
 @api_router.get("/sessions/{user_id}")
-async def get_user_sessions(user_id: str):
-    """Get therapy sessions for a user"""
+async def get_user_sessions(
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """Get therapy sessions for a user, newest first (next page cursor in X-Next-Cursor)"""
+    page_cursor = _decode_cursor(cursor)
     try:
-        sessions = await db.therapy_sessions.find({"user_id": user_id}).to_list(100)
-        # Convert ObjectIds to strings
-        for session in sessions:
-            session["_id"] = str(session["_id"])
-        return sessions
+        if format == "ndjson":
+            rows = db.therapy_sessions.find({"user_id": user_id}).sort(keyset_sort("start_time"))
+            return StreamingResponse(stream_ndjson(rows), media_type=NDJSON_MEDIA_TYPE)
+
+        sessions, next_cursor = await fetch_page(
+            db.therapy_sessions, {"user_id": user_id}, "start_time", clamp_page_size(limit), page_cursor
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return FastJSONResponse(sessions, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get sessions: {str(e)}")
 
+@api_router.get("/alerts/{user_id}")
+async def get_user_alerts(
+    user_id: str,
+    resolved: Optional[bool] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+):
+    """Get alerts for a user, newest first (next page cursor in X-Next-Cursor)"""
+    page_cursor = _decode_cursor(cursor)
+    try:
+        query = {"user_id": user_id}
+        if resolved is not None:
+            query["resolved"] = resolved
+        alerts, next_cursor = await fetch_page(db.alerts, query, "timestamp", clamp_page_size(limit), page_cursor)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return FastJSONResponse(alerts, headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get alerts: {str(e)}")
+
+@api_router.put("/alerts/{alert_id}/resolve")
+async def resolve_alert(alert_id: str):
+    """Mark an alert as resolved"""
+    try:
+        result = await db.alerts.update_one(
+            {"id": alert_id},
+            {"$set": {"resolved": True, "resolved_at": datetime.utcnow()}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        return {"message": "Alert resolved"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to resolve alert: {str(e)}")
+
 @api_router.post("/recommendations/{user_id}")
 async def get_ai_recommendations(user_id: str, request: AIRecommendationRequest):
     """Generate AI-powered recommendations based on user data"""
     try:
-        # Prepare user data for AI analysis
-        user_data = request.dict()
-        user_data['user_id'] = user_id
-        
-        # Get AI recommendations
-        recommendations = await ai_service.generate_recommendations(user_data)
-        
-        # Store recommendations in database for tracking
-        recommendation_record = {
-            "user_id": user_id,
-            "timestamp": datetime.utcnow(),
-            "recommendations": recommendations,
-            "user_data_snapshot": user_data
-        }
-        await db.ai_recommendations.insert_one(recommendation_record)
+        user_data = await _recommendation_input(user_id, request)
+
+        # Common cases are answered by the rule tier without touching the LLM;
+        # otherwise serve from cache when the patient state hasn't meaningfully changed
+        recommendations = ai_service.recommend_from_rules(user_data)
+        cached = False
+        if recommendations is None:
+            user_data = await _with_therapy_history(user_id, user_data)
+            recommendations = await _cached_recommendations(user_id, user_data)
+            cached = recommendations is not None
+        if recommendations is None:
+            recommendations = await ai_service.generate_recommendations(user_data)
+            if _cacheable(recommendations):
+                recommendation_cache.set(user_data, recommendations)
         
+        await _store_recommendations(user_id, user_data, recommendations, cached)
         return recommendations
     except Exception as e:
         logger.error(f"Failed to generate AI recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate recommendations: {str(e)}")
 
+@api_router.post("/recommendations/{user_id}/stream")
+async def stream_ai_recommendations(user_id: str, request: AIRecommendationRequest):
+    """
+    Recommendations as NDJSON: one "recommendation" line as soon as each is
+    ready, then a "done" line with the summary, alerts and source
+    """
+    try:
+        user_data = await _recommendation_input(user_id, request)
+        ready = ai_service.recommend_from_rules(user_data)
+        cached = False
+        if ready is None:
+            user_data = await _with_therapy_history(user_id, user_data)
+            ready = await _cached_recommendations(user_id, user_data)
+            cached = ready is not None
+    except Exception as e:
+        logger.error(f"Failed to generate AI recommendations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate recommendations: {str(e)}")
+    return StreamingResponse(
+        _recommendation_events(user_id, user_data, ready, cached),
+        media_type=NDJSON_MEDIA_TYPE
+    )
+
+async def _recommendation_events(user_id: str, user_data: Dict, ready: Optional[Dict], cached: bool):
+    if ready is None:
+        events = ai_service.stream_recommendations(user_data)
+    else:
+        events = _split_recommendations(ready)
+    recommendations = []
+    result = {}
+    async for event_type, data in events:
+        if event_type == "recommendation":
+            recommendations.append(data)
+        else:
+            result = {"recommendations": recommendations, **data}
+            data = {**data, "cached": cached}
+        yield ndjson_line({"type": event_type, "data": data})
+
+    if ready is None and result and _cacheable(result):
+        recommendation_cache.set(user_data, result)
+    if result:
+        await _store_recommendations(user_id, user_data, result, cached)
+
+def _cacheable(recommendations: Dict) -> bool:
+    """
+    Fallback answers are cheap and shouldn't mask the LLM recovering;
+    repaired or partial ones are missing part of the answer
+    """
+    return (
+        recommendations.get("source") != "fallback"
+        and not recommendations.get("repaired")
+        and not recommendations.get("partial")
+    )
+
+async def _split_recommendations(recommendations: Dict):
+    """Replay a complete answer in the streaming event format"""
+    for item in recommendations["recommendations"]:
+        yield "recommendation", item
+    yield "done", {key: value for key, value in recommendations.items() if key != "recommendations"}
+
+async def _recommendation_input(user_id: str, request: AIRecommendationRequest) -> Dict:
+    """Prompt inputs from the request, with server-computed HRV over the client placeholder"""
+    user_data = request.dict()
+    user_data['user_id'] = user_id
+
+    hrv_summary = await hrv_engine.summary(user_id)
+    if hrv_summary:
+        latest_hrv = hrv_summary["latest"]
+        if "hrv" not in request.model_fields_set:
+            user_data['hrv'] = latest_hrv["rmssd"]
+        user_data['hrv_sdnn'] = latest_hrv["sdnn"]
+        user_data['hrv_pnn50'] = latest_hrv["pnn50"]
+        user_data['hrv_lf_hf'] = latest_hrv["lf_hf"]
+    return user_data
+
+async def _cached_recommendations(user_id: str, user_data: Dict) -> Optional[Dict]:
+    """
+    Cached answer by fingerprint, or the batch job's answer for this user
+    when it was built from the same state and no reading has arrived since
+    """
+    if ai_service.escalated(user_data):
+        return await recommendation_cache.get(user_data)
+    return await recommendation_cache.get(user_data, vitals_at=await recovery_engine.vitals_at(user_id))
+
+async def _with_therapy_history(user_id: str, user_data: Dict) -> Dict:
+    """Prompt inputs plus the real 7-day therapy history (also part of the cache fingerprint)"""
+    try:
+        return {**user_data, **await weekly_history(db, user_id)}
+    except Exception as e:
+        logger.error(f"Failed to aggregate therapy history: {str(e)}")
+        return user_data
+
+async def _store_recommendations(user_id: str, user_data: Dict, recommendations: Dict, cached: bool) -> None:
+    """Store recommendations in database for tracking"""
+    recommendation_record = {
+        "user_id": user_id,
+        "timestamp": datetime.utcnow(),
+        "recommendations": recommendations,
+        "user_data_snapshot": user_data,
+        "fingerprint": fingerprint(user_data),
+        "cached": cached
+    }
+    await write_behind.submit("ai_recommendations", recommendation_record)
+
 @api_router.get("/analytics/{user_id}")
 async def get_user_analytics(user_id: str):
     """Get analytics data for dashboard"""
     try:
-        # Get recent vital signs (last 24 hours)
-        recent_vitals = await db.vital_signs.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(24).to_list(24)
-        
-        # Get recent sessions
-        recent_sessions = await db.therapy_sessions.find(
-            {"user_id": user_id}
-        ).sort("start_time", -1).limit(10).to_list(10)
-        
-        # Calculate recovery metrics
-        recovery_data = {
-            "current_score": 78,  # Placeholder - calculate based on real data
-            "daily_improvement": 15,
-            "status": "improving"
-        }
-        
-        # Convert ObjectIds to strings
-        for vital in recent_vitals:
-            vital["_id"] = str(vital["_id"])
-        for session in recent_sessions:
-            session["_id"] = str(session["_id"])
-            
-        return {
-            "recovery_data": recovery_data,
-            "recent_vitals": recent_vitals,
-            "recent_sessions": recent_sessions,
+        results, failed = await fan_out(
+            {
+                # Recent vital signs (last 24 hours)
+                "recent_vitals": vitals_rings.recent(user_id, 24),
+                # Recent sessions
+                "recent_sessions": dashboard_db.therapy_sessions.find(
+                    {"user_id": user_id}
+                ).sort("start_time", -1).limit(10).to_list(10),
+                # Recovery metrics from the running aggregates
+                "recovery_data": recovery_engine.get(user_id),
+            },
+            timeout=QUERY_FANOUT_TIMEOUT_SECONDS,
+            defaults={"recovery_data": {"current_score": None, "daily_improvement": 0, "status": "unavailable"}}
+        )
+        analytics = {
+            "recovery_data": results["recovery_data"],
+            "recent_vitals": results["recent_vitals"],
+            "recent_sessions": results["recent_sessions"],
             "last_updated": datetime.utcnow().isoformat()
         }
+        if failed:
+            analytics["partial"] = failed
+        return FastJSONResponse(analytics)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
 
@@ -223,6 +909,11 @@ async def get_user_analytics(user_id: str):
 async def get_user_profile(user_id: str):
     """Get user profile"""
     try:
+        cached = await hot_cache.get("profile", user_id)
+        if cached is not None:
+            return FastJSONResponse(cached)
+
+        generation = hot_cache.generation()
         profile = await db.user_profiles.find_one({"user_id": user_id})
         if not profile:
             # Return default profile if not found
@@ -254,8 +945,8 @@ async def get_user_profile(user_id: str):
             }
             return default_profile
         
-        profile["_id"] = str(profile["_id"])
-        return profile
+        await hot_cache.set("profile", user_id, profile, generation)
+        return FastJSONResponse(profile)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get profile: {str(e)}")
 
@@ -269,6 +960,7 @@ async def create_or_update_profile(profile: UserProfile):
             {"$set": profile_dict},
             upsert=True
         )
+        await _invalidate(profile.user_id, "profile")
         return {"message": "Profile updated successfully", "modified_count": result.modified_count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update profile: {str(e)}")
@@ -296,7 +988,12 @@ async def update_pain_level(request: UpdatePainLevelRequest):
             "timestamp": request.timestamp,
             "type": "manual_input"
         }
-        await db.pain_history.insert_one(pain_record)
+        await write_behind.submit("pain_history", pain_record)
+        await _invalidate(request.user_id, "profile")
+        await asyncio.gather(
+            _update_recovery_state(recovery_engine.record_pain(request.user_id, request.pain_level)),
+            _update_daily_rollups(daily_rollups.record_pain(request.user_id, request.pain_level, request.timestamp))
+        )
         
         return {
             "message": "Pain level updated successfully",
@@ -307,46 +1004,73 @@ async def update_pain_level(request: UpdatePainLevelRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update pain level: {str(e)}")
 
 @api_router.post("/sessions/{session_id}/complete")
-async def complete_therapy_session(session_id: str, effectiveness: Optional[int] = None):
+async def complete_therapy_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    effectiveness: Optional[int] = None
+):
     """Complete a therapy session and update analytics data"""
     try:
-        # Update session completion
-        update_data = {
-            "completed": True,
-            "end_time": datetime.utcnow(),
-            "effectiveness": effectiveness
-        }
-        
-        session_result = await db.therapy_sessions.update_one(
-            {"id": session_id},
-            {"$set": update_data}
+        # Mark the session complete and derive its duration from start_time
+        # in the database, in a single round-trip
+        end_time = datetime.utcnow()
+        session = await db.therapy_sessions.find_one_and_update(
+            # Only the first completion matches, so a retried request can't
+            # overwrite end_time or queue the analytics updates twice
+            {"id": session_id, "completed": {"$ne": True}},
+            [{
+                "$set": {
+                    "completed": True,
+                    "end_time": end_time,
+                    "effectiveness": effectiveness,
+                    "duration": {
+                        "$cond": [
+                            {"$eq": [{"$type": "$start_time"}, "date"]},
+                            {"$toInt": {"$trunc": {"$divide": [{"$subtract": [end_time, "$start_time"]}, 60000]}}},
+                            "$duration"
+                        ]
+                    }
+                }
+            }],
+            projection={
+                "_id": 0, "id": 1, "user_id": 1, "session_type": 1, "start_time": 1,
+                "duration": 1, "settings": 1, "effectiveness": 1
+            },
+            return_document=ReturnDocument.AFTER
         )
         
-        if session_result.modified_count == 0:
+        if session is None:
+            if await db.therapy_sessions.find_one({"id": session_id}, {"_id": 1}) is not None:
+                raise HTTPException(status_code=409, detail="Session already completed")
             raise HTTPException(status_code=404, detail="Session not found")
         
-        # Get the session details to update user data
-        session = await db.therapy_sessions.find_one({"id": session_id})
-        if session:
-            # Calculate duration
-            if session.get("end_time") and session.get("start_time"):
-                duration = (session["end_time"] - session["start_time"]).total_seconds() / 60
-                await db.therapy_sessions.update_one(
-                    {"id": session_id},
-                    {"$set": {"duration": int(duration)}}
-                )
-            
-            # Update analytics data (trigger real-time chart updates)
-            await _update_real_time_analytics(session["user_id"], session)
+        await _invalidate(session["user_id"], "insights")
+        
+        # Derived analytics records aren't needed for the response
+        background_tasks.add_task(_after_session_completed, session, effectiveness)
         
         return {
             "message": "Therapy session completed successfully",
             "session_id": session_id,
             "effectiveness": effectiveness
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to complete session: {str(e)}")
 
+async def _after_session_completed(session: dict, effectiveness: Optional[int]):
+    """Update analytics data (trigger real-time chart updates) once the response is sent"""
+    try:
+        await asyncio.gather(
+            _update_real_time_analytics(session["user_id"], session),
+            _update_recovery_state(recovery_engine.record_session(session["user_id"], effectiveness)),
+            _update_daily_rollups(daily_rollups.record_session(session))
+        )
+        await _invalidate(session["user_id"], "insights")
+    except Exception as e:
+        logger.error(f"Failed to update analytics for session {session['id']}: {str(e)}")
+
 async def _update_real_time_analytics(user_id: str, session: dict):
     """Update real-time analytics after therapy completion"""
     # This would typically update EMG, temperature data based on session
@@ -364,7 +1088,6 @@ async def _update_real_time_analytics(user_id: str, session: dict):
         "session_id": session["id"],
         "timestamp": current_time
     }
-    await db.emg_data.insert_one(emg_update)
     
     # Sample temperature update (reduced inflammation)
     temp_update = {
@@ -375,44 +1098,107 @@ async def _update_real_time_analytics(user_id: str, session: dict):
         "session_id": session["id"],
         "timestamp": current_time
     }
-    await db.temperature_data.insert_one(temp_update)
+    
+    await write_behind.submit("emg_data", emg_update)
+    await write_behind.submit("temperature_data", temp_update)
 
 @api_router.get("/insights/{user_id}")
 async def get_insights_data(user_id: str):
     """Get updated insights data including EMG, temperature, and activity"""
     try:
-        # Get EMG data (last 24 hours or latest 20 points)
-        emg_data = await db.emg_data.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(20).to_list(20)
-        
-        # Get temperature data
-        temp_data = await db.temperature_data.find(
-            {"user_id": user_id}
-        ).sort("timestamp", -1).limit(20).to_list(20)
-        
-        # Get activity data
-        activity_data = await db.therapy_sessions.find(
-            {"user_id": user_id}
-        ).sort("start_time", -1).limit(20).to_list(20)
-        
-        # Convert ObjectIds to strings and reverse for chronological order
-        for item in emg_data:
-            item["_id"] = str(item["_id"])
-        for item in temp_data:
-            item["_id"] = str(item["_id"])
-        for item in activity_data:
-            item["_id"] = str(item["_id"])
-        
-        return {
-            "emg_data": list(reversed(emg_data)),
-            "temperature_data": list(reversed(temp_data)),
-            "activity_data": list(reversed(activity_data)),
+        cached = await hot_cache.get("insights", user_id)
+        if cached is not None:
+            return FastJSONResponse(cached)
+
+        generation = hot_cache.generation()
+        # Right after a write a secondary may still have the old data
+        source = db if hot_cache.fresh_read_required("insights", user_id) else dashboard_db
+        results, failed = await fan_out(
+            {
+                # EMG data (last 24 hours or latest 20 points)
+                "emg_data": source.emg_data.find(
+                    {"user_id": user_id}
+                ).sort("timestamp", -1).limit(20).to_list(20),
+                # Temperature data
+                "temperature_data": source.temperature_data.find(
+                    {"user_id": user_id}
+                ).sort("timestamp", -1).limit(20).to_list(20),
+                # Activity data
+                "activity_data": source.therapy_sessions.find(
+                    {"user_id": user_id}
+                ).sort("start_time", -1).limit(20).to_list(20),
+            },
+            timeout=QUERY_FANOUT_TIMEOUT_SECONDS
+        )
+        # Reverse for chronological order
+        insights = {
+            "emg_data": list(reversed(results["emg_data"])),
+            "temperature_data": list(reversed(results["temperature_data"])),
+            "activity_data": list(reversed(results["activity_data"])),
             "last_updated": datetime.utcnow().isoformat()
         }
+        if failed:
+            # Don't cache a degraded answer
+            insights["partial"] = failed
+        else:
+            await hot_cache.set("insights", user_id, insights, generation)
+        return FastJSONResponse(insights)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get insights data: {str(e)}")
 
+def _rollup_range(start: Optional[datetime], end: Optional[datetime], default_days: int):
+    end = day_of(end or datetime.utcnow())
+    start = day_of(start) if start else end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+@api_router.get("/therapy/report/{user_id}")
+async def get_therapy_report(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Therapy minutes, settings and effectiveness over a date range (default: today)"""
+    start, end = _rollup_range(start, end, 1)
+    try:
+        days = await dashboard_rollups.days(user_id, start, end)
+        return {
+            "user_id": user_id,
+            "start": start.date().isoformat(),
+            "end": end.date().isoformat(),
+            **therapy_report(days)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get therapy report: {str(e)}")
+
+@api_router.get("/recovery/trend/{user_id}")
+async def get_recovery_trend(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = Query("day", pattern="^(day|week)$")
+):
+    """Daily or weekly recovery index and pain levels (default: last 30 days)"""
+    start, end = _rollup_range(start, end, 30)
+    try:
+        days = await dashboard_rollups.days(user_id, start, end)
+        return {
+            "user_id": user_id,
+            "start": start.date().isoformat(),
+            "end": end.date().isoformat(),
+            "granularity": granularity,
+            "trend": trend(days, start, granularity)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recovery trend: {str(e)}")
+
+@api_router.get("/insights/progress/{user_id}")
+async def get_progress_insights(user_id: str, weeks: int = Query(4, ge=1, le=52)):
+    """Weekly recovery trend and subjective vs objective pain over the last few weeks"""
+    start, end = _rollup_range(None, None, weeks * 7)
+    try:
+        days = await dashboard_rollups.days(user_id, start, end)
+        return {"user_id": user_id, "weeks": weeks, **progress(days, start)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get progress insights: {str(e)}")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -431,6 +1217,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_write_behind():
+    write_behind.start()
+
+@app.on_event("startup")
+async def start_worker_services():
+    cpu_pool.start()
+    invalidation_bus.start()
+
+@app.on_event("startup")
+async def setup_vitals_store():
+    try:
+        await vitals_store.setup(db)
+        logger.info(f"Vital signs storage mode: {vitals_store.mode}")
+    except Exception as e:
+        logger.error(f"Vital signs storage setup failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_vitals_change_stream():
+    global change_stream_task
+    if VITALS_STREAM_SOURCE != "changestream":
+        return
+    if vitals_store.mode != "raw":
+        logger.warning(f"Change stream feed needs raw vitals storage (mode is {vitals_store.mode}); publishing locally")
+        return
+    change_stream_task = asyncio.create_task(watch_change_stream(vitals_broker, vitals_store.collection))
+
+@app.on_event("startup")
+async def start_anomaly_checkpoints():
+    global anomaly_checkpoint_task
+    anomaly_checkpoint_task = asyncio.create_task(anomaly_detector.run_checkpoints(ANOMALY_CHECKPOINT_SECONDS))
+
+@app.on_event("startup")
+async def ensure_db_indexes():
+    if os.environ.get('ENSURE_INDEXES_ON_STARTUP', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    try:
+        results = await ensure_indexes(db)
+        ensured = sum(1 for result in results if result["status"] == "ok")
+        dropped = sum(1 for result in results if result["status"] == "dropped")
+        failed = sum(1 for result in results if result["status"] == "failed")
+        logger.info(f"Ensured {ensured} indexes, dropped {dropped} superseded ({failed} failed)")
+    except Exception as e:
+        logger.error(f"Index provisioning failed: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    if change_stream_task is not None:
+        change_stream_task.cancel()
+    await hot_cache.backend.close()
+    await invalidation_bus.close()
+    cpu_pool.shutdown()
+    if anomaly_checkpoint_task is not None:
+        anomaly_checkpoint_task.cancel()
+    try:
+        await anomaly_detector.checkpoint()
+    except Exception as e:
+        logger.error(f"Final anomaly baseline checkpoint failed: {str(e)}")
+    await write_behind.drain()
+    mongo.close()
@@ -0,0 +1,111 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+class EMGFeatures(NamedTuple):
+    rms: np.ndarray            # (windows,) RMS after DC removal, µV
+    envelope_max: np.ndarray   # (windows,) peak of the smoothed envelope
+    peak_count: np.ndarray     # (windows,) bursts crossing the threshold
+    peak: np.ndarray           # (windows,) True when any burst was detected
+    threshold: np.ndarray      # (windows,) detection threshold used
+
+
+class EMGProcessor:
+    """
+    Vectorized EMG feature extraction over a batch of equal-length sample
+    windows (one row per window, e.g. one second of a patch at 1 kHz).
+
+    Every step works on the whole (windows, samples) matrix at once. Scratch
+    buffers are allocated once per input shape and reused across calls, so
+    steady-state processing does no per-call allocation of full-size arrays.
+    One processor per worker; instances are not thread-safe.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 1000,
+        envelope_ms: float = 50.0,
+        threshold_k: float = 3.0,
+        threshold_ratio: float = 2.0,
+        threshold_floor: float = 0.0
+    ):
+        self.sample_rate = sample_rate
+        self.envelope_width = max(1, int(round(sample_rate * envelope_ms / 1000)))
+        self.threshold_k = threshold_k
+        self.threshold_ratio = threshold_ratio
+        self.threshold_floor = threshold_floor
+        self._shape: Optional[Tuple[int, int]] = None
+
+    def _allocate(self, shape: Tuple[int, int]) -> None:
+        windows, samples = shape
+        self._centered = np.empty(shape)
+        self._cumulative = np.empty((windows, samples + 1))
+        self._envelope = np.empty(shape)
+        self._above = np.empty(shape, dtype=bool)
+        # Divisor for the partial moving-average window at the start of each row
+        self._ramp = np.minimum(np.arange(1, samples + 1), self.envelope_width).astype(float)
+        self._shape = shape
+
+    def process(self, windows: np.ndarray) -> EMGFeatures:
+        windows = np.asarray(windows, dtype=np.float64)
+        if windows.ndim != 2 or windows.shape[1] == 0:
+            raise ValueError("EMG windows must be a non-empty 2-D array (windows, samples)")
+        if windows.shape != self._shape:
+            self._allocate(windows.shape)
+
+        width = self.envelope_width
+        centered, cumulative, envelope, above = self._centered, self._cumulative, self._envelope, self._above
+
+        # DC removal and RMS
+        np.subtract(windows, windows.mean(axis=1, keepdims=True), out=centered)
+        rms = np.sqrt(np.einsum("ij,ij->i", centered, centered) / centered.shape[1])
+
+        # Envelope: moving average of the rectified signal via a cumulative sum
+        np.abs(centered, out=centered)
+        cumulative[:, 0] = 0.0
+        np.cumsum(centered, axis=1, out=cumulative[:, 1:])
+        head = min(width, envelope.shape[1])
+        np.subtract(cumulative[:, 1:head + 1], cumulative[:, :1], out=envelope[:, :head])
+        if head < envelope.shape[1]:
+            np.subtract(cumulative[:, width + 1:], cumulative[:, 1:-width], out=envelope[:, width:])
+        envelope /= self._ramp
+
+        # Robust per-window threshold over the envelope's resting level: at
+        # least median + k * scaled MAD and threshold_ratio times the median
+        median = np.median(envelope, axis=1)
+        mad = np.median(np.abs(envelope - median[:, None]), axis=1) * 1.4826
+        threshold = np.maximum(median + self.threshold_k * mad, median * self.threshold_ratio)
+        np.maximum(threshold, self.threshold_floor, out=threshold)
+
+        # Peaks are bursts: rising crossings of the threshold, ignoring the
+        # warm-up samples where the moving average covers a partial window
+        np.greater(envelope, threshold[:, None], out=above)
+        above[:, :width - 1] = False
+        peak_count = np.count_nonzero(above[:, 1:] & ~above[:, :-1], axis=1) + above[:, 0]
+
+        return EMGFeatures(
+            rms=rms,
+            envelope_max=envelope.max(axis=1),
+            peak_count=peak_count,
+            peak=peak_count > 0,
+            threshold=threshold,
+        )
+
+
+# One processor per sample rate, per process (the event loop or a CPU pool worker)
+_processors: Dict[int, EMGProcessor] = {}
+
+
+def process_windows(windows: np.ndarray, sample_rate: int) -> EMGFeatures:
+    processor = _processors.get(sample_rate)
+    if processor is None:
+        processor = _processors[sample_rate] = EMGProcessor(sample_rate=sample_rate)
+    return processor.process(windows)
+
+
+def to_windows(samples, window_size: int) -> np.ndarray:
+    """Reshape a flat sample stream into full windows, dropping a trailing partial one"""
+    samples = np.asarray(samples, dtype=np.float64)
+    full = (samples.size // window_size) * window_size
+    return samples[:full].reshape(-1, window_size)
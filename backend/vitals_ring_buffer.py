@@ -0,0 +1,238 @@
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+
+from vitals_storage import VITAL_FIELDS
+
+# Stored dtype per field; the ints come back out as Python ints
+FIELD_DTYPES = {
+    "emg_rms": np.float64,
+    "heart_rate": np.int64,
+    "hrv": np.float64,
+    "eda_peaks": np.int64,
+    "temperature": np.float64,
+}
+
+
+# Per-user cost outside the ring itself: the LRU entry and its user_id key
+ENTRY_OVERHEAD = 200
+
+
+def _ms(timestamp: datetime) -> int:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return int(np.datetime64(timestamp, "ms").astype(np.int64))
+
+
+class VitalsRing:
+    """
+    The last `capacity` readings of one user as fixed-size column arrays.
+    `head` is the next write position; the oldest reading sits at
+    head - size (mod capacity). ObjectIds are kept as rows of their 12 raw
+    bytes, with has_id marking readings that had one, so the ring holds no
+    Python objects.
+    """
+
+    __slots__ = ("timestamps", "columns", "ids", "has_id", "head", "size")
+
+    def __init__(self, capacity: int):
+        self.timestamps = np.zeros(capacity, dtype=np.int64)  # ms since epoch
+        self.columns = {field: np.zeros(capacity, dtype=FIELD_DTYPES[field]) for field in VITAL_FIELDS}
+        self.ids = np.zeros((capacity, 12), dtype=np.uint8)
+        self.has_id = np.zeros(capacity, dtype=bool)
+        self.head = 0
+        self.size = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.timestamps.size
+
+    @property
+    def newest(self) -> Optional[int]:
+        return int(self.timestamps[self.head - 1]) if self.size else None
+
+    def extend(self, docs: List[Dict]) -> None:
+        """Append readings in timestamp order; only the last `capacity` are kept"""
+        docs = docs[-self.capacity:]
+        count = len(docs)
+        if not count:
+            return
+        positions = (self.head + np.arange(count)) % self.capacity
+        self.timestamps[positions] = [_ms(doc["timestamp"]) for doc in docs]
+        for field, column in self.columns.items():
+            column[positions] = [doc[field] for doc in docs]
+        has_id = [isinstance(doc.get("_id"), ObjectId) for doc in docs]
+        raw = b"".join(doc["_id"].binary if has else bytes(12) for doc, has in zip(docs, has_id))
+        self.ids[positions] = np.frombuffer(raw, dtype=np.uint8).reshape(count, 12)
+        self.has_id[positions] = has_id
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def _positions(self, limit: int) -> np.ndarray:
+        """Ring positions of the newest `limit` readings, oldest first"""
+        count = min(limit, self.size)
+        return (self.head - count + np.arange(count)) % self.capacity
+
+    def columnar(self, limit: int) -> Dict[str, list]:
+        positions = self._positions(limit)
+        result = {"timestamp": self.timestamps[positions].astype("datetime64[ms]").astype("datetime64[us]").tolist()}
+        for field, column in self.columns.items():
+            result[field] = column[positions].tolist()
+        return result
+
+    def records(self, user_id: str, limit: int) -> List[Dict]:
+        """Newest first, shaped like vital_signs documents"""
+        columns = self.columnar(limit)
+        positions = self._positions(limit)
+        ids = self.ids[positions]
+        has_id = self.has_id[positions].tolist()
+        records = []
+        for index in range(len(has_id) - 1, -1, -1):
+            record = {"user_id": user_id, **{field: columns[field][index] for field in VITAL_FIELDS}}
+            record["timestamp"] = columns["timestamp"][index]
+            if has_id[index]:
+                record["_id"] = ObjectId(ids[index].tobytes())
+            records.append(record)
+        return records
+
+    def window(self, since_ms: int) -> Dict:
+        """count/min/max/mean per field over readings at or after since_ms"""
+        positions = self._positions(self.size)
+        selected = positions[self.timestamps[positions] >= since_ms]
+        stats = {"count": int(selected.size)}
+        for field, column in self.columns.items():
+            values = column[selected]
+            stats[field] = {
+                "min": values.min().item(),
+                "max": values.max().item(),
+                "mean": round(float(values.mean()), 2),
+            } if values.size else None
+        # A full ring whose oldest reading is inside the window has lost the rest of it
+        stats["truncated"] = bool(self.size == self.capacity and selected.size == self.size and self.size)
+        return stats
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held for this user: arrays with their headers, the ring and its LRU entry"""
+        arrays = [self.timestamps, self.ids, self.has_id, *self.columns.values()]
+        return (
+            sum(sys.getsizeof(array) for array in arrays)
+            + sys.getsizeof(self)
+            + sys.getsizeof(self.columns)
+            + ENTRY_OVERHEAD
+        )
+
+
+class VitalsRingBuffers:
+    """
+    Recent readings per user, held in memory so "last N points" and
+    short-window aggregates don't touch the database. Rings are warmed
+    lazily from the vitals store on first read and kept current by the
+    ingest path; the least recently used users are evicted to keep total
+    memory under max_bytes.
+
+    Only users already in memory are appended to on ingest: a ring built
+    from new readings alone would be missing the user's history. A
+    reading older than the ring's newest drops the ring, and the next
+    read re-warms it in order.
+    """
+
+    def __init__(self, store, capacity: int = 128, max_bytes: int = 64 * 1024 * 1024):
+        self.store = store
+        self.capacity = capacity
+        self.max_users = max(1, max_bytes // VitalsRing(capacity).nbytes)
+        self._rings: "OrderedDict[str, VitalsRing]" = OrderedDict()
+        # user_id -> [warm-up queries in flight, readings ingested meanwhile]
+        self._warming: Dict[str, list] = {}
+        self._metrics = {"hits": 0, "warms": 0, "evictions": 0, "dropped": 0, "fallbacks": 0}
+
+    def append(self, docs: List[Dict]) -> None:
+        """Fold newly stored readings into resident rings"""
+        by_user: Dict[str, List[Dict]] = {}
+        for doc in docs:
+            by_user.setdefault(doc["user_id"], []).append(doc)
+        for user_id, user_docs in by_user.items():
+            if user_id in self._warming:
+                self._warming[user_id][1] = True
+            ring = self._rings.get(user_id)
+            if ring is None:
+                continue
+            user_docs.sort(key=lambda doc: doc["timestamp"])
+            newest = ring.newest
+            if newest is not None and _ms(user_docs[0]["timestamp"]) < newest:
+                del self._rings[user_id]
+                self._metrics["dropped"] += 1
+                continue
+            ring.extend(user_docs)
+
+    def invalidate(self, user_id: str) -> None:
+        if user_id in self._warming:
+            self._warming[user_id][1] = True
+        if self._rings.pop(user_id, None) is not None:
+            self._metrics["dropped"] += 1
+
+    def clear(self) -> None:
+        self._metrics["dropped"] += len(self._rings)
+        self._rings.clear()
+
+    async def ring(self, user_id: str) -> VitalsRing:
+        ring = self._rings.get(user_id)
+        if ring is not None:
+            self._rings.move_to_end(user_id)
+            self._metrics["hits"] += 1
+            return ring
+
+        warming = self._warming.setdefault(user_id, [0, False])
+        warming[0] += 1
+        try:
+            docs = await self.store.recent(user_id, self.capacity)
+        finally:
+            warming[0] -= 1
+            raced = warming[1]
+            if not warming[0]:
+                del self._warming[user_id]
+        ring = VitalsRing(self.capacity)
+        ring.extend(list(reversed(docs)))
+        self._metrics["warms"] += 1
+        # Readings stored during the query may or may not be in its result;
+        # serve this ring once but don't keep it
+        if not raced and user_id not in self._rings:
+            self._rings[user_id] = ring
+            while len(self._rings) > self.max_users:
+                self._rings.popitem(last=False)
+                self._metrics["evictions"] += 1
+        return ring
+
+    async def recent(self, user_id: str, limit: int) -> List[Dict]:
+        """Latest readings, newest first; same contract as the vitals store's recent()"""
+        if limit > self.capacity:
+            self._metrics["fallbacks"] += 1
+            return await self.store.recent(user_id, limit)
+        return (await self.ring(user_id)).records(user_id, limit)
+
+    async def columnar(self, user_id: str, limit: int) -> Dict[str, list]:
+        return (await self.ring(user_id)).columnar(min(limit, self.capacity))
+
+    async def window(self, user_id: str, seconds: float) -> Dict:
+        since = datetime.utcnow() - timedelta(seconds=seconds)
+        return (await self.ring(user_id)).window(_ms(since))
+
+    def stats(self) -> Dict:
+        metrics = dict(self._metrics)
+        metrics["users"] = len(self._rings)
+        metrics["max_users"] = self.max_users
+        metrics["capacity"] = self.capacity
+        return metrics
+
+
+def create_vitals_ring_buffers(store) -> VitalsRingBuffers:
+    return VitalsRingBuffers(
+        store,
+        capacity=int(os.environ.get("VITALS_RING_CAPACITY", "128")),
+        max_bytes=int(float(os.environ.get("VITALS_RING_MAX_MB", "64")) * 1024 * 1024),
+    )
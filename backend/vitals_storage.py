@@ -0,0 +1,306 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from pagination import Cursor, keyset_filter, keyset_sort
+
+logger = logging.getLogger(__name__)
+
+VITAL_FIELDS = ("emg_rms", "heart_rate", "hrv", "eda_peaks", "temperature")
+
+# Resolutions accepted by $dateTrunc that are at least as coarse as a bucket
+BUCKET_RESOLUTIONS = ("hour", "day", "week", "month")
+RESOLUTIONS = ("minute",) + BUCKET_RESOLUTIONS
+
+
+def _field_accumulators() -> Dict:
+    accumulators = {"count": {"$sum": 1}}
+    for field in VITAL_FIELDS:
+        accumulators[f"{field}_min"] = {"$min": f"${field}"}
+        accumulators[f"{field}_max"] = {"$max": f"${field}"}
+        accumulators[f"{field}_mean"] = {"$avg": f"${field}"}
+    return accumulators
+
+
+def _format_rollup(row: Dict) -> Dict:
+    rollup = {"start": row["_id"], "count": row["count"]}
+    for field in VITAL_FIELDS:
+        rollup[field] = {
+            "min": row[f"{field}_min"],
+            "max": row[f"{field}_max"],
+            "mean": row[f"{field}_mean"],
+        }
+    return rollup
+
+
+class RawVitalsStore:
+    """One document per reading (the original storage layout)"""
+
+    mode = "raw"
+
+    def __init__(self, collection, chunk_size: int = 1000):
+        self.collection = collection
+        self.chunk_size = chunk_size
+
+    async def setup(self, db) -> None:
+        pass
+
+    async def insert_one(self, doc: Dict) -> str:
+        result = await self.collection.insert_one(doc)
+        return str(result.inserted_id)
+
+    async def insert_many(self, docs: List[Dict]) -> Dict[int, str]:
+        """Unordered bulk insert in bounded chunks; returns write errors keyed by position"""
+        errors = {}
+        for start in range(0, len(docs), self.chunk_size):
+            chunk = docs[start:start + self.chunk_size]
+            try:
+                await self.collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    errors[start + write_error["index"]] = write_error.get("errmsg", "Write failed")
+            except Exception as e:
+                logger.error(f"Vital signs chunk insert failed: {str(e)}")
+                for position in range(start, start + len(chunk)):
+                    errors[position] = f"Write failed: {str(e)}"
+        return errors
+
+    async def latest(self, user_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"user_id": user_id}, sort=[("timestamp", -1)])
+
+    async def recent(self, user_id: str, limit: int) -> List[Dict]:
+        """Latest readings, newest first"""
+        return await self.collection.find(
+            {"user_id": user_id}
+        ).sort("timestamp", -1).limit(limit).to_list(limit)
+
+    async def count(self, user_id: str) -> int:
+        return await self.collection.count_documents({"user_id": user_id})
+
+    async def history(self, user_id: str, cursor: Optional[Cursor], limit: int) -> List[Dict]:
+        """Keyset page of readings after the cursor, newest first"""
+        return await self.collection.find(
+            {"user_id": user_id, **keyset_filter("timestamp", cursor)}
+        ).sort(keyset_sort("timestamp")).limit(limit).to_list(limit)
+
+    async def iter_history(self, user_id: str) -> AsyncIterator[Dict]:
+        """Every reading for a user, newest first, streamed off the cursor"""
+        async for reading in self.collection.find({"user_id": user_id}).sort(keyset_sort("timestamp")):
+            yield reading
+
+    async def rollups(self, user_id: str, start: datetime, end: datetime, resolution: str) -> List[Dict]:
+        pipeline = [
+            {"$match": {"user_id": user_id, "timestamp": {"$gte": start, "$lt": end}}},
+            {"$group": {"_id": {"$dateTrunc": {"date": "$timestamp", "unit": resolution}}, **_field_accumulators()}},
+            {"$sort": {"_id": 1}},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(None)
+        return [_format_rollup(row) for row in rows]
+
+
+class TimeSeriesVitalsStore(RawVitalsStore):
+    """
+    One document per reading in a native MongoDB (5.0+) time-series
+    collection, which buckets and compresses readings internally.
+    """
+
+    mode = "timeseries"
+
+    async def setup(self, db) -> None:
+        try:
+            await db.create_collection(
+                self.collection.name,
+                timeseries={"timeField": "timestamp", "metaField": "user_id", "granularity": "seconds"}
+            )
+        except CollectionInvalid:
+            pass  # already exists
+
+
+class BucketedVitalsStore:
+    """
+    Readings grouped into one document per user per hour. Each bucket keeps
+    its samples in arrival order together with the first/last timestamp and
+    running count/sum/min/max per field, so rollups at hour resolution or
+    coarser never touch samples. Ingest is almost always in time order, so
+    samples are appended as they come and ordered on read.
+    """
+
+    mode = "bucket"
+    bucket_size = timedelta(hours=1)
+
+    def __init__(self, collection, chunk_size: int = 1000):
+        self.collection = collection
+        self.chunk_size = chunk_size
+
+    async def setup(self, db) -> None:
+        pass
+
+    @staticmethod
+    def bucket_start(timestamp: datetime) -> datetime:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def _sample(doc: Dict) -> Dict:
+        doc.setdefault("_id", ObjectId())
+        sample = {"_id": doc["_id"], "timestamp": doc["timestamp"]}
+        for field in VITAL_FIELDS:
+            sample[field] = doc[field]
+        return sample
+
+    @staticmethod
+    def _ordered(user_id: str, samples: List[Dict]) -> List[Dict]:
+        """A bucket's readings, newest first (already-ordered samples sort in linear time)"""
+        ordered = sorted(samples, key=lambda sample: (sample["timestamp"], sample["_id"]), reverse=True)
+        return [{"user_id": user_id, **sample} for sample in ordered]
+
+    def _bucket_update(self, user_id: str, bucket_start: datetime, docs: List[Dict]) -> UpdateOne:
+        timestamps = [doc["timestamp"] for doc in docs]
+        update = {
+            "$push": {"samples": {"$each": [self._sample(doc) for doc in docs]}},
+            "$inc": {"count": len(docs)},
+            "$min": {"first": min(timestamps)},
+            "$max": {"last": max(timestamps)},
+            "$setOnInsert": {"bucket_end": bucket_start + self.bucket_size},
+        }
+        for field in VITAL_FIELDS:
+            values = [doc[field] for doc in docs]
+            update["$inc"][f"stats.{field}.sum"] = sum(values)
+            update["$min"][f"stats.{field}.min"] = min(values)
+            update["$max"][f"stats.{field}.max"] = max(values)
+        return UpdateOne({"user_id": user_id, "bucket_start": bucket_start}, update, upsert=True)
+
+    async def insert_one(self, doc: Dict) -> str:
+        await self.collection.bulk_write([self._bucket_update(doc["user_id"], self.bucket_start(doc["timestamp"]), [doc])])
+        return str(doc["_id"])
+
+    async def insert_many(self, docs: List[Dict]) -> Dict[int, str]:
+        """Fold readings into their buckets; returns write errors keyed by position"""
+        errors = {}
+        for start in range(0, len(docs), self.chunk_size):
+            groups: Dict[tuple, List[int]] = {}
+            for position in range(start, min(start + self.chunk_size, len(docs))):
+                doc = docs[position]
+                groups.setdefault((doc["user_id"], self.bucket_start(doc["timestamp"])), []).append(position)
+
+            keys = list(groups)
+            operations = [
+                self._bucket_update(user_id, bucket_start, [docs[p] for p in groups[(user_id, bucket_start)]])
+                for user_id, bucket_start in keys
+            ]
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for write_error in e.details.get("writeErrors", []):
+                    for position in groups[keys[write_error["index"]]]:
+                        errors[position] = write_error.get("errmsg", "Write failed")
+            except Exception as e:
+                logger.error(f"Vital signs bucket write failed: {str(e)}")
+                for positions in groups.values():
+                    for position in positions:
+                        errors[position] = f"Write failed: {str(e)}"
+        return errors
+
+    async def latest(self, user_id: str) -> Optional[Dict]:
+        bucket = await self.collection.find_one(
+            {"user_id": user_id},
+            {"last": 1, "samples": {"$slice": -1}},
+            sort=[("bucket_start", -1)]
+        )
+        if not bucket or not bucket.get("samples"):
+            return None
+        sample = bucket["samples"][-1]
+        if "last" in bucket and sample["timestamp"] < bucket["last"]:
+            # The last append was out of order: read the whole bucket
+            bucket = await self.collection.find_one({"_id": bucket["_id"]}, {"samples": 1})
+            return self._ordered(user_id, bucket["samples"])[0]
+        return {"user_id": user_id, **sample}
+
+    async def recent(self, user_id: str, limit: int) -> List[Dict]:
+        """Latest readings, newest first"""
+        readings = []
+        cursor = self.collection.find({"user_id": user_id}, {"samples": 1}, sort=[("bucket_start", -1)], batch_size=2)
+        async for bucket in cursor:
+            readings.extend(self._ordered(user_id, bucket.get("samples", [])))
+            if len(readings) >= limit:
+                break
+        return readings[:limit]
+
+    async def count(self, user_id: str) -> int:
+        rows = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+        ]).to_list(1)
+        return rows[0]["count"] if rows else 0
+
+    async def history(self, user_id: str, cursor: Optional[Cursor], limit: int) -> List[Dict]:
+        """
+        Keyset page of readings after the cursor, newest first. Walks buckets
+        newest first from the one holding the cursor and stops as soon as the
+        page is full, so a page reads a bucket or two rather than the history.
+        """
+        bucket_match = {"user_id": user_id}
+        if cursor is not None:
+            bucket_match["bucket_start"] = {"$lte": cursor.sort_value}
+        readings = []
+        buckets = self.collection.find(bucket_match, {"samples": 1}, sort=[("bucket_start", -1)], batch_size=2)
+        async for bucket in buckets:
+            for reading in self._ordered(user_id, bucket.get("samples", [])):
+                if cursor is None or (reading["timestamp"], reading["_id"]) < (cursor.sort_value, cursor.object_id):
+                    readings.append(reading)
+            if len(readings) >= limit:
+                break
+        return readings[:limit]
+
+    async def iter_history(self, user_id: str) -> AsyncIterator[Dict]:
+        """Every reading for a user, newest first, one bucket in memory at a time"""
+        async for bucket in self.collection.find({"user_id": user_id}, batch_size=1).sort("bucket_start", -1):
+            for reading in self._ordered(user_id, bucket.get("samples", [])):
+                yield reading
+
+    async def rollups(self, user_id: str, start: datetime, end: datetime, resolution: str) -> List[Dict]:
+        if resolution not in BUCKET_RESOLUTIONS:
+            # Finer than a bucket: fall back to the samples themselves
+            pipeline = [
+                {"$match": {"user_id": user_id, "bucket_start": {"$gte": self.bucket_start(start), "$lt": end}}},
+                {"$unwind": "$samples"},
+                {"$replaceRoot": {"newRoot": "$samples"}},
+                {"$match": {"timestamp": {"$gte": start, "$lt": end}}},
+                {"$group": {"_id": {"$dateTrunc": {"date": "$timestamp", "unit": resolution}}, **_field_accumulators()}},
+                {"$sort": {"_id": 1}},
+            ]
+            rows = await self.collection.aggregate(pipeline).to_list(None)
+            return [_format_rollup(row) for row in rows]
+
+        group = {"_id": {"$dateTrunc": {"date": "$bucket_start", "unit": resolution}}, "count": {"$sum": "$count"}}
+        for field in VITAL_FIELDS:
+            group[f"{field}_min"] = {"$min": f"$stats.{field}.min"}
+            group[f"{field}_max"] = {"$max": f"$stats.{field}.max"}
+            group[f"{field}_sum"] = {"$sum": f"$stats.{field}.sum"}
+        pipeline = [
+            {"$match": {"user_id": user_id, "bucket_start": {"$gte": self.bucket_start(start), "$lt": end}}},
+            {"$group": group},
+            {"$sort": {"_id": 1}},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(None)
+        for row in rows:
+            for field in VITAL_FIELDS:
+                row[f"{field}_mean"] = row.pop(f"{field}_sum") / row["count"] if row["count"] else None
+        return [_format_rollup(row) for row in rows]
+
+
+def create_vitals_store(db, chunk_size: int = 1000):
+    """Pick the storage backend from VITALS_STORAGE_MODE (raw | bucket | timeseries)"""
+    mode = os.environ.get("VITALS_STORAGE_MODE", "raw").lower()
+    if mode == "bucket":
+        return BucketedVitalsStore(db.vital_signs_buckets, chunk_size=chunk_size)
+    if mode == "timeseries":
+        collection = os.environ.get("VITALS_TIMESERIES_COLLECTION", "vital_signs_ts")
+        return TimeSeriesVitalsStore(db[collection], chunk_size=chunk_size)
+    if mode != "raw":
+        logger.warning(f"Unknown VITALS_STORAGE_MODE '{mode}', using raw storage")
+    return RawVitalsStore(db.vital_signs, chunk_size=chunk_size)
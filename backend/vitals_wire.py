@@ -0,0 +1,159 @@
+"""
+Compact binary upload format for vital signs readings.
+
+One frame carries many readings from one patch, column by column:
+
+    header      <2sBBIHq6x magic b"BV", version, flags, count,
+                           user_id length, base timestamp (ms since epoch, UTC),
+                           zero-padded to 24 bytes
+    user_id     utf-8, zero-padded to a multiple of 8 bytes
+    deltas      uint32[count]   ms since the previous reading (the first
+                                is relative to the base timestamp)
+    emg_rms     float32[count]
+    hrv         float32[count]
+    temperature float32[count]
+    heart_rate  uint16[count]
+    eda_peaks   uint16[count]
+
+All integers and floats are little-endian. A reading is ~20 bytes instead
+of ~150 as JSON, and decoding maps the columns straight out of the request
+body with np.frombuffer instead of parsing text.
+"""
+
+import struct
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+MEDIA_TYPE = "application/vnd.biopatch.vitals"
+MAGIC = b"BV"
+VERSION = 1
+
+HEADER = struct.Struct("<2sBBIHq6x")
+DELTA_DTYPE = np.dtype("<u4")
+# The header and user id are padded to 8 bytes and the columns go widest
+# first, so every column starts on its natural alignment
+COLUMNS: Tuple[Tuple[str, np.dtype], ...] = (
+    ("emg_rms", np.dtype("<f4")),
+    ("hrv", np.dtype("<f4")),
+    ("temperature", np.dtype("<f4")),
+    ("heart_rate", np.dtype("<u2")),
+    ("eda_peaks", np.dtype("<u2")),
+)
+FLOAT_COLUMNS = tuple(name for name, dtype in COLUMNS if dtype.kind == "f")
+# Decimal places kept when widening float32 values back to Python floats
+ROUNDING = {"emg_rms": 2, "hrv": 2, "temperature": 2}
+
+EPOCH = np.datetime64(0, "ms")
+# Latest timestamp a Python datetime can hold (9999-12-31T23:59:59.999)
+MAX_MS = int((np.datetime64("10000-01-01", "ms") - EPOCH).astype(np.int64)) - 1
+
+
+class WireFormatError(ValueError):
+    """The frame is malformed as a whole (individual bad readings are not)"""
+
+
+class VitalsFrame(NamedTuple):
+    user_id: str
+    timestamps: np.ndarray       # datetime64[ms], one per reading
+    columns: Dict[str, np.ndarray]
+
+
+def _padded(length: int) -> int:
+    return (length + 7) // 8 * 8
+
+
+def frame_size(user_id_length: int, count: int) -> int:
+    return (
+        HEADER.size
+        + _padded(user_id_length)
+        + count * (DELTA_DTYPE.itemsize + sum(dtype.itemsize for _, dtype in COLUMNS))
+    )
+
+
+def encode(user_id: str, timestamps_ms: np.ndarray, columns: Dict[str, np.ndarray]) -> bytes:
+    """Pack readings for one user; timestamps are ms since epoch in non-decreasing order"""
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    if timestamps_ms.size == 0:
+        raise WireFormatError("Frame must carry at least one reading")
+    deltas = np.diff(timestamps_ms, prepend=timestamps_ms[0])
+    if (deltas < 0).any() or (deltas > np.iinfo(DELTA_DTYPE).max).any():
+        raise WireFormatError("Timestamps must be sorted with gaps under 49 days")
+
+    user_id_bytes = user_id.encode("utf-8")
+    parts = [
+        HEADER.pack(MAGIC, VERSION, 0, timestamps_ms.size, len(user_id_bytes), int(timestamps_ms[0])),
+        user_id_bytes.ljust(_padded(len(user_id_bytes)), b"\0"),
+        deltas.astype(DELTA_DTYPE).tobytes(),
+    ]
+    for name, dtype in COLUMNS:
+        parts.append(np.asarray(columns[name]).astype(dtype).tobytes())
+    return b"".join(parts)
+
+
+def decode(body: bytes) -> VitalsFrame:
+    """Map a frame's columns without copying; raises WireFormatError"""
+    if len(body) < HEADER.size:
+        raise WireFormatError("Frame is shorter than its header")
+    magic, version, _flags, count, user_id_length, base_ms = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise WireFormatError("Not a vitals frame")
+    if version != VERSION:
+        raise WireFormatError(f"Unsupported frame version {version}")
+    if len(body) != frame_size(user_id_length, count):
+        raise WireFormatError(f"Frame is {len(body)} bytes, expected {frame_size(user_id_length, count)} for {count} readings")
+
+    buffer = memoryview(body)
+    offset = HEADER.size
+    try:
+        user_id = bytes(buffer[offset:offset + user_id_length]).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise WireFormatError(f"Malformed user id: {str(e)}")
+    if not user_id:
+        raise WireFormatError("Frame has no user id")
+    offset += _padded(user_id_length)
+
+    deltas = np.frombuffer(buffer, dtype=DELTA_DTYPE, count=count, offset=offset)
+    offset += deltas.nbytes
+    columns = {}
+    for name, dtype in COLUMNS:
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        offset += columns[name].nbytes
+
+    offsets = np.cumsum(deltas, dtype=np.int64)
+    span = int(offsets[-1]) if count else 0
+    if not 0 <= base_ms <= MAX_MS - span:
+        raise WireFormatError("Timestamps fall outside 1970-01-01 to 9999-12-31")
+    timestamps = EPOCH + (base_ms + offsets).astype("timedelta64[ms]")
+    return VitalsFrame(user_id, timestamps, columns)
+
+
+def to_documents(frame: VitalsFrame) -> Tuple[List[Dict], Dict[int, str]]:
+    """
+    Build vital_signs documents from a frame. Readings with non-finite
+    values are rejected individually; returns (documents, {index: error}).
+    """
+    valid = np.ones(frame.timestamps.size, dtype=bool)
+    for name in FLOAT_COLUMNS:
+        valid &= np.isfinite(frame.columns[name])
+    rejected = {int(index): "Non-finite measurement" for index in np.flatnonzero(~valid)}
+
+    # Convert column-wise, then zip: one tolist() per column instead of
+    # a Python conversion per value
+    timestamps: List[datetime] = frame.timestamps[valid].astype("datetime64[us]").tolist()
+    values = {}
+    for name, _ in COLUMNS:
+        column = frame.columns[name][valid]
+        if name in ROUNDING:
+            column = column.astype(np.float64).round(ROUNDING[name])
+        values[name] = column.tolist()
+
+    # Same field order as UserVitalSigns
+    names = ["emg_rms", "heart_rate", "hrv", "eda_peaks", "temperature"]
+    user_id = frame.user_id
+    documents = [
+        {"user_id": user_id, **dict(zip(names, row)), "timestamp": timestamp}
+        for row, timestamp in zip(zip(*(values[name] for name in names)), timestamps)
+    ]
+    return documents, rejected
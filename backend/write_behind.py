@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    """
+    Buffers inserts that the client doesn't need acknowledged and writes
+    them in batches from a background task. Batches are flushed when
+    `batch_size` documents are pending or `flush_interval` seconds have
+    passed. Failed inserts are retried with exponential backoff; pymongo
+    assigns _id on the first attempt, so retries are idempotent.
+    """
+
+    def __init__(
+        self,
+        db,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        max_retries: int = 5,
+        base_backoff: float = 0.2
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._queue: "asyncio.Queue[Tuple[str, Dict]]" = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._metrics = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "retries": 0,
+            "dropped": 0,
+            "overflow_inline_writes": 0,
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, collection_name: str, document: Dict) -> None:
+        """
+        Queue a document for insertion. When the queue is full or not running
+        the document is written inline instead, trading latency for memory.
+        """
+        if self._task is not None and not self._closing:
+            try:
+                self._queue.put_nowait((collection_name, document))
+                self._metrics["enqueued"] += 1
+                return
+            except asyncio.QueueFull:
+                pass
+        self._metrics["overflow_inline_writes"] += 1
+        await self.db[collection_name].insert_one(document)
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Stop accepting documents and flush everything still queued"""
+        self._closing = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error(f"Write-behind drain timed out with {self._queue.qsize()} documents unwritten")
+        self._task = None
+
+    async def _next_batch(self) -> List[Tuple[str, Dict]]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while not (self._closing and self._queue.empty()):
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            by_collection: Dict[str, List[Dict]] = {}
+            for collection_name, document in batch:
+                by_collection.setdefault(collection_name, []).append(document)
+            await asyncio.gather(*(
+                self._write(collection_name, documents)
+                for collection_name, documents in by_collection.items()
+            ))
+            self._metrics["batches"] += 1
+
+    async def _write(self, collection_name: str, documents: List[Dict]) -> None:
+        pending = documents
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.db[collection_name].insert_many(pending, ordered=False)
+                self._metrics["written"] += len(pending)
+                return
+            except BulkWriteError as e:
+                retry = [
+                    pending[write_error["index"]]
+                    for write_error in e.details.get("writeErrors", [])
+                    if write_error.get("code") != DUPLICATE_KEY
+                ]
+                self._metrics["written"] += len(pending) - len(retry)
+                pending = retry
+                if not pending:
+                    return
+                error = e
+            except Exception as e:
+                error = e
+            if attempt < self.max_retries:
+                self._metrics["retries"] += 1
+                await asyncio.sleep(self.base_backoff * 2 ** attempt)
+
+        self._metrics["dropped"] += len(pending)
+        logger.error(f"Dropping {len(pending)} {collection_name} documents after {self.max_retries} retries: {str(error)}")
+
+    def stats(self) -> Dict:
+        metrics = dict(self._metrics)
+        metrics["depth"] = self._queue.qsize()
+        metrics["max_size"] = self._queue.maxsize
+        metrics["running"] = self._task is not None
+        return metrics
+
+
+def create_write_behind_queue(db) -> WriteBehindQueue:
+    return WriteBehindQueue(
+        db,
+        max_size=int(os.environ.get("WRITE_BEHIND_MAX_SIZE", "10000")),
+        batch_size=int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500")),
+        flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL_SECONDS", "0.5")),
+        max_retries=int(os.environ.get("WRITE_BEHIND_MAX_RETRIES", "5")),
+    )
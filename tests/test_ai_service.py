@@ -0,0 +1,77 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from ai_service import AIRecommendationService
+from llm_stub import STUB_RESPONSE, StubGenAIClient
+
+USER_DATA = {
+    "user_id": "u",
+    "age": 40,
+    "gender": "Nam",
+    "pain_location": "Cổ và vai",
+    "pain_level": 4,
+    "emg_rms": 70.0,
+    "heart_rate": 70,
+    "hrv": 40.0,
+    "eda_peaks": 5,
+    "temperature": 38.2,
+    "inflammation": "Cao",
+    "recovery_score": 60,
+}
+
+ANSWER = {
+    **STUB_RESPONSE,
+    "recommendations": [dict(STUB_RESPONSE["recommendations"][0], id=index) for index in (1, 2)],
+}
+
+
+class FailingStreamClient(StubGenAIClient):
+    """Streams the first `fail_after` characters of the answer, then raises"""
+
+    def __init__(self, fail_after: int):
+        super().__init__(latency=0)
+        self.fail_after = fail_after
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        return SimpleNamespace(text=json.dumps(ANSWER, ensure_ascii=False), usage_metadata=None)
+
+    async def _chunks(self, response, size: int = 64):
+        text = response.text[:self.fail_after]
+        for start in range(0, len(text), size):
+            yield SimpleNamespace(text=text[start:start + size], usage_metadata=None)
+        raise ConnectionError("stream reset")
+
+
+def stream(client):
+    async def collect():
+        service = AIRecommendationService(client=client)
+        return [event async for event in service.stream_recommendations(USER_DATA)]
+
+    return asyncio.run(collect())
+
+
+def test_complete_stream():
+    events = stream(StubGenAIClient(latency=0))
+
+    assert [event_type for event_type, _ in events] == ["recommendation", "done"]
+    done = events[-1][1]
+    assert done["source"] == "gemini" and not done["repaired"] and "partial" not in done
+
+
+def test_failure_after_delivery_is_partial():
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    # Cut inside the second recommendation
+    events = stream(FailingStreamClient(fail_after=text.index('"id": 2') + 10))
+
+    assert [data["id"] for event_type, data in events if event_type == "recommendation"] == [1]
+    done = events[-1][1]
+    assert done["source"] == "gemini" and done["partial"] and done["repaired"]
+
+
+def test_failure_before_delivery_falls_back():
+    events = stream(FailingStreamClient(fail_after=10))
+
+    done = events[-1][1]
+    assert done["source"] == "fallback" and "partial" not in done
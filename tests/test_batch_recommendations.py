@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from ai_service import AIRecommendationService
+from batch_recommendations import RecommendationBatchJob
+from llm_stub import STUB_RESPONSE, StubGenAIClient
+from recommendation_cache import RecommendationCache
+
+VITALS = {"emg_rms": 30.0, "heart_rate": 70, "hrv": 40.0, "eda_peaks": 5, "temperature": 36.6}
+
+# user -> (vitals changes, pain level): one state per rule tier outcome
+USERS = {
+    "u-complex": ({"emg_rms": 70.0, "temperature": 38.2}, 4),
+    "u-rules": ({}, 4),
+    "u-severe": ({"emg_rms": 70.0, "temperature": 38.2}, 9),
+}
+
+
+async def seed(db, vitals_at):
+    for user_id, (changes, pain_level) in USERS.items():
+        await db.recovery_state.insert_one({"user_id": user_id, "vitals_at": vitals_at})
+        await db.vital_signs.insert_one({"user_id": user_id, "timestamp": vitals_at, **VITALS, **changes})
+        await db.user_profiles.insert_one({"user_id": user_id, "age": 40, "pain_level": pain_level})
+
+
+def run_job(db, client, **kwargs):
+    service = AIRecommendationService(client=client)
+    job = RecommendationBatchJob(db, service, concurrency=2, rate_per_minute=0, job_id="test", **kwargs)
+    return asyncio.run(job.run(datetime.utcnow() - timedelta(hours=24)))
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["batch_test"]
+
+
+@pytest.fixture
+def vitals_at(db):
+    vitals_at = datetime.utcnow() - timedelta(hours=1)
+    asyncio.run(seed(db, vitals_at))
+    return vitals_at
+
+
+def test_only_llm_states_are_precomputed(db, vitals_at):
+    client = StubGenAIClient(latency=0)
+    stats = run_job(db, client)
+
+    assert stats == {"scanned": 3, "generated": 1, "rules": 1, "escalated": 1, "failed": 0}
+    assert client.calls == 1
+    records = asyncio.run(db.ai_recommendations.find({"precomputed": True}).to_list(None))
+    assert [record["user_id"] for record in records] == ["u-complex"]
+    assert records[0]["fingerprint"]
+    checkpoint = asyncio.run(db.batch_jobs.find_one({"_id": "test"}))
+    assert checkpoint["status"] == "completed" and checkpoint["last_user_id"] == "u-severe"
+
+
+def test_fresh_recommendations_are_not_regenerated(db, vitals_at):
+    run_job(db, StubGenAIClient(latency=0))
+    client = StubGenAIClient(latency=0)
+    stats = run_job(db, client, checkpoint_every=1)
+
+    assert stats["generated"] == 0 and client.calls == 0
+
+
+def test_precomputed_answer_served_only_for_the_same_state(db, vitals_at):
+    run_job(db, StubGenAIClient(latency=0))
+    snapshot = asyncio.run(db.ai_recommendations.find_one({"precomputed": True}))["user_data_snapshot"]
+    cache = RecommendationCache(precomputed_collection=db.ai_recommendations)
+
+    async def lookups():
+        return (
+            await cache.get(snapshot, vitals_at=vitals_at),
+            await cache.get({**snapshot, "pain_level": 6}, vitals_at=vitals_at),
+            await cache.get(snapshot, vitals_at=datetime.utcnow()),
+            await cache.get(snapshot),
+        )
+
+    same, changed, newer_reading, no_vitals = asyncio.run(lookups())
+    assert same["summary"] == STUB_RESPONSE["summary"]
+    assert changed is None and newer_reading is None and no_vitals is None
+    assert cache.stats()["precomputed_hits"] == 1 and cache.stats()["precomputed_misses"] == 2
@@ -0,0 +1,78 @@
+import asyncio
+
+import hot_cache
+from hot_cache import HotDataCache, LocalCacheBackend
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_fill_after_read():
+    async def scenario():
+        cache = HotDataCache(LocalCacheBackend())
+        generation = cache.generation()
+        await cache.set("profile", "u", {"age": 40}, generation)
+        return await cache.get("profile", "u")
+
+    assert run(scenario()) == {"age": 40}
+
+
+def test_read_racing_an_invalidation_is_not_cached():
+    async def scenario():
+        cache = HotDataCache(LocalCacheBackend())
+        generation = cache.generation()          # read starts
+        await cache.invalidate("u", "profile")   # a write lands meanwhile
+        await cache.set("profile", "u", {"age": 40}, generation)
+        return await cache.get("profile", "u"), cache.stale_fills
+
+    assert run(scenario()) == (None, 1)
+
+
+def test_invalidation_of_other_keys_does_not_block_fills():
+    async def scenario():
+        cache = HotDataCache(LocalCacheBackend())
+        generation = cache.generation()
+        await cache.invalidate("other", "profile")
+        await cache.invalidate("u", "insights")
+        await cache.set("profile", "u", {"age": 40}, generation)
+        return await cache.get("profile", "u")
+
+    assert run(scenario()) == {"age": 40}
+
+
+def test_fresh_read_until_first_fill():
+    async def scenario():
+        cache = HotDataCache(LocalCacheBackend())
+        states = [cache.fresh_read_required("insights", "u")]
+        await cache.invalidate("u", "insights")
+        states.append(cache.fresh_read_required("insights", "u"))
+        await cache.set("insights", "u", {"emg_data": []}, cache.generation())
+        states.append(cache.fresh_read_required("insights", "u"))
+        return states
+
+    assert run(scenario()) == [False, True, False]
+
+
+def test_remote_invalidation_only_bumps_generation():
+    async def scenario():
+        cache = HotDataCache(LocalCacheBackend())
+        await cache.set("profile", "u", {"age": 40}, cache.generation())
+        generation = cache.generation()
+        cache.mark_invalidated("u", "profile")
+        await cache.set("profile", "u", {"age": 41}, generation)
+        return await cache.get("profile", "u")
+
+    # The shared entry is the writer's to delete; the stale fill is dropped
+    assert run(scenario()) == {"age": 40}
+
+
+def test_old_invalidations_are_pruned(monkeypatch):
+    clock = iter([0.0, 30.0, 61.0])
+    monkeypatch.setattr(hot_cache.time, "monotonic", lambda: next(clock))
+    cache = HotDataCache(LocalCacheBackend(), read_window=60.0)
+    cache.mark_invalidated("a", "profile")
+    cache.mark_invalidated("b", "profile")
+    cache.mark_invalidated("c", "profile")
+
+    assert list(cache._invalidated) == ["profile:b", "profile:c"]
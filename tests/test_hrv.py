@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from hrv import compute_features, fold_baseline, ppg_to_rr
+
+
+def modulated_rr(frequency: float, amplitude: float = 40.0, beats: int = 300) -> np.ndarray:
+    """RR intervals around 1000 ms modulated by a sinusoid at `frequency` Hz"""
+    rr, elapsed = [], 0.0
+    for _ in range(beats):
+        interval = 1000.0 + amplitude * np.sin(2 * np.pi * frequency * elapsed)
+        rr.append(interval)
+        elapsed += interval / 1000.0
+    return np.array(rr)
+
+
+def test_time_domain_known_answers():
+    # Successive differences 10, 60, -10, 40; mean 848
+    features = compute_features([800, 810, 870, 860, 900], window_beats=64, min_beats=2)
+
+    assert features["rmssd"][0] == pytest.approx(np.sqrt(1350.0))
+    assert features["sdnn"][0] == pytest.approx(np.sqrt(7080.0 / 4))
+    assert features["pnn50"][0] == pytest.approx(25.0)
+    assert features["mean_hr"][0] == pytest.approx(60000.0 / 848)
+    assert features["beats"].tolist() == [5]
+    assert features["duration_ms"].tolist() == [4240]
+
+
+def test_alternating_series():
+    features = compute_features([800, 860] * 8, window_beats=64, min_beats=2)
+
+    assert features["rmssd"][0] == pytest.approx(60.0)
+    assert features["sdnn"][0] == pytest.approx(np.sqrt(16 * 900 / 15))
+    assert features["pnn50"][0] == pytest.approx(100.0)
+
+
+def test_constant_series():
+    features = compute_features([1000] * 32, window_beats=64, min_beats=2)
+
+    assert features["rmssd"][0] == 0
+    assert features["sdnn"][0] == 0
+    assert features["pnn50"][0] == 0
+    assert features["mean_hr"][0] == pytest.approx(60.0)
+    assert features["lf"][0] == pytest.approx(0.0, abs=1e-9)
+    assert features["lf_hf"][0] == 0
+
+
+def test_lf_modulation():
+    features = compute_features(modulated_rr(0.1), window_beats=300, min_beats=16)
+
+    # A sinusoid of amplitude A has power A²/2
+    assert features["lf"][0] == pytest.approx(40.0 ** 2 / 2, rel=0.15)
+    assert features["hf"][0] < 0.01 * features["lf"][0]
+    assert features["lf_hf"][0] > 100
+
+
+def test_hf_modulation():
+    features = compute_features(modulated_rr(0.25), window_beats=300, min_beats=16)
+
+    assert features["hf"][0] > 100
+    assert features["lf"][0] < 0.01 * features["hf"][0]
+    assert features["lf_hf"][0] < 0.01
+
+
+def test_windows_and_artefacts():
+    rr = [800.0] * 40 + [150.0, 2500.0] + [900.0] * 30
+
+    features = compute_features(rr, window_beats=32, min_beats=16)
+
+    # Artefacts dropped, leaving 70 beats: windows of 32, 32 and a short 6 that is skipped
+    assert features["beats"].tolist() == [32, 32]
+    assert features["mean_hr"].tolist() == pytest.approx([60000.0 / 800, 60000.0 / (8 * 800 + 24 * 900) * 32])
+
+
+def test_too_few_beats():
+    assert compute_features([800.0] * 10, window_beats=64, min_beats=16) is None
+    assert compute_features([100.0] * 64, window_beats=64, min_beats=16) is None
+
+
+def test_fold_baseline():
+    first = fold_baseline(None, {"rmssd": np.array([40.0]), "sdnn": np.array([30.0]), "lf_hf": np.array([1.0])}, 0.1)
+    assert first["rmssd"] == {"mean": 40.0, "var": 0.0}
+
+    steady = fold_baseline(first, {name: np.full(50, value) for name, value in
+                                   (("rmssd", 40.0), ("sdnn", 30.0), ("lf_hf", 1.0))}, 0.1)
+    assert steady["rmssd"] == {"mean": 40.0, "var": 0.0}
+    assert first["rmssd"] == {"mean": 40.0, "var": 0.0}  # input left untouched
+
+    # A sustained change pulls the mean most of the way within ~2/alpha windows
+    shifted = fold_baseline(steady, {name: np.full(20, 2 * value) for name, value in
+                                     (("rmssd", 40.0), ("sdnn", 30.0), ("lf_hf", 1.0))}, 0.1)
+    assert shifted["rmssd"]["mean"] == pytest.approx(80.0 - 40.0 * 0.9 ** 20)
+    assert shifted["rmssd"]["var"] > 0
+
+
+def test_ppg_to_rr():
+    sample_rate = 100
+    t = np.arange(0, 30, 1 / sample_rate)
+    ppg = np.sin(2 * np.pi * 1.25 * t)  # 75 bpm
+
+    rr = ppg_to_rr(ppg, sample_rate)
+
+    assert len(rr) == pytest.approx(36, abs=1)
+    assert rr == pytest.approx(np.full(len(rr), 800.0), abs=10)
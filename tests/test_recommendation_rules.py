@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from recommendation_rules import RuleEngine, load_rule_engine
+
+BASELINE = {
+    "age": 40,
+    "pain_level": 4,
+    "emg_rms": 30.0,
+    "heart_rate": 70,
+    "hrv": 40.0,
+    "eda_peaks": 5,
+    "temperature": 36.6,
+    "recovery_score": 60,
+}
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return load_rule_engine()
+
+
+@pytest.mark.parametrize("changes, conclusive, reasons, rules", [
+    # conclusive
+    ({}, True, [], ["default_stretching"]),
+    ({"emg_rms": 70.0}, True, [], ["high_emg", "default_stretching"]),
+    ({"heart_rate": 95}, True, [], ["high_heart_rate", "default_stretching"]),
+    ({"temperature": 38.2}, True, [], ["high_temperature", "default_stretching"]),
+    # escalate
+    ({"pain_level": 9}, False, ["escalate_rule"], ["severe_pain", "default_stretching"]),
+    ({"emg_rms": 70.0, "temperature": 38.2}, False, ["complex"], ["high_emg", "high_temperature", "default_stretching"]),
+    ({"age": 90}, False, ["out_of_range"], ["default_stretching"]),
+    # borderline: within the configured margin of a threshold, on either side
+    ({"emg_rms": 61.0}, False, ["borderline"], ["high_emg", "default_stretching"]),
+    ({"emg_rms": 58.0}, False, ["borderline"], ["default_stretching"]),
+    ({"heart_rate": 91}, False, ["borderline"], ["high_heart_rate", "default_stretching"]),
+    ({"temperature": 37.45}, False, ["borderline"], ["default_stretching"]),
+    # missing fields
+    ({"heart_rate": None}, False, ["missing"], ["default_stretching"]),
+    ({"hrv": None}, True, [], ["default_stretching"]),  # no rule reads it
+    ({"emg_rms": "n/a"}, False, ["missing"], ["default_stretching"]),
+])
+def test_decisions(engine, changes, conclusive, reasons, rules):
+    decision = engine.evaluate({**BASELINE, **changes})
+
+    assert decision.conclusive is conclusive
+    assert decision.reasons == reasons
+    assert decision.response["rules"] == rules
+
+
+def test_missing_feature_nobody_reads_is_conclusive():
+    engine = RuleEngine({
+        "features": ["emg_rms", "age"],
+        "rules": [{"id": "high_emg", "when": {"emg_rms": {"gt": 60}}, "recommendation": {"priority": "high"}}],
+    })
+
+    assert engine.evaluate({"emg_rms": 70}).conclusive
+    assert not engine.evaluate({"age": 40}).conclusive
+
+
+def test_dropped_key_is_missing(engine):
+    user_data = dict(BASELINE)
+    del user_data["pain_level"]
+
+    assert engine.evaluate(user_data).reasons == ["missing"]
+
+
+def test_render(engine):
+    response = engine.evaluate({**BASELINE, "emg_rms": 70.0, "temperature": 38.2}, source="fallback").response
+
+    assert response["source"] == "fallback"
+    assert [item["id"] for item in response["recommendations"]] == [1, 2, 3]
+    assert [item["priority"] for item in response["recommendations"]] == ["high", "high", "medium"]
+    assert response["alerts"] == ["Nhiệt độ vùng đau cao hơn bình thường"]
+    assert "60/100" in response["summary"]
+
+
+def test_summary_placeholder_without_value(engine):
+    user_data = dict(BASELINE)
+    del user_data["recovery_score"]
+
+    assert "?/100" in engine.evaluate(user_data).response["summary"]
+
+
+def test_batch_matches_single_evaluations(engine):
+    states = [
+        {**BASELINE},
+        {**BASELINE, "pain_level": 9},
+        {**BASELINE, "emg_rms": 61.0},
+        {**BASELINE, "heart_rate": None},
+    ]
+    batch = engine.evaluate_batch(np.stack([engine.vector(state) for state in states]))
+
+    for row, state in enumerate(states):
+        decision = engine.evaluate(state)
+        assert bool(batch.conclusive[row]) is decision.conclusive
+        assert [reason for reason, flags in batch.reasons.items() if flags[row]] == decision.reasons
+
+
+@pytest.mark.parametrize("rule, message", [
+    ({"id": "bad", "when": {"weight": {"gt": 1}}}, "unknown feature"),
+    ({"id": "bad", "when": {"emg_rms": {"between": 1}}}, "unknown operator"),
+])
+def test_invalid_rules(rule, message):
+    with pytest.raises(ValueError, match=message):
+        RuleEngine({"features": ["emg_rms"], "rules": [rule]})
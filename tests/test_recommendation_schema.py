@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from recommendation_schema import IncrementalJSONScanner, RecommendationResponse, parse_item, parse_response, strip_fences
+
+
+def item(id: int, **changes) -> dict:
+    return {
+        "id": id,
+        "type": "therapy",
+        "priority": "medium",
+        "title": f"Khuyến nghị {id}",
+        "description": "Mô tả {có dấu ngoặc} và \"trích dẫn\"",
+        "actionType": "guide",
+        "actionText": "Xem",
+        "rationale": "Lý do",
+        **changes,
+    }
+
+
+def document(*items, summary="Tóm tắt", alerts=("Cảnh báo",)) -> str:
+    return json.dumps({"recommendations": list(items), "summary": summary, "alerts": list(alerts)}, ensure_ascii=False)
+
+
+def test_valid_document():
+    parsed, repaired = parse_response(document(item(1), item(2)))
+
+    assert not repaired
+    assert [recommendation.id for recommendation in parsed.recommendations] == [1, 2]
+    assert parsed.summary == "Tóm tắt"
+    assert parsed.alerts == ["Cảnh báo"]
+
+
+@pytest.mark.parametrize("text", [
+    "```json\n{}\n```",
+    "```\n{}\n```",
+    "  ```json\n{}```  ",
+])
+def test_fenced_document(text):
+    parsed, repaired = parse_response(text.replace("{}", document(item(1))))
+
+    assert not repaired
+    assert parsed.recommendations[0].id == 1
+
+
+def test_strip_fences_leaves_plain_text():
+    assert strip_fences(' {"a": 1} ') == '{"a": 1}'
+
+
+def test_truncated_inside_second_item():
+    text = document(item(1), item(2))
+    cut = text.index('"id": 2') + 12
+
+    parsed, repaired = parse_response(text[:cut])
+
+    assert repaired
+    assert [recommendation.id for recommendation in parsed.recommendations] == [1]
+    assert parsed.summary == ""
+    assert parsed.alerts == []
+
+
+def test_truncated_inside_summary():
+    text = document(item(1), item(2), summary="Một bản tóm tắt dài")
+    cut = text.index("bản tóm")
+
+    parsed, repaired = parse_response(text[:cut])
+
+    assert repaired
+    assert len(parsed.recommendations) == 2
+    assert parsed.summary == ""
+
+
+def test_truncated_inside_alerts():
+    text = document(item(1), alerts=("Một", "Hai"))
+    cut = text.index('"Hai') + 2
+
+    parsed, repaired = parse_response(text[:cut])
+
+    assert repaired
+    assert parsed.alerts == ["Một"]
+
+
+def test_truncated_drops_invalid_items():
+    text = document(item(1, type="surgery"), item(2), item(3))
+    cut = text.index('"id": 3') + 5
+
+    parsed, repaired = parse_response(text[:cut])
+
+    assert repaired
+    assert [recommendation.id for recommendation in parsed.recommendations] == [2]
+
+
+@pytest.mark.parametrize("text", [
+    # Complete but invalid: nothing to repair
+    document(item(1, priority="urgent")),
+    document(),
+    json.dumps({"summary": "no recommendations"}),
+    # Truncated before any item completed
+    document(item(1))[:40],
+    # Not JSON at all
+    "Xin lỗi, tôi không thể trả lời.",
+    "",
+])
+def test_unusable(text):
+    with pytest.raises(ValueError):
+        parse_response(text)
+
+
+def test_schema_rejects_missing_field():
+    invalid = item(1)
+    del invalid["rationale"]
+
+    with pytest.raises(ValueError):
+        RecommendationResponse.model_validate({"recommendations": [invalid]})
+
+
+def test_parse_item():
+    assert parse_item(json.dumps(item(1)))["id"] == 1
+    assert parse_item(json.dumps(item(1, actionType="video"))) is None
+    assert parse_item('{"id": 1,') is None
+
+
+def test_scanner_emits_items_as_they_complete():
+    text = document(item(1), item(2))
+    scanner = IncrementalJSONScanner()
+    emitted = []
+
+    for position, char in enumerate(text):
+        for raw in scanner.feed(char):
+            emitted.append((position, json.loads(raw)["id"]))
+
+    # Each item is emitted on its own closing brace, even with braces and quotes inside strings
+    closing = [text.index('"rationale": "Lý do"}', start) + len('"rationale": "Lý do"') for start in (0, text.index('"id": 2'))]
+    assert emitted == [(closing[0], 1), (closing[1], 2)]
+    assert scanner.complete
+    assert scanner.text == text
+
+
+def test_scanner_chunking_does_not_matter():
+    text = document(item(1), item(2), item(3))
+    whole = list(IncrementalJSONScanner().feed(text))
+
+    scanner = IncrementalJSONScanner()
+    chunked = [raw for start in range(0, len(text), 7) for raw in scanner.feed(text[start:start + 7])]
+
+    assert chunked == whole
+    assert len(whole) == 3
+
+
+def test_scanner_ignores_objects_outside_the_array():
+    text = json.dumps({"meta": [{"id": 9}], "recommendations": [item(1)], "extra": {"nested": [{"id": 8}]}})
+
+    assert [json.loads(raw)["id"] for raw in IncrementalJSONScanner().feed(text)] == [1]
+
+
+def test_scanner_repair_closes_open_containers():
+    scanner = IncrementalJSONScanner()
+    list(scanner.feed('{"recommendations": [{"id": 1}, {"id": 2, "ti'))
+
+    # Cut back to the last complete value; parse_response keeps only complete items
+    assert not scanner.complete
+    assert json.loads(scanner.repaired()) == {"recommendations": [{"id": 1}, {"id": 2}]}
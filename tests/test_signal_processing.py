@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from signal_processing import EMGProcessor, process_windows, to_windows
+
+SAMPLE_RATE = 1000
+
+
+def bursts(starts, length: int = 100, amplitude: float = 50.0, samples: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """Low-level noise with square 100 Hz bursts starting at the given samples"""
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(0.0, 1.0, samples)
+    carrier = amplitude * np.sign(np.sin(2 * np.pi * 100 * np.arange(length) / SAMPLE_RATE + 0.1))
+    for start in starts:
+        signal[start:start + length] += carrier
+    return signal
+
+
+def test_rms_known_answers():
+    t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+    windows = np.stack([
+        30.0 * np.sin(2 * np.pi * 50 * t) + 100.0,  # DC offset is removed first
+        np.where(np.arange(SAMPLE_RATE) % 2, 20.0, -20.0),
+        np.full(SAMPLE_RATE, 7.0),
+    ])
+
+    features = EMGProcessor(sample_rate=SAMPLE_RATE).process(windows)
+
+    assert features.rms == pytest.approx([30.0 / np.sqrt(2), 20.0, 0.0])
+
+
+def test_envelope_of_constant_amplitude():
+    square = np.where(np.arange(SAMPLE_RATE) % 2, 20.0, -20.0)
+
+    features = EMGProcessor(sample_rate=SAMPLE_RATE).process(square[None, :])
+
+    assert features.envelope_max[0] == pytest.approx(20.0)
+
+
+@pytest.mark.parametrize("starts", [[], [200], [150, 600], [100, 400, 750]])
+def test_peak_count(starts):
+    features = EMGProcessor(sample_rate=SAMPLE_RATE).process(bursts(starts)[None, :])
+
+    assert features.peak_count[0] == len(starts)
+    assert bool(features.peak[0]) is bool(starts)
+
+
+def test_threshold_floor():
+    quiet = np.random.default_rng(1).normal(0.0, 1.0, SAMPLE_RATE)
+
+    features = EMGProcessor(sample_rate=SAMPLE_RATE, threshold_floor=25.0).process(quiet[None, :])
+
+    assert features.threshold[0] == 25.0
+    assert features.peak_count[0] == 0
+
+
+def test_windows_are_independent():
+    windows = np.stack([bursts([300], seed=seed) for seed in range(3)] + [bursts([], seed=3)])
+    processor = EMGProcessor(sample_rate=SAMPLE_RATE)
+
+    batch = processor.process(windows)
+
+    for row, window in enumerate(windows):
+        single = EMGProcessor(sample_rate=SAMPLE_RATE).process(window[None, :])
+        assert batch.rms[row] == pytest.approx(single.rms[0])
+        assert batch.peak_count[row] == single.peak_count[0]
+    assert batch.peak_count.tolist() == [1, 1, 1, 0]
+
+
+def test_scratch_buffers_do_not_leak_between_calls():
+    processor = EMGProcessor(sample_rate=SAMPLE_RATE)
+    loud = processor.process(bursts([100, 500])[None, :])
+    quiet = processor.process(bursts([])[None, :])
+    wider = processor.process(np.stack([bursts([100, 500])] * 2))
+
+    # Earlier results are not views into the reused buffers
+    assert loud.peak_count[0] == 2
+    assert quiet.peak_count[0] == 0
+    assert wider.peak_count.tolist() == [2, 2]
+
+
+@pytest.mark.parametrize("windows", [np.zeros(10), np.zeros((2, 0))])
+def test_invalid_shape(windows):
+    with pytest.raises(ValueError):
+        EMGProcessor().process(windows)
+
+
+def test_to_windows_drops_partial_window():
+    windows = to_windows(np.arange(2500), SAMPLE_RATE)
+
+    assert windows.shape == (2, SAMPLE_RATE)
+    assert windows[1, 0] == SAMPLE_RATE
+
+
+def test_process_windows_matches_processor():
+    windows = np.stack([bursts([200]), bursts([])])
+
+    features = process_windows(windows, SAMPLE_RATE)
+
+    assert features.peak_count.tolist() == [1, 0]
+    assert features.rms == pytest.approx(EMGProcessor(sample_rate=SAMPLE_RATE).process(windows).rms)
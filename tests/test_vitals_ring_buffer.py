@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from vitals_ring_buffer import VitalsRing, VitalsRingBuffers
+
+START = datetime(2026, 1, 1)
+
+
+def reading(index: int, user_id: str = "u", **fields) -> dict:
+    doc = {
+        "user_id": user_id,
+        "_id": ObjectId(),
+        "timestamp": START + timedelta(seconds=index),
+        "emg_rms": float(index),
+        "heart_rate": 60 + index,
+        "hrv": 40.0,
+        "eda_peaks": index,
+        "temperature": 36.5,
+    }
+    doc.update(fields)
+    return doc
+
+
+class FakeStore:
+    """recent() over an in-memory list; `gate`, when set, holds the query open"""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.gate = None
+        self.queries = 0
+
+    async def recent(self, user_id: str, limit: int):
+        self.queries += 1
+        result = sorted((doc for doc in self.docs if doc["user_id"] == user_id),
+                        key=lambda doc: doc["timestamp"], reverse=True)[:limit]
+        if self.gate is not None:
+            await self.gate.wait()
+        return result
+
+
+def test_wraparound_keeps_newest_in_order():
+    ring = VitalsRing(4)
+    docs = [reading(i) for i in range(7)]
+    ring.extend(docs[:3])
+    ring.extend(docs[3:])
+
+    assert ring.size == 4 and ring.head == 3
+    records = ring.records("u", 10)
+    assert [record["emg_rms"] for record in records] == [6.0, 5.0, 4.0, 3.0]
+    assert [record["_id"] for record in records] == [doc["_id"] for doc in reversed(docs[3:])]
+    assert ring.columnar(2)["heart_rate"] == [65, 66]
+
+
+def test_extend_longer_than_capacity():
+    ring = VitalsRing(3)
+    ring.extend([reading(i) for i in range(5)])
+
+    assert [record["eda_peaks"] for record in ring.records("u", 3)] == [4, 3, 2]
+
+
+def test_ids_with_trailing_and_all_zero_bytes_round_trip():
+    ids = [ObjectId(b"\x65" * 11 + b"\x00"), ObjectId(b"\x00" * 12), ObjectId(b"\x00" * 11 + b"\x01")]
+    ring = VitalsRing(4)
+    ring.extend([reading(i, _id=object_id) for i, object_id in enumerate(ids)])
+
+    assert [record["_id"] for record in ring.records("u", 3)] == list(reversed(ids))
+
+
+def test_readings_without_id():
+    doc = reading(0)
+    del doc["_id"]
+    ring = VitalsRing(2)
+    ring.extend([doc, reading(1)])
+
+    records = ring.records("u", 2)
+    assert "_id" in records[0] and "_id" not in records[1]
+
+
+def test_append_during_warm_up_is_not_kept():
+    async def scenario():
+        store = FakeStore([reading(i) for i in range(3)])
+        store.gate = asyncio.Event()
+        buffers = VitalsRingBuffers(store, capacity=8)
+        warming = asyncio.create_task(buffers.recent("u", 8))
+        await asyncio.sleep(0)
+        # Stored and appended while the warm-up query is still out
+        late = reading(3)
+        store.docs.append(late)
+        buffers.append([late])
+        store.gate.set()
+        first = await warming
+        store.gate = None
+        second = await buffers.recent("u", 8)
+        return first, second, buffers.stats(), store.queries
+
+    first, second, stats, queries = asyncio.run(scenario())
+    assert len(first) == 3
+    assert [record["emg_rms"] for record in second] == [3.0, 2.0, 1.0, 0.0]
+    assert stats["warms"] == 2 and queries == 2
+
+
+def test_append_extends_resident_ring_and_out_of_order_drops_it():
+    async def scenario():
+        store = FakeStore([reading(i) for i in range(3)])
+        buffers = VitalsRingBuffers(store, capacity=8)
+        await buffers.recent("u", 8)
+        buffers.append([reading(4), reading(3)])
+        extended = await buffers.recent("u", 2)
+        buffers.append([reading(2)])
+        return extended, buffers.stats()
+
+    extended, stats = asyncio.run(scenario())
+    assert [record["emg_rms"] for record in extended] == [4.0, 3.0]
+    assert stats["users"] == 0 and stats["dropped"] == 1
@@ -0,0 +1,127 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import vitals_wire
+from vitals_wire import WireFormatError, decode, encode, to_documents
+
+TIMESTAMPS_MS = np.array([1_700_000_000_000, 1_700_000_001_000, 1_700_000_001_250, 1_700_000_060_000])
+COLUMNS = {
+    "emg_rms": np.array([12.34, 45.6, 0.0, 149.99]),
+    "hrv": np.array([28.5, 31.25, 40.0, 5.5]),
+    "temperature": np.array([36.6, 36.75, 37.5, 38.2]),
+    "heart_rate": np.array([72, 80, 65, 119]),
+    "eda_peaks": np.array([12, 0, 3, 60]),
+}
+
+
+def frame(user_id: str = "user-1") -> bytes:
+    return encode(user_id, TIMESTAMPS_MS, COLUMNS)
+
+
+def header(body: bytes, **fields) -> bytes:
+    """Rewrite header fields of an encoded frame"""
+    values = dict(zip(("magic", "version", "flags", "count", "user_id_length", "base_ms"), vitals_wire.HEADER.unpack_from(body)))
+    values.update(fields)
+    return vitals_wire.HEADER.pack(*values.values()) + body[vitals_wire.HEADER.size:]
+
+
+def test_round_trip():
+    decoded = decode(frame())
+
+    assert decoded.user_id == "user-1"
+    assert decoded.timestamps.astype("datetime64[ms]").astype(np.int64).tolist() == TIMESTAMPS_MS.tolist()
+    for name, values in COLUMNS.items():
+        assert decoded.columns[name] == pytest.approx(values, abs=1e-4)
+
+
+@pytest.mark.parametrize("user_id", ["u", "user-12", "user-123", "người-dùng-ü"])
+def test_user_id_padding(user_id):
+    body = frame(user_id)
+
+    assert len(body) == vitals_wire.frame_size(len(user_id.encode()), len(TIMESTAMPS_MS))
+    assert decode(body).user_id == user_id
+
+
+def test_columns_are_aligned_views():
+    body = frame("odd-length-id")
+    decoded = decode(body)
+
+    for column in decoded.columns.values():
+        assert column.ctypes.data % column.dtype.itemsize == 0
+        assert not column.flags.owndata
+
+
+def test_to_documents():
+    documents, rejected = to_documents(decode(frame()))
+
+    assert rejected == {}
+    assert documents[0] == {
+        "user_id": "user-1",
+        "emg_rms": 12.34,
+        "heart_rate": 72,
+        "hrv": 28.5,
+        "eda_peaks": 12,
+        "temperature": 36.6,
+        "timestamp": datetime(2023, 11, 14, 22, 13, 20),
+    }
+    assert [document["timestamp"].microsecond for document in documents] == [0, 0, 250000, 0]
+    assert all(type(document["heart_rate"]) is int for document in documents)
+
+
+def test_non_finite_readings_rejected_individually():
+    columns = {**COLUMNS, "hrv": np.array([28.5, np.nan, 40.0, np.inf])}
+
+    documents, rejected = to_documents(decode(encode("user-1", TIMESTAMPS_MS, columns)))
+
+    assert rejected == {1: "Non-finite measurement", 3: "Non-finite measurement"}
+    assert [document["emg_rms"] for document in documents] == [12.34, 0.0]
+
+
+@pytest.mark.parametrize("timestamps", [[], [2_000, 1_000], [0, 2 ** 32]])
+def test_encode_rejects(timestamps):
+    with pytest.raises(WireFormatError):
+        encode("user-1", np.array(timestamps, dtype=np.int64), {name: values[:len(timestamps)] for name, values in COLUMNS.items()})
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda body: body[:10], "shorter than its header"),
+    (lambda body: header(body, magic=b"XX"), "Not a vitals frame"),
+    (lambda body: header(body, version=2), "Unsupported frame version 2"),
+    (lambda body: header(body, base_ms=-1), "outside"),
+    (lambda body: header(body, base_ms=vitals_wire.MAX_MS - 1_000), "outside"),
+    (lambda body: header(body, user_id_length=0, count=4)[:vitals_wire.HEADER.size] + body[vitals_wire.HEADER.size + 8:], "no user id"),
+])
+def test_malformed_header(mutate, message):
+    with pytest.raises(WireFormatError, match=message):
+        decode(mutate(frame()))
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda body: body[:-1],
+    lambda body: body + b"\0",
+    lambda body: body[:-2 * len(TIMESTAMPS_MS)],  # a column missing
+    lambda body: body + bytes(2 * len(TIMESTAMPS_MS)),  # an extra column
+])
+def test_wrong_length(mutate):
+    with pytest.raises(WireFormatError, match="bytes, expected"):
+        decode(mutate(frame()))
+
+
+@pytest.mark.parametrize("count", [3, 5, 0])
+def test_count_does_not_match_columns(count):
+    with pytest.raises(WireFormatError, match="bytes, expected"):
+        decode(header(frame(), count=count))
+
+
+def test_malformed_user_id():
+    body = bytearray(frame("user-1"))
+    body[vitals_wire.HEADER.size] = 0xFF
+
+    with pytest.raises(WireFormatError, match="Malformed user id"):
+        decode(bytes(body))
+
+
+def test_header_is_padded_to_eight_bytes():
+    assert vitals_wire.HEADER.size == 24